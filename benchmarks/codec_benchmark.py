@@ -0,0 +1,190 @@
+"""
+Size and speed of the canonical codec compared to pickle, and the size of a
+signed message on the wire before (object plus hex signed pickle) and after
+(signed envelope).
+
+    python -m benchmarks.codec_benchmark [--block-size N] [--iterations N] [--json]
+"""
+
+import argparse
+import json
+import pickle
+import timeit
+import uuid
+from typing import Any, Dict, List, Tuple
+
+from modules.codec.codec import decode, encode
+from modules.codec.envelope import AUTHOR_FIELDS, open_envelope, seal
+from modules.objects import (
+    Block,
+    EnvelopeKind,
+    Hasher,
+    LedgerCommitInfo,
+    ProposalMessage,
+    QuorumCertificate,
+    Signatures,
+    SignatureSet,
+    TimeoutCertificate,
+    TimeoutInfo,
+    TimeoutMessage,
+    Transaction,
+    VoteInfo,
+    VoteMsg,
+)
+
+ENVELOPE_KINDS = {
+    "Transaction": EnvelopeKind.TRANSACTION,
+    "ProposalMessage": EnvelopeKind.PROPOSAL,
+    "VoteMsg": EnvelopeKind.VOTE,
+    "TimeoutMessage": EnvelopeKind.TIMEOUT,
+}
+
+
+def envelope_header(name: str, message: Any) -> Tuple[int, int]:
+    """
+
+    Args:
+        name: Message type, a key of make_messages.
+        message:
+
+    Returns:
+        The kind and signer to seal message with, its author signs it.
+    """
+    kind = ENVELOPE_KINDS[name]
+    return kind, getattr(message, AUTHOR_FIELDS[kind])
+
+
+def make_messages(block_size: int) -> Dict[str, Any]:
+    """
+
+    Args:
+        block_size: Number of transactions in the proposed block.
+
+    Returns:
+        One representative object per message type.
+    """
+    signing_key, _ = Signatures.init_signatures()
+    vote_info = VoteInfo(
+        Hasher.digest("b1"), 7, Hasher.digest("b0"), 6, Hasher.digest("s1")
+    )
+    ledger_commit_info = LedgerCommitInfo(Hasher.digest("s0"), vote_info.digest())
+    signatures = SignatureSet(4)
+    for i in range(3):
+        signatures.add(i, Signatures.sign_detached(str(i).encode("utf-8"), signing_key))
+    qc = QuorumCertificate(vote_info, ledger_commit_info, signatures, 1, "")
+    transactions = [
+        Transaction("command-{}".format(i), uuid.uuid4().hex, i % 10)
+        for i in range(block_size)
+    ]
+    block = Block(2, 8, transactions, qc, Hasher.digest("b2"))
+    tc = TimeoutCertificate(8, [7, 7, 6], signatures)
+    timeout_info = TimeoutInfo(9, qc, 3, signatures.get(0))
+    return {
+        "Transaction": transactions[0],
+        "VoteMsg": VoteMsg(vote_info, ledger_commit_info, qc, 3, None),
+        "TimeoutMessage": TimeoutMessage(timeout_info, tc, qc, 3),
+        "ProposalMessage": ProposalMessage(
+            block, tc, qc, None, 2, [trx.id for trx in transactions]
+        ),
+    }
+
+
+def run(block_size: int, iterations: int) -> List[Dict[str, Any]]:
+    """
+
+    Args:
+        block_size:
+        iterations: Encodes and decodes timed per message type and format.
+
+    Returns:
+        One result row per message type.
+    """
+    signing_key, verify_key = Signatures.init_signatures()
+    rows = []
+    for name, message in make_messages(block_size).items():
+        pickled = pickle.dumps(message)
+        encoded = encode(message)
+        assert encode(decode(encoded)) == encoded
+        # Previously the live object was sent next to its hex signed pickle
+        legacy_wire = pickle.dumps(
+            (message, Signatures.pickle_and_sign_payload(message, signing_key))
+        )
+        kind, signer = envelope_header(name, message)
+        envelope = seal(kind, signer, message, signing_key)
+        assert encode(open_envelope(envelope, verify_key)) == encoded
+        rows.append(
+            {
+                "message": name,
+                "pickle_bytes": len(pickled),
+                "codec_bytes": len(encoded),
+                "legacy_wire_bytes": len(legacy_wire),
+                "envelope_bytes": len(envelope),
+                "pickle_encode_us": timeit.timeit(
+                    lambda: pickle.dumps(message), number=iterations
+                )
+                / iterations
+                * 1e6,
+                "codec_encode_us": timeit.timeit(
+                    lambda: encode(message), number=iterations
+                )
+                / iterations
+                * 1e6,
+                "pickle_decode_us": timeit.timeit(
+                    lambda: pickle.loads(pickled), number=iterations
+                )
+                / iterations
+                * 1e6,
+                "codec_decode_us": timeit.timeit(
+                    lambda: decode(encoded), number=iterations
+                )
+                / iterations
+                * 1e6,
+            }
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--block-size", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--json", action="store_true", help="print JSON rows")
+    args = parser.parse_args()
+
+    rows = run(args.block_size, args.iterations)
+    if args.json:
+        print(json.dumps(rows, indent=4))
+        return
+
+    print(
+        "{:<16} {:>8} {:>8} {:>10} {:>10} {:>10} {:>10} {:>9} {:>9}".format(
+            "message",
+            "pickle B",
+            "codec B",
+            "pkl enc",
+            "cdc enc",
+            "pkl dec",
+            "cdc dec",
+            "legacy B",
+            "signed B",
+        )
+    )
+    for row in rows:
+        print(
+            "{:<16} {:>8} {:>8} {:>8.1f}us {:>8.1f}us {:>8.1f}us {:>8.1f}us "
+            "{:>9} {:>9}".format(
+                row["message"],
+                row["pickle_bytes"],
+                row["codec_bytes"],
+                row["pickle_encode_us"],
+                row["codec_encode_us"],
+                row["pickle_decode_us"],
+                row["codec_decode_us"],
+                row["legacy_wire_bytes"],
+                row["envelope_bytes"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,615 @@
+"""
+Microbenchmarks of the consensus hot paths, with a regression check against a
+saved baseline.
+
+Every case reports the best mean time per operation over several repeats, in
+microseconds:
+
+- signatures: Signatures.pickle_and_sign_payload, seal_payload and
+  verify_signed_payload by message type and proposal block size;
+- mempool: Main.get_transactions against the mempool depth;
+- pending_block_tree: PendingBlockTree.find and prune against the tree size;
+- ledger: Ledger.commit and get_committed_block against the ledger length;
+- block_tree: BlockTree.process_vote over a quorum of votes against n.
+
+Save a baseline once, then compare later runs to it. The comparison exits
+with status 1 if any case got slower than the baseline by more than the
+threshold:
+
+    python -m benchmarks.microbenchmarks --output baseline.json
+    python -m benchmarks.microbenchmarks --baseline baseline.json [--threshold 0.25]
+
+    python -m benchmarks.microbenchmarks [--filter TEXT] [--quick]
+        [--min-time S] [--repeat N] [--json]
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from benchmarks.codec_benchmark import envelope_header, make_messages
+from modules.block_tree.block_tree import BlockTree
+from modules.block_tree.pending_block_tree import PendingBlockTree
+from modules.leaderelection.leaderelection import LeaderElection
+from modules.ledger.ledger import Ledger
+from modules.ledger.ledger_writer import NullLedgerWriter
+from modules.main.main import Main
+from modules.mempool.mempool import MemPool
+from modules.objects import (
+    Block,
+    Hasher,
+    LedgerCommitInfo,
+    QuorumCertificate,
+    Signatures,
+    SignatureSet,
+    Transaction,
+    VoteInfo,
+    VoteMsg,
+)
+from modules.pacemaker.pacemaker import Pacemaker
+from modules.safety.safety import Safety
+
+# (full, quick) parameter values of every group
+BLOCK_SIZES = ([1, 16, 256], [1, 16])
+MEMPOOL_DEPTHS = ([10, 1000, 100000], [10, 1000])
+TREE_SIZES = ([16, 256, 4096], [16, 256])
+LEDGER_LENGTHS = ([100, 1000, 10000], [100, 1000])
+VALIDATORS = ([4, 16, 64, 100], [4, 16])
+
+
+class Case:
+    def __init__(
+        self, name: str, params: Dict[str, Any], measure: Callable[[], float]
+    ) -> None:
+        """
+
+        Args:
+            name: Unique id of the case, the key of the baseline.
+            params:
+            measure: Runs the case and returns microseconds per operation.
+        """
+        self.name = name
+        self.params = params
+        self.measure = measure
+
+
+class Timer:
+    def __init__(self, min_time: float, repeat: int) -> None:
+        """
+
+        Args:
+            min_time: Seconds every repeat runs for at least.
+            repeat: The best of this many repeats is reported.
+        """
+        self.min_time = min_time
+        self.repeat = repeat
+
+    def time(self, op: Callable[[], Any]) -> float:
+        """Time a side-effect free operation in batches.
+
+        Args:
+            op:
+
+        Returns:
+            Microseconds per call.
+        """
+        number = 1
+        while True:
+            elapsed = self._batch(op, number)
+            if elapsed >= self.min_time:
+                break
+            number *= 10 if elapsed < self.min_time / 10 else 2
+        best = elapsed / number
+        for _ in range(self.repeat - 1):
+            best = min(best, self._batch(op, number) / number)
+        return best * 1e6
+
+    @staticmethod
+    def _batch(op: Callable[[], Any], number: int) -> float:
+        started = time.perf_counter()
+        for _ in range(number):
+            op()
+        return time.perf_counter() - started
+
+    def time_with_setup(self, setup: Callable[[], Any], op: Callable[[Any], Any]):
+        """Time an operation that needs fresh state, one call at a time.
+
+        Args:
+            setup: Builds the argument of op, not timed.
+            op:
+
+        Returns:
+            Microseconds per call.
+        """
+        best = None
+        for _ in range(self.repeat):
+            elapsed = 0.0
+            calls = 0
+            while elapsed < self.min_time or calls < 3:
+                state = setup()
+                started = time.perf_counter()
+                op(state)
+                elapsed += time.perf_counter() - started
+                calls += 1
+            best = elapsed / calls if best is None else min(best, elapsed / calls)
+        return best * 1e6
+
+
+def make_main(validators: int, mempool: Optional[MemPool] = None) -> Main:
+    """
+
+    Args:
+        validators:
+        mempool:
+
+    Returns:
+        Validator 0 of a deployment of the given size, with a ledger kept in
+        memory only.
+    """
+    f = (validators - 1) // 3
+    keys = [Signatures.init_signatures() for _ in range(validators)]
+    ledger = Ledger(0, writer=NullLedgerWriter(), checkpoint_interval=0)
+    leader_election = LeaderElection(validators)
+    return Main(
+        BlockTree(ledger, f, 0),
+        leader_election,
+        Pacemaker(f, 0, leader_election, 0.5),
+        Safety(keys[0][0], dict(enumerate(keys)), 0),
+        ledger,
+        mempool if mempool is not None else MemPool(),
+        0,
+    )
+
+
+def make_transactions(count: int, rng: random.Random) -> List[Transaction]:
+    return [
+        Transaction(
+            "SET key{} {}".format(rng.randrange(1000), i),
+            "{:032x}".format(rng.getrandbits(128)),
+            i % 10,
+        )
+        for i in range(count)
+    ]
+
+
+def make_chain(
+    length: int, payload: Optional[int] = 0, rng: Optional[random.Random] = None
+) -> List[Block]:
+    """
+
+    Args:
+        length:
+        payload: Transactions per block.
+        rng:
+
+    Returns:
+        Blocks of consecutive rounds, each certifying the previous one.
+    """
+    rng = rng if rng else random.Random(0)
+    blocks = []
+    parent = None
+    for round in range(length):
+        blocks.append(make_block(round, parent, make_transactions(payload, rng)))
+        parent = blocks[-1]
+    return blocks
+
+
+def make_block(
+    round: int, parent: Optional[Block], payload: List[Transaction]
+) -> Block:
+    """
+
+    Args:
+        round:
+        parent: Block certified by the QC of the new block.
+        payload:
+
+    Returns:
+
+    """
+    qc = None
+    if parent is not None:
+        vote_info = VoteInfo(
+            parent.id,
+            parent.round,
+            parent.qc.vote_info.id if parent.qc else None,
+            parent.qc.vote_info.round if parent.qc else -1,
+            Hasher.digest("state", parent.id),
+        )
+        qc = QuorumCertificate(
+            vote_info,
+            LedgerCommitInfo(Hasher.digest("state", parent.id), vote_info.digest()),
+            SignatureSet(4),
+            round % 4,
+            "",
+        )
+    return Block(
+        round % 4,
+        round,
+        payload,
+        qc,
+        Hasher.digest("block", round, parent.id if parent else ""),
+    )
+
+
+def signature_cases(timer: Timer, block_sizes: List[int]) -> Iterator[Case]:
+    signing_key, verify_key = Signatures.init_signatures()
+    for block_size in block_sizes:
+        for message_type, message in make_messages(block_size).items():
+            # Only the proposal grows with the block
+            if message_type != "ProposalMessage" and block_size != block_sizes[0]:
+                continue
+            params = {"message": message_type}
+            suffix = message_type
+            if message_type == "ProposalMessage":
+                params["block_size"] = block_size
+                suffix += "/block_size={}".format(block_size)
+            kind, signer = envelope_header(message_type, message)
+            envelope = Signatures.seal_payload(kind, signer, message, signing_key)
+
+            yield Case(
+                "signatures/pickle_and_sign_payload/" + suffix,
+                params,
+                lambda message=message: timer.time(
+                    lambda: Signatures.pickle_and_sign_payload(message, signing_key)
+                ),
+            )
+            yield Case(
+                "signatures/seal_payload/" + suffix,
+                params,
+                lambda message=message, kind=kind, signer=signer: timer.time(
+                    lambda: Signatures.seal_payload(kind, signer, message, signing_key)
+                ),
+            )
+            yield Case(
+                "signatures/verify_signed_payload/" + suffix,
+                params,
+                lambda envelope=envelope: timer.time(
+                    lambda: Signatures.verify_signed_payload(envelope, verify_key)
+                ),
+            )
+
+
+def mempool_cases(timer: Timer, depths: List[int]) -> Iterator[Case]:
+    for depth in depths:
+
+        def measure(depth=depth):
+            mempool = MemPool()
+            for transaction in make_transactions(depth, random.Random(depth)):
+                mempool.add(transaction)
+            main = make_main(4, mempool)
+
+            def refill():
+                # Back to the full depth before every call
+                mempool.release(list(mempool.in_flight))
+
+            return timer.time_with_setup(refill, lambda _: main.get_transactions())
+
+        yield Case(
+            "mempool/get_transactions/depth={}".format(depth),
+            {"depth": depth},
+            measure,
+        )
+
+
+def pending_block_tree_cases(timer: Timer, sizes: List[int]) -> Iterator[Case]:
+    for size in sizes:
+        chain = make_chain(size // 2)
+        # A competing block next to every block of the chain, all abandoned
+        # once the tip commits
+        forks = [
+            make_block(block.round + size, parent, [])
+            for parent, block in zip([None] + chain, chain)
+        ]
+
+        def build(chain=chain, forks=forks):
+            tree = PendingBlockTree()
+            for block, fork in zip(chain, forks):
+                tree.add(block)
+                tree.add(fork)
+            return tree
+
+        def measure_find(chain=chain, build=build):
+            tree = build()
+            ids = [block.id for block in chain]
+            rng = random.Random(0)
+            lookups = [rng.choice(ids) for _ in range(1024)]
+            return timer.time(lambda: [tree.find(i) for i in lookups]) / len(lookups)
+
+        def measure_prune(chain=chain, build=build):
+            # Commit the tip, the forks go
+            tip_id = chain[-1].id
+            return timer.time_with_setup(build, lambda tree: tree.prune(tip_id))
+
+        yield Case(
+            "pending_block_tree/find/size={}".format(size),
+            {"size": size},
+            measure_find,
+        )
+        yield Case(
+            "pending_block_tree/prune/size={}".format(size),
+            {"size": size},
+            measure_prune,
+        )
+
+
+class LedgerChain:
+    def __init__(self, length: int) -> None:
+        """Validator state with a ledger of the given length.
+
+        Args:
+            length: Committed blocks, each with one transaction.
+        """
+        self.main = make_main(4)
+        self.rng = random.Random(length)
+        self.tip: Optional[Block] = None
+        self.round = 0
+        self.ids: List[str] = []
+        for _ in range(length):
+            self.commit(self.insert())
+            self.ids.append(self.tip.id)
+
+    def insert(self) -> Block:
+        """Speculate a new block on top of the last one, like a proposal.
+
+        Returns:
+
+        """
+        self.tip = make_block(self.round, self.tip, make_transactions(1, self.rng))
+        self.round += 1
+        self.main.block_tree.execute_and_insert(self.tip)
+        return self.tip
+
+    def commit(self, block: Block) -> None:
+        self.main.ledger.commit(block.id, self.main.block_tree)
+        self.main.block_tree.pending_block_tree.prune(block.id)
+
+    def pop(self) -> None:
+        """Drop the last committed block from the ledger, to keep its length.
+
+        Returns:
+
+        """
+        ledger = self.main.ledger
+        committed = ledger.ledger.pop()
+        del ledger.block_heights[committed.block.id]
+        for trx in committed.block.payload:
+            ledger.transaction_heights.pop(trx.id, None)
+
+
+def ledger_cases(timer: Timer, lengths: List[int]) -> Iterator[Case]:
+    for length in lengths:
+
+        def measure_commit(length=length):
+            chain = LedgerChain(length)
+            popped = [False]
+
+            def setup():
+                # Undo the commit timed last, the ledger keeps its length
+                if popped[0]:
+                    chain.pop()
+                popped[0] = True
+                return chain.insert()
+
+            return timer.time_with_setup(setup, chain.commit)
+
+        def measure_get(length=length):
+            chain = LedgerChain(length)
+            get_committed_block = chain.main.ledger.get_committed_block
+            rng = random.Random(0)
+            lookups = [rng.choice(chain.ids) for _ in range(1024)]
+            return timer.time(lambda: [get_committed_block(i) for i in lookups]) / len(
+                lookups
+            )
+
+        yield Case(
+            "ledger/commit/length={}".format(length),
+            {"length": length},
+            measure_commit,
+        )
+        yield Case(
+            "ledger/get_committed_block/length={}".format(length),
+            {"length": length},
+            measure_get,
+        )
+
+
+def block_tree_cases(timer: Timer, validators: List[int]) -> Iterator[Case]:
+    for n in validators:
+
+        def measure(n=n):
+            f = (n - 1) // 3
+            block_tree = BlockTree(None, f, 0)
+            parent = make_block(0, None, [])
+            block_tree.pending_block_tree.add(parent)
+            signature = bytes(64)
+            rounds = iter(range(1, 1 << 30))
+
+            def setup():
+                block = make_block(next(rounds), parent, [])
+                block_tree.pending_block_tree.add(block)
+                vote_info = VoteInfo(block.id, block.round, parent.id, 0, block.id)
+                ledger_commit_info = LedgerCommitInfo(parent.id, vote_info.digest())
+                return [
+                    VoteMsg(vote_info, ledger_commit_info, None, sender, signature)
+                    for sender in range(2 * f + 1)
+                ]
+
+            def process_quorum(votes):
+                for vote in votes:
+                    qc = block_tree.process_vote(vote)[0]
+                assert qc is not None
+                block_tree.high_qc = qc
+
+            return timer.time_with_setup(setup, process_quorum)
+
+        yield Case(
+            "block_tree/process_vote/n={}".format(n),
+            {"n": n, "votes": 2 * ((n - 1) // 3) + 1},
+            measure,
+        )
+
+
+def make_cases(timer: Timer, quick: bool) -> Iterator[Case]:
+    """
+
+    Args:
+        timer:
+        quick: Only run the smaller parameter values.
+
+    Returns:
+
+    """
+    index = 1 if quick else 0
+    yield from signature_cases(timer, BLOCK_SIZES[index])
+    yield from mempool_cases(timer, MEMPOOL_DEPTHS[index])
+    yield from pending_block_tree_cases(timer, TREE_SIZES[index])
+    yield from ledger_cases(timer, LEDGER_LENGTHS[index])
+    yield from block_tree_cases(timer, VALIDATORS[index])
+
+
+def run(
+    min_time: float, repeat: int, quick: bool, name_filter: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+
+    Args:
+        min_time:
+        repeat:
+        quick:
+        name_filter: Only run the cases whose name contains it.
+
+    Returns:
+        The environment and a result per case name.
+    """
+    timer = Timer(min_time, repeat)
+    results = {}
+    for case in make_cases(timer, quick):
+        if name_filter and name_filter not in case.name:
+            continue
+        results[case.name] = {"params": case.params, "us_per_op": case.measure()}
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "min_time": min_time,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(
+    report: Dict[str, Any], baseline: Dict[str, Any], threshold: float
+) -> List[Dict[str, Any]]:
+    """
+
+    Args:
+        report: Output of run.
+        baseline: Output of an earlier run.
+        threshold: Relative slowdown above which a case regressed.
+
+    Returns:
+        One row per case of the report, with its status: "regression",
+        "improvement", "ok" or "new" if the baseline does not have it.
+    """
+    rows = []
+    for name, result in report["results"].items():
+        previous = baseline["results"].get(name)
+        row = {"name": name, "us_per_op": result["us_per_op"]}
+        if previous is None:
+            row.update(baseline_us_per_op=None, ratio=None, status="new")
+        else:
+            ratio = result["us_per_op"] / previous["us_per_op"]
+            if ratio > 1 + threshold:
+                status = "regression"
+            elif ratio < 1 / (1 + threshold):
+                status = "improvement"
+            else:
+                status = "ok"
+            row.update(
+                baseline_us_per_op=previous["us_per_op"], ratio=ratio, status=status
+            )
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--filter", help="only run the cases containing this text")
+    parser.add_argument(
+        "--quick", action="store_true", help="skip the largest parameter values"
+    )
+    parser.add_argument(
+        "--min-time", type=float, default=0.05, help="seconds per repeat"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="relative slowdown reported as a regression",
+    )
+    parser.add_argument("--json", action="store_true", help="print the JSON report")
+    args = parser.parse_args()
+
+    report = run(args.min_time, args.repeat, args.quick, args.filter)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=4)
+
+    rows = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            rows = compare(report, json.load(baseline_file), args.threshold)
+        report["comparison"] = {"threshold": args.threshold, "rows": rows}
+
+    if args.json:
+        print(json.dumps(report, indent=4))
+    elif rows is None:
+        print("{:<64} {:>12}".format("case", "us/op"))
+        for name, result in report["results"].items():
+            print("{:<64} {:>12.3f}".format(name, result["us_per_op"]))
+    else:
+        print(
+            "{:<64} {:>12} {:>12} {:>7} {}".format(
+                "case", "baseline", "us/op", "ratio", "status"
+            )
+        )
+        for row in rows:
+            print(
+                "{:<64} {:>12} {:>12.3f} {:>7} {}".format(
+                    row["name"],
+                    (
+                        "-"
+                        if row["baseline_us_per_op"] is None
+                        else "{:.3f}".format(row["baseline_us_per_op"])
+                    ),
+                    row["us_per_op"],
+                    "-" if row["ratio"] is None else "{:.2f}".format(row["ratio"]),
+                    row["status"],
+                )
+            )
+
+    if rows and any(row["status"] == "regression" for row in rows):
+        print(
+            "Regressions above {:.0%}: {}".format(
+                args.threshold,
+                ", ".join(r["name"] for r in rows if r["status"] == "regression"),
+            ),
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
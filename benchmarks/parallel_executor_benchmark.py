@@ -0,0 +1,239 @@
+"""
+Determinism and speedup of the parallel executor compared to serial execution.
+
+Every run first asserts that chains and forks of random blocks reach the same
+state ids and committed state when executed serially and in parallel, with
+the pool forced on for every block and with the default serial fallback, and
+fails if they do not. --check-only stops there. It then times blocks of HASH
+transactions where a given fraction of the transactions contend for a few hot
+keys, with the pool forced on and with the default executor that falls back
+to serial execution when parallelism would not pay off.
+
+    python -m benchmarks.parallel_executor_benchmark [--block-size N]
+        [--rounds N] [--workers N] [--checks N] [--check-only] [--json]
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import Any, Dict, List
+
+from modules.objects import Transaction
+from modules.state_machine.parallel_executor import ParallelExecutor
+from modules.state_machine.state_machine import StateMachine
+
+CONFLICT_RATIOS = [0.0, 0.1, 0.25, 0.5, 1.0]
+HOT_KEYS = 4
+
+
+def random_block(rng: random.Random, size: int, keys: int) -> List[Transaction]:
+    """
+
+    Args:
+        rng:
+        size: Number of transactions.
+        keys: Size of the key space, small values mean many conflicts.
+
+    Returns:
+
+    """
+    txns = []
+    for _ in range(size):
+        key = "k{}".format(rng.randrange(keys))
+        command = rng.choice(
+            [
+                "SET {} {}".format(key, rng.randrange(100)),
+                "DEL {}".format(key),
+                "INCR {} {}".format(key, rng.randrange(1, 5)),
+                "INCR {}".format(key),
+                "HASH {} 2".format(key),
+                "op{}".format(rng.randrange(keys)),
+            ]
+        )
+        txns.append(Transaction(command, "{:x}".format(rng.getrandbits(64)), 1))
+    return txns
+
+
+def check_determinism(executor: ParallelExecutor, checks: int) -> None:
+    """Assert that the same random block trees execute alike serially and with
+    the executor.
+
+    Args:
+        executor:
+        checks: Number of random trees.
+
+    Returns:
+
+    """
+    for seed in range(checks):
+        rng = random.Random(seed)
+        serial = StateMachine()
+        parallel = StateMachine(executor)
+        blocks = [None]
+        for height in range(8):
+            # Fork off a random pending block, commit along the longest chain
+            parent_id = rng.choice(blocks[-3:])
+            block_id = "b{}".format(height)
+            txns = random_block(rng, rng.randrange(1, 200), rng.choice([2, 16, 512]))
+            expected = serial.execute(block_id, parent_id, txns)
+            state_id = parallel.execute(block_id, parent_id, txns)
+            assert state_id == expected, "seed {} block {}: state id {} != {}".format(
+                seed, block_id, state_id, expected
+            )
+            blocks.append(block_id)
+            if height % 3 == 2:
+                serial.commit(blocks[-2])
+                parallel.commit(blocks[-2])
+                assert serial.store == parallel.store, "seed {} commit {}".format(
+                    seed, blocks[-2]
+                )
+
+
+def check_executors(workers: int, checks: int) -> None:
+    """Run check_determinism with the pool forced on and with the fallback.
+
+    Args:
+        workers: Pool processes.
+        checks: Number of random trees per executor.
+
+    Returns:
+
+    """
+    for chunk_size in (1, 16, None):
+        executor = ParallelExecutor(
+            workers, min_parallel=0, chunk_size=chunk_size, min_cost=0
+        )
+        check_determinism(executor, checks)
+        assert executor.executed > 0 and executor.serial == 0
+        assert executor.reexecuted > 0, "random blocks did not conflict"
+        executor.close()
+
+    executor = ParallelExecutor(workers)
+    check_determinism(executor, checks)
+    # Random blocks are far too cheap to be worth the pool
+    assert executor.executed == 0 and executor.serial > 0
+    assert executor.pool is None
+    executor.close()
+
+
+def conflict_block(size: int, ratio: float, rounds: int) -> List[Transaction]:
+    """
+
+    Args:
+        size:
+        ratio: Fraction of the transactions that hash one of the hot keys.
+        rounds: SHA-256 rounds per transaction.
+
+    Returns:
+
+    """
+    rng = random.Random(size)
+    txns = []
+    for index in range(size):
+        if rng.random() < ratio:
+            key = "hot{}".format(rng.randrange(HOT_KEYS))
+        else:
+            key = "key{}".format(index)
+        txns.append(
+            Transaction("HASH {} {}".format(key, rounds), "trx{}".format(index), 1)
+        )
+    return txns
+
+
+def run(block_size: int, rounds: int, workers: int) -> List[Dict[str, Any]]:
+    """
+
+    Args:
+        block_size:
+        rounds: SHA-256 rounds per transaction.
+        workers: Pool processes.
+
+    Returns:
+        One row per conflict ratio.
+    """
+    forced = ParallelExecutor(workers, min_parallel=0, min_cost=0)
+    default = ParallelExecutor(workers)
+    # Start the workers outside of the measurements
+    StateMachine(forced).execute("warmup", None, conflict_block(workers, 0, 1))
+    if default.is_worth_parallel(conflict_block(block_size, 0, rounds)):
+        StateMachine(default).execute(
+            "warmup", None, conflict_block(block_size, 0, rounds)
+        )
+    rows = []
+    for ratio in CONFLICT_RATIOS:
+        txns = conflict_block(block_size, ratio, rounds)
+        start = time.perf_counter()
+        expected = StateMachine().execute("block", None, txns)
+        serial_time = time.perf_counter() - start
+
+        reexecuted = forced.reexecuted
+        start = time.perf_counter()
+        forced_id = StateMachine(forced).execute("block", None, txns)
+        forced_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        default_id = StateMachine(default).execute("block", None, txns)
+        default_time = time.perf_counter() - start
+        assert forced_id == expected and default_id == expected
+        rows.append(
+            {
+                "conflict_ratio": ratio,
+                "serial_ms": round(serial_time * 1000, 3),
+                "forced_ms": round(forced_time * 1000, 3),
+                "forced_speedup": round(serial_time / forced_time, 2),
+                "reexecuted": forced.reexecuted - reexecuted,
+                "default_ms": round(default_time * 1000, 3),
+                "default_speedup": round(serial_time / default_time, 2),
+                "default_parallel": default.is_worth_parallel(txns),
+            }
+        )
+    forced.close()
+    default.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--block-size", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--checks", type=int, default=50)
+    parser.add_argument(
+        "--check-only", action="store_true", help="only run the determinism checks"
+    )
+    parser.add_argument("--json", action="store_true", help="print JSON rows")
+    args = parser.parse_args()
+
+    workers = ParallelExecutor(args.workers).workers
+    check_executors(workers, args.checks)
+    if args.check_only:
+        print("serial and parallel execution agree on {} trees".format(args.checks))
+        return
+
+    rows = run(args.block_size, args.rounds, workers)
+    if args.json:
+        print(json.dumps(rows, indent=4))
+        return
+    print(
+        "{:>8} {:>10} {:>10} {:>8} {:>11} {:>10} {:>8} {:>9}".format(
+            "conflict",
+            "serial ms",
+            "forced ms",
+            "speedup",
+            "reexecuted",
+            "default ms",
+            "speedup",
+            "parallel",
+        )
+    )
+    for row in rows:
+        print(
+            "{conflict_ratio:>8} {serial_ms:>10} {forced_ms:>10} "
+            "{forced_speedup:>8} {reexecuted:>11} {default_ms:>10} "
+            "{default_speedup:>8} {default_parallel!s:>9}".format(**row)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from modules.block_tree.pending_block_tree import PendingBlockTree
-from modules.objects import Block, QuorumCertificate, Transaction, VoteMsg
+from modules.objects import (
+    Block,
+    QuorumCertificate,
+    SignatureSet,
+    Transaction,
+    VoteMsg,
+)
+from modules.verification.certificate_verifier import certificate_digest
 
 
 class BlockTree:
@@ -17,8 +24,19 @@ class BlockTree:
         """
         self.pending_block_tree: PendingBlockTree = PendingBlockTree()
         self.pending_votes: Dict[str, List[VoteMsg]] = {}
+        # Map of block-id to the keys of pending_votes for the block
+        self.pending_vote_keys: Dict[str, List[str]] = {}
+        # Blocks dropped from abandoned branches, drained by Main
+        self.abandoned_blocks: List[Block] = []
         self.high_qc: QuorumCertificate = None
         self.high_commit_qc: QuorumCertificate = None
+        # Last committed block, the root of the pending block tree
+        self.committed_id: Optional[str] = None
+        # Highest QC applied so far, its digest is computed on first use
+        self.applied_qc: Optional[QuorumCertificate] = None
+        self.applied_qc_digest: Optional[bytes] = None
+        self.qc_fast_path_hits = 0
+        self.qc_fast_path_misses = 0
         self.ledger = ledger
         self.block_size = 4
         self.f = f
@@ -31,8 +49,90 @@ class BlockTree:
             pending block tree.prune(qc.vote info.parent id) // parent id becomes the new root of pending
             high commit qc ← maxround{qc, high commit qc}
         high qc ← maxround{qc, high qc}
+
+    Votes only carry a commit state id when their block extends the QC of the
+    previous round, so a QC commits the parent of its block on a 2-chain of
+    consecutive rounds, together with any ancestor not committed yet.
     """
 
+    def is_applied_qc(self, qc: QuorumCertificate) -> bool:
+        """Fast path for QCs that cannot change any state.
+
+        A QC of a lower round than the highest one applied can no longer
+        commit, prune or advance the round, and neither can that QC again.
+
+        Args:
+            qc:
+
+        Returns:
+            True if qc is the highest applied QC or older than it.
+        """
+        if not qc:
+            return True
+        applied_round = self.applied_qc.vote_info.round if self.applied_qc else -1
+        if qc.vote_info.round < applied_round or (
+            qc.vote_info.round == applied_round
+            and (
+                qc is self.applied_qc
+                or self._applied_digest() == certificate_digest(qc)
+            )
+        ):
+            self.qc_fast_path_hits += 1
+            return True
+        self.qc_fast_path_misses += 1
+        return False
+
+    def _applied_digest(self) -> bytes:
+        if self.applied_qc_digest is None:
+            self.applied_qc_digest = certificate_digest(self.applied_qc)
+        return self.applied_qc_digest
+
+    def qc_metrics(self) -> Dict[str, int]:
+        """
+
+        Returns:
+            Fast path counters of process_qc.
+        """
+        return {
+            "applied_round": (
+                self.applied_qc.vote_info.round if self.applied_qc else -1
+            ),
+            "hits": self.qc_fast_path_hits,
+            "misses": self.qc_fast_path_misses,
+        }
+
+    def collect_garbage(self, committed_round: int) -> int:
+        """Drop the votes collected for blocks below the committed round.
+
+        Args:
+            committed_round:
+
+        Returns:
+            Number of evicted entries.
+        """
+        stale = [
+            vote_key
+            for vote_key, votes in self.pending_votes.items()
+            if votes[0].vote_info.round < committed_round
+        ]
+        for vote_key in stale:
+            block_id = self.pending_votes.pop(vote_key)[0].vote_info.id
+            self.pending_vote_keys.pop(block_id, None)
+        return len(stale)
+
+    def memory_gauges(self) -> Dict[str, int]:
+        """
+
+        Returns:
+            Sizes of the vote and block bookkeeping.
+        """
+        return {
+            "pending_votes": len(self.pending_votes),
+            "pending_vote_blocks": len(self.pending_vote_keys),
+            "pending_vote_msgs": sum(map(len, self.pending_votes.values())),
+            "pending_blocks": len(self.pending_block_tree.blocks),
+        }
+
     def process_qc(self, qc: QuorumCertificate):
         """
 
@@ -41,16 +141,61 @@ class BlockTree:
 
         Returns:
 
+        """
+        if self.is_applied_qc(qc) or not self.is_known_block(qc):
+            return []
+        return self.apply_qc(qc)
+
+    def is_known_block(self, qc: QuorumCertificate) -> bool:
+        """
+
+        Args:
+            qc: A QC that is not applied yet.
+
+        Returns:
+            False if the block certified by qc did not arrive yet. The QC is
+            then skipped, it comes again with the proposal extending the block.
+        """
+        return qc.vote_info.id in self.pending_block_tree
+
+    def find_block(self, block_id: str) -> Optional[Block]:
+        """
+
+        Args:
+            block_id:
+
+        Returns:
+            The pending or committed block, None if it is unknown or an empty
+            block that was committed.
+        """
+        block = self.pending_block_tree.find(block_id)
+        if block is not None:
+            return block
+        committed_block = self.ledger.get_committed_block(block_id)
+        return committed_block.block if committed_block else None
+
+    def apply_qc(self, qc: QuorumCertificate):
+        """Process a QC known not to be applied yet, see is_applied_qc.
+
+        Args:
+            qc:
+
+        Returns:
+            Ids of the transactions committed by the QC.
         """
         trx_to_dq = []
-        if not qc:
-            return trx_to_dq
-        if qc.ledger_commit_info.commit_state_id is not None and (
-            self.high_commit_qc is None
-            or qc.vote_info.round > self.high_commit_qc.vote_info.round
+        if (
+            qc.ledger_commit_info.commit_state_id is not None
+            and qc.vote_info.parent_id in self.pending_block_tree
+            and (
+                self.high_commit_qc is None
+                or qc.vote_info.round > self.high_commit_qc.vote_info.round
+            )
         ):
-            trx_to_dq = self.ledger.commit(qc.vote_info.id, self)
-            self.pending_block_tree.prune(qc.vote_info)
+            trx_to_dq = self.commit(qc)
+            abandoned = self.pending_block_tree.prune(qc.vote_info.parent_id)
+            self.ledger.abandon(abandoned)
+            self.abandoned_blocks.extend(abandoned)
             self.high_commit_qc = (
                 qc
                 if (
@@ -68,6 +213,40 @@ class BlockTree:
             )
             else self.high_qc
         )
+        if (
+            self.applied_qc is None
+            or qc.vote_info.round > self.applied_qc.vote_info.round
+        ):
+            self.applied_qc = qc
+            self.applied_qc_digest = None
+        return trx_to_dq
+
+    def commit(self, qc: QuorumCertificate) -> List[str]:
+        """Commit the parent of the block certified by qc and its ancestors
+        that are not committed yet, oldest first.
+
+        Args:
+            qc: A QC whose votes carry a commit state id.
+
+        Returns:
+            Ids of the committed transactions.
+        """
+        # (block id, QC certifying it), newest first
+        chain = []
+        child = self.pending_block_tree.find(qc.vote_info.id)
+        while (
+            child is not None
+            and child.qc is not None
+            and child.qc.vote_info.id != self.committed_id
+            and child.qc.vote_info.id in self.pending_block_tree
+        ):
+            chain.append((child.qc.vote_info.id, child.qc))
+            child = self.pending_block_tree.find(child.qc.vote_info.id)
+
+        trx_to_dq = []
+        for block_id, certifying_qc in reversed(chain):
+            trx_to_dq += self.ledger.commit(block_id, self, certifying_qc)
+            self.committed_id = block_id
         return trx_to_dq
 
     """
@@ -86,8 +265,13 @@ class BlockTree:
         Returns:
 
         """
-        # TODO get actual transactions and pass them into speculate
-        self.ledger.speculate(b.id, b.payload)
+        self.ledger.speculate(
+            b.id,
+            b.payload,
+            b.payload_digest(),
+            b.qc.vote_info.id if b.qc is not None else None,
+            b.round,
+        )
         self.pending_block_tree.add(b)
 
     """
@@ -114,22 +298,62 @@ class BlockTree:
 
         """
         dq_txns = self.process_qc(vote.high_commit_qc)
-        vote_key = hash(vote.ledger_commit_info.fields())
+        vote_key = vote.ledger_commit_info.digest()
         self.pending_votes[vote_key] = (
             self.pending_votes[vote_key] if vote_key in self.pending_votes else []
         )
+        if any(
+            vote_msg.sender == vote.sender for vote_msg in self.pending_votes[vote_key]
+        ):
+            return (None, dq_txns)
+        if not self.pending_votes[vote_key]:
+            self.pending_vote_keys.setdefault(vote.vote_info.id, []).append(vote_key)
         self.pending_votes[vote_key].append(vote)
-        if len(self.pending_votes[vote_key]) == 2 * self.f + 1:
-            # signatures = map(
-            #     lambda vote_msg: vote_msg.signature, self.pending_votes[vote_key]
-            # )
-            signatures = []
-            author_sig = ""  # TODO Add author signing mechanism
-            qc = QuorumCertificate(
-                vote.vote_info, vote.ledger_commit_info, signatures, self.id, author_sig
+        return (self._form_qc(vote_key), dq_txns)
+
+    def process_pending_votes(self, block_id: str) -> Optional[QuorumCertificate]:
+        """Form the QC of a block whose votes overtook it.
+
+        Args:
+            block_id: A block just inserted into the pending block tree.
+
+        Returns:
+            The QC of the block if a quorum of its votes was already pending.
+        """
+        for vote_key in self.pending_vote_keys.get(block_id, []):
+            qc = self._form_qc(vote_key)
+            if qc:
+                return qc
+        return None
+
+    def _form_qc(self, vote_key: str) -> Optional[QuorumCertificate]:
+        """
+
+        Args:
+            vote_key:
+
+        Returns:
+            A QC if 2f + 1 votes are pending under vote_key for a known block
+            of a round above high_qc, None otherwise.
+        """
+        votes = self.pending_votes[vote_key]
+        vote = votes[0]
+        if (
+            len(votes) < 2 * self.f + 1
+            or vote.vote_info.id not in self.pending_block_tree
+            or (
+                self.high_qc is not None
+                and vote.vote_info.round <= self.high_qc.vote_info.round
             )
-            return (qc, dq_txns)
-        return (None, dq_txns)
+        ):
+            return None
+        signatures = SignatureSet(3 * self.f + 1)
+        for vote_msg in votes[: 2 * self.f + 1]:
+            signatures.add(vote_msg.sender, vote_msg.signature)
+        author_sig = ""  # TODO Add author signing mechanism
+        return QuorumCertificate(
+            vote.vote_info, vote.ledger_commit_info, signatures, self.id, author_sig
+        )
 
     """
     Function generate block(txns, current round)
@@ -139,6 +363,7 @@ class BlockTree:
         payload ← txns,
         qc ← high qc,
         id ← hash(author || round || payload || qc.vote info.id || qc.signatures) )
+        where payload is hashed as the Merkle root of its transactions
     """
 
     def generate_block(self, txns: List[Transaction], current_round: int):
@@ -151,25 +376,13 @@ class BlockTree:
         Returns:
 
         """
-        commands = []
-        for trans in txns:
-            commands.append(trans.command)
-        b = Block(
+        b = Block(self.id, current_round, txns, self.high_qc, None)
+        b.id = Block.make_id(
             self.id,
             current_round,
-            txns,
-            self.high_qc,
-            hash(
-                str(self.id)
-                + str(current_round)
-                + ",".join(commands)
-                + (str(self.high_qc.vote_info.id) if self.high_qc else "")
-                + (
-                    ",".join(self.high_qc.signatures)
-                    if self.high_qc is not None
-                    else ""
-                ),
-            ),
+            b.payload_digest(),
+            self.high_qc.vote_info.id if self.high_qc else None,
+            self.high_qc.signatures if self.high_qc else None,
         )
 
         return b
@@ -1,31 +1,61 @@
-from typing import List
+from typing import Dict, List, Optional
 
-from modules.objects import Block, VoteInfo
+from modules.objects import Block
 
 
 class PendingBlockTree:
     def __init__(self):
-        """Pending block tree class."""
-        self.tree: List[Block] = []
+        """Pending block tree class.
 
-    def prune(self, vote_info: VoteInfo):
+        Blocks are indexed by id. Each block links to its parent (the block
+        certified by its qc) and to its children, so lookups are O(1) and
+        pruning only touches the blocks that are removed. Blocks whose parent
+        is not in the tree hang off the ``None`` sentinel.
         """
+        self.blocks: Dict[str, Block] = {}
+        self.parents: Dict[str, Optional[str]] = {}
+        self.children: Dict[Optional[str], List[str]] = {None: []}
+        self.root: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def __contains__(self, block_id) -> bool:
+        return block_id in self.blocks
+
+    def prune(self, block_id: str) -> List[Block]:
+        """Make the committed block the new root and drop abandoned branches.
+
+        Every block that is not a descendant of ``block_id`` is removed,
+        walking up from the new root and discarding the sibling subtrees
+        hanging off each ancestor.
 
         Args:
-            vote_info:
+            block_id: The committed block.
 
         Returns:
-
+            The removed blocks that are not ancestors of the new root.
         """
-        pruned_tree = []
-        for block in self.tree:
-            if (
-                vote_info.id == block.id
-                or block.qc is None
-                or block.qc.vote_info.parent_id != vote_info.parent_id
-            ):
-                pruned_tree.append(block)
-        self.tree = pruned_tree
+        abandoned: List[Block] = []
+        new_root = block_id
+        if new_root not in self.blocks:
+            return abandoned
+
+        keep = new_root
+        ancestor = self.parents[new_root]
+        while True:
+            for child in self.children[ancestor]:
+                if child != keep:
+                    self._remove_subtree(child, abandoned)
+            if ancestor is None:
+                break
+            keep, ancestor = ancestor, self.parents[ancestor]
+            self._remove_block(keep)
+
+        self.children[None] = [new_root]
+        self.parents[new_root] = None
+        self.root = new_root
+        return abandoned
 
     def add(self, block: Block):
         """
@@ -36,7 +66,20 @@ class PendingBlockTree:
         Returns:
 
         """
-        self.tree.append(block)
+        if block.id in self.blocks:
+            self.blocks[block.id] = block
+            return
+
+        parent_id = block.qc.vote_info.id if block.qc else None
+        if parent_id not in self.blocks:
+            parent_id = None
+
+        self.blocks[block.id] = block
+        self.parents[block.id] = parent_id
+        self.children[block.id] = []
+        self.children[parent_id].append(block.id)
+        if self.root is None:
+            self.root = block.id
 
     def find(self, block_id) -> Block:
         """
@@ -47,6 +90,36 @@ class PendingBlockTree:
         Returns:
 
         """
-        for block in self.tree:
-            if block.id == block_id:
-                return block
+        return self.blocks.get(block_id)
+
+    def _remove_subtree(self, block_id: str, removed: List[Block]):
+        """
+
+        Args:
+            block_id: Root of the subtree to drop.
+            removed: Collects the removed blocks.
+
+        Returns:
+
+        """
+        stack = [block_id]
+        while stack:
+            current = stack.pop()
+            stack.extend(self.children[current])
+            removed.append(self.blocks[current])
+            self._remove_block(current)
+
+    def _remove_block(self, block_id: str):
+        """
+
+        Args:
+            block_id:
+
+        Returns:
+
+        """
+        del self.blocks[block_id]
+        del self.parents[block_id]
+        del self.children[block_id]
+        if self.root == block_id:
+            self.root = None
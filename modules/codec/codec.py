@@ -0,0 +1,417 @@
+"""
+Compact canonical binary encoding for the objects in modules/objects.py.
+
+Every encoded message starts with a fixed header:
+
+    magic:2s ("CL")  version:u8  format:u8
+
+followed by a single tagged value. Objects are encoded as their type id and
+their fields in a fixed order, so equal objects always produce equal bytes
+and signatures can be computed over them. Lengths are varints, small ints
+take one byte, and a string of MIN_REF_LENGTH characters or more that
+repeats within a message (transaction ids listed next to the transactions)
+is encoded once and then referenced by index. Objects the codec does not know
+are pickled instead (format PICKLE), which decode() only accepts for local
+data it is explicitly allowed for, never for messages off the network.
+Malformed or truncated input raises CodecError.
+"""
+
+import pickle
+import struct
+from typing import Any, Callable, Dict, List, Tuple
+
+from nacl.signing import SignedMessage
+
+from modules.objects import (
+    Block,
+    Checkpoint,
+    CommittedBlock,
+    LedgerCommitInfo,
+    ProposalMessage,
+    QuorumCertificate,
+    SignatureSet,
+    TimeoutCertificate,
+    TimeoutInfo,
+    TimeoutMessage,
+    Transaction,
+    VoteInfo,
+    VoteMsg,
+)
+
+MAGIC = b"CL"
+VERSION = 1
+HEADER = struct.Struct(">2sBB")
+
+
+class WireFormat:
+    CANONICAL = 0
+    PICKLE = 1
+
+
+class Tag:
+    NONE = 0
+    FALSE = 1
+    TRUE = 2
+    INT8 = 3
+    INT64 = 4
+    BIG_INT = 5
+    FLOAT = 6
+    STR = 7
+    BYTES = 8
+    LIST = 9
+    TUPLE = 10
+    OBJECT = 11
+    STR_REF = 12  # Repeat of an earlier string of the same message
+
+
+class CodecError(Exception):
+    pass
+
+
+# Type id -> (class, encoded attributes). Ids and attribute order are part of
+# the wire format: only ever append, and bump VERSION on incompatible changes.
+SCHEMA: Dict[int, Tuple[type, Tuple[str, ...]]] = {
+    1: (VoteInfo, ("id", "round", "parent_id", "parent_round", "exec_state_id")),
+    2: (LedgerCommitInfo, ("commit_state_id", "vote_info_hash")),
+    3: (
+        QuorumCertificate,
+        ("vote_info", "ledger_commit_info", "signatures", "author", "author_signature"),
+    ),
+    4: (TimeoutCertificate, ("round", "tmo_high_qc_rounds", "tmo_signatures")),
+    5: (Transaction, ("command", "id", "retry_count", "client_id")),
+    6: (Block, ("author", "round", "payload", "qc", "id")),
+    7: (CommittedBlock, ("block", "commit_state_id")),
+    8: (TimeoutInfo, ("round", "high_qc", "sender", "signature")),
+    9: (TimeoutMessage, ("tmo_info", "last_round_tc", "high_commit_qc", "id")),
+    10: (
+        VoteMsg,
+        ("vote_info", "ledger_commit_info", "high_commit_qc", "sender", "signature"),
+    ),
+    11: (
+        ProposalMessage,
+        (
+            "block",
+            "last_round_tc",
+            "high_commit_qc",
+            "signature",
+            "sender_id",
+            "trx_ids",
+        ),
+    ),
+    12: (Checkpoint, ("height", "block_id", "round", "state_hash", "qc")),
+    13: (SignatureSet, ("bitmap", "packed")),
+}
+TYPE_IDS: Dict[type, int] = {cls: type_id for type_id, (cls, _) in SCHEMA.items()}
+
+I8 = struct.Struct(">b")
+I64 = struct.Struct(">q")
+F64 = struct.Struct(">d")
+I64_MIN, I64_MAX = -(1 << 63), (1 << 63) - 1
+# Varints encode lengths and indexes, which fit in 64 bits
+MAX_VARINT_SHIFT = 63
+# Strings at least this long are encoded once per message and then referenced
+MIN_REF_LENGTH = 8
+
+
+def _encode_varint(value: int, out: bytearray) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_varint(data: memoryview, offset: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        if offset >= len(data):
+            raise CodecError("Truncated varint at offset {}".format(offset))
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+        if shift > MAX_VARINT_SHIFT:
+            raise CodecError("Varint too long at offset {}".format(offset))
+
+
+class _Encoder:
+    def __init__(self) -> None:
+        self.out = bytearray()
+        self.strings: Dict[str, int] = {}
+
+    def value(self, value: Any) -> None:
+        """
+
+        Args:
+            value:
+
+        Returns:
+
+        """
+        encode_type = _ENCODERS.get(type(value))
+        if encode_type is not None:
+            encode_type(self, value)
+            return
+        type_id = TYPE_IDS.get(type(value))
+        if type_id is None:
+            raise CodecError("Cannot encode {}".format(type(value).__name__))
+        out = self.out
+        out.append(Tag.OBJECT)
+        out.append(type_id)
+        for attr in SCHEMA[type_id][1]:
+            self.value(getattr(value, attr))
+
+    def none(self, value: None) -> None:
+        self.out.append(Tag.NONE)
+
+    def bool(self, value: bool) -> None:
+        self.out.append(Tag.TRUE if value else Tag.FALSE)
+
+    def int(self, value: int) -> None:
+        out = self.out
+        if -128 <= value < 128:
+            out.append(Tag.INT8)
+            out += I8.pack(value)
+        elif I64_MIN <= value <= I64_MAX:
+            out.append(Tag.INT64)
+            out += I64.pack(value)
+        else:
+            raw = value.to_bytes((value.bit_length() + 8) // 8, "big", signed=True)
+            out.append(Tag.BIG_INT)
+            _encode_varint(len(raw), out)
+            out += raw
+
+    def float(self, value: float) -> None:
+        self.out.append(Tag.FLOAT)
+        self.out += F64.pack(value)
+
+    def str(self, value: str) -> None:
+        out = self.out
+        if len(value) >= MIN_REF_LENGTH:
+            index = self.strings.get(value)
+            if index is not None:
+                out.append(Tag.STR_REF)
+                _encode_varint(index, out)
+                return
+            self.strings[value] = len(self.strings)
+        raw = value.encode("utf-8")
+        out.append(Tag.STR)
+        _encode_varint(len(raw), out)
+        out += raw
+
+    def bytes(self, value: bytes) -> None:
+        out = self.out
+        out.append(Tag.BYTES)
+        _encode_varint(len(value), out)
+        out += value
+
+    def list(self, value: list) -> None:
+        self.out.append(Tag.LIST)
+        _encode_varint(len(value), self.out)
+        for item in value:
+            self.value(item)
+
+    def tuple(self, value: tuple) -> None:
+        self.out.append(Tag.TUPLE)
+        _encode_varint(len(value), self.out)
+        for item in value:
+            self.value(item)
+
+
+_ENCODERS: Dict[type, Callable[[_Encoder, Any], None]] = {
+    type(None): _Encoder.none,
+    bool: _Encoder.bool,
+    int: _Encoder.int,
+    float: _Encoder.float,
+    str: _Encoder.str,
+    bytes: _Encoder.bytes,
+    bytearray: _Encoder.bytes,
+    SignedMessage: _Encoder.bytes,
+    list: _Encoder.list,
+    tuple: _Encoder.tuple,
+}
+
+
+class _Decoder:
+    def __init__(self, data: memoryview, offset: int) -> None:
+        self.data = data
+        self.offset = offset
+        self.strings: List[str] = []
+
+    def take(self, size: int) -> int:
+        """
+
+        Args:
+            size: Number of bytes the next field takes.
+
+        Returns:
+            Offset of the field, raises CodecError if the data ends before it.
+        """
+        offset = self.offset
+        if size > len(self.data) - offset:
+            raise CodecError("Truncated value at offset {}".format(offset))
+        self.offset = offset + size
+        return offset
+
+    def value(self) -> Any:
+        """
+
+        Returns:
+            The value starting at the current offset.
+        """
+        tag = self.data[self.take(1)]
+        if tag >= len(_DECODERS):
+            raise CodecError("Unknown tag {}".format(tag))
+        return _DECODERS[tag](self)
+
+    def none(self) -> None:
+        return None
+
+    def false(self) -> bool:
+        return False
+
+    def true(self) -> bool:
+        return True
+
+    def int8(self) -> int:
+        return I8.unpack_from(self.data, self.take(I8.size))[0]
+
+    def int64(self) -> int:
+        return I64.unpack_from(self.data, self.take(I64.size))[0]
+
+    def big_int(self) -> int:
+        return int.from_bytes(self.bytes(), "big", signed=True)
+
+    def float(self) -> float:
+        return F64.unpack_from(self.data, self.take(F64.size))[0]
+
+    def str(self) -> str:
+        try:
+            value = str(self.bytes(), "utf-8")
+        except UnicodeDecodeError:
+            raise CodecError("Invalid UTF-8 string at offset {}".format(self.offset))
+        if len(value) >= MIN_REF_LENGTH:
+            self.strings.append(value)
+        return value
+
+    def str_ref(self) -> str:
+        index, self.offset = _decode_varint(self.data, self.offset)
+        if index >= len(self.strings):
+            raise CodecError("Unknown string reference {}".format(index))
+        return self.strings[index]
+
+    def bytes(self) -> bytes:
+        length, self.offset = _decode_varint(self.data, self.offset)
+        offset = self.take(length)
+        return bytes(self.data[offset : self.offset])
+
+    def list(self) -> list:
+        count, self.offset = _decode_varint(self.data, self.offset)
+        # Every item takes at least its tag
+        if count > len(self.data) - self.offset:
+            raise CodecError("Truncated list at offset {}".format(self.offset))
+        return [self.value() for _ in range(count)]
+
+    def tuple(self) -> tuple:
+        return tuple(self.list())
+
+    def object(self) -> Any:
+        type_id = self.data[self.take(1)]
+        if type_id not in SCHEMA:
+            raise CodecError("Unknown type id {}".format(type_id))
+        cls, attrs = SCHEMA[type_id]
+        obj = cls.__new__(cls)
+        for attr in attrs:
+            setattr(obj, attr, self.value())
+        if cls is SignatureSet and not (
+            isinstance(obj.bitmap, bytes)
+            and isinstance(obj.packed, bytes)
+            and obj.is_well_formed()
+        ):
+            raise CodecError("Signatures do not match the signer bitmap")
+        return obj
+
+
+# Indexed by Tag
+_DECODERS: List[Callable[[_Decoder], Any]] = [
+    _Decoder.none,
+    _Decoder.false,
+    _Decoder.true,
+    _Decoder.int8,
+    _Decoder.int64,
+    _Decoder.big_int,
+    _Decoder.float,
+    _Decoder.str,
+    _Decoder.bytes,
+    _Decoder.list,
+    _Decoder.tuple,
+    _Decoder.object,
+    _Decoder.str_ref,
+]
+
+
+def encode_canonical(obj: Any) -> bytes:
+    """
+
+    Args:
+        obj:
+
+    Returns:
+        Canonical encoding of ``obj``, raises CodecError if it has none.
+    """
+    encoder = _Encoder()
+    encoder.out += HEADER.pack(MAGIC, VERSION, WireFormat.CANONICAL)
+    encoder.value(obj)
+    return bytes(encoder.out)
+
+
+def encode(obj: Any) -> bytes:
+    """
+
+    Args:
+        obj:
+
+    Returns:
+        Canonical encoding of ``obj``, or its pickle if it has none.
+    """
+    try:
+        return encode_canonical(obj)
+    except CodecError:
+        return HEADER.pack(MAGIC, VERSION, WireFormat.PICKLE) + pickle.dumps(
+            obj, protocol=pickle.HIGHEST_PROTOCOL
+        )
+
+
+def decode(data: bytes, allow_pickle: bool = False) -> Any:
+    """
+
+    Args:
+        data: Output of encode().
+        allow_pickle: Accept the PICKLE format, only for data this process
+            or a trusted one wrote. Unpickling runs arbitrary code.
+
+    Returns:
+        The decoded value, raises CodecError if data is malformed.
+    """
+    if len(data) < HEADER.size:
+        raise CodecError("Truncated codec header")
+    magic, version, wire_format = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise CodecError("Not a codec encoding")
+    if version != VERSION:
+        raise CodecError("Unsupported codec version {}".format(version))
+    if wire_format == WireFormat.PICKLE:
+        if not allow_pickle:
+            raise CodecError("Pickled values are not accepted here")
+        return pickle.loads(memoryview(data)[HEADER.size :])
+    if wire_format != WireFormat.CANONICAL:
+        raise CodecError("Unknown wire format {}".format(wire_format))
+    decoder = _Decoder(memoryview(data), HEADER.size)
+    try:
+        value = decoder.value()
+    except RecursionError:
+        raise CodecError("Encoded value nested too deeply")
+    if decoder.offset != len(data):
+        raise CodecError("Trailing bytes after encoded value")
+    return value
@@ -0,0 +1,97 @@
+"""
+Signed envelope every signed message travels in.
+
+    signature:64s  magic:2s ("SE")  version:u8  kind:u8  signer:u32  payload
+
+The payload is the codec encoding of the message. The signature is a raw
+Ed25519 signature over everything after it, so the envelope itself is a
+PyNaCl signed message and the header (message kind and signer id) is
+covered by the signature. Receivers read the header to pick the verify key,
+then verify and decode the payload exactly once. An envelope only opens if
+the signer is also the author the message names, see AUTHOR_FIELDS.
+"""
+
+import struct
+from typing import Any, Optional, Tuple
+
+from nacl.exceptions import BadSignatureError, CryptoError
+from nacl.signing import SigningKey, VerifyKey
+
+from modules.codec.codec import CodecError, decode, encode_canonical
+from modules.objects import EnvelopeKind
+
+MAGIC = b"SE"
+VERSION = 1
+SIGNATURE_SIZE = 64
+HEADER = struct.Struct(">2sBBI")
+# Attribute naming the author of each kind of message
+AUTHOR_FIELDS = {
+    EnvelopeKind.TRANSACTION: "client_id",
+    EnvelopeKind.PROPOSAL: "sender_id",
+    EnvelopeKind.VOTE: "sender",
+    EnvelopeKind.TIMEOUT: "id",
+}
+
+
+class EnvelopeError(Exception):
+    pass
+
+
+def seal(kind: int, signer: int, obj: Any, signing_key: SigningKey) -> bytes:
+    """
+
+    Args:
+        kind: One of the modules.objects.EnvelopeKind values.
+        signer: Id of the validator or client signing the message.
+        obj:
+        signing_key:
+
+    Returns:
+        The signed envelope. Raises CodecError if obj has no canonical
+        encoding, receivers never unpickle.
+    """
+    signed = signing_key.sign(
+        HEADER.pack(MAGIC, VERSION, kind, signer) + encode_canonical(obj)
+    )
+    return bytes(signed)
+
+
+def peek(envelope: bytes) -> Tuple[int, int]:
+    """Read the header without verifying the signature.
+
+    Args:
+        envelope:
+
+    Returns:
+        (kind, signer) as claimed by the sender.
+    """
+    if len(envelope) < SIGNATURE_SIZE + HEADER.size:
+        raise EnvelopeError("Envelope too short")
+    magic, version, kind, signer = HEADER.unpack_from(envelope, SIGNATURE_SIZE)
+    if magic != MAGIC or version != VERSION:
+        raise EnvelopeError("Not a version {} envelope".format(VERSION))
+    return kind, signer
+
+
+def open_envelope(envelope: bytes, verify_key: VerifyKey) -> Optional[Any]:
+    """
+
+    Args:
+        envelope:
+        verify_key: Key of the signer named in the header.
+
+    Returns:
+        The decoded message, or None if the envelope is malformed, its
+        signature is bad or the message names another author than the signer.
+    """
+    try:
+        kind, signer = peek(envelope)
+        signed = verify_key.verify(envelope)
+        obj = decode(memoryview(signed)[HEADER.size :])
+    except (EnvelopeError, CryptoError, BadSignatureError, ValueError, CodecError):
+        return None
+    # The verify key is picked from the unverified header, so a valid
+    # signature alone only proves who signed, not who the message claims
+    if kind not in AUTHOR_FIELDS or getattr(obj, AUTHOR_FIELDS[kind], None) != signer:
+        return None
+    return obj
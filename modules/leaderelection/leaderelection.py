@@ -1,15 +1,75 @@
 import random
-from typing import Dict, Optional
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
 
-from modules.ledger.ledger import Ledger
-from modules.objects import QuorumCertificate
-from modules.pacemaker.pacemaker import Pacemaker
+from modules.block_tree.block_tree import BlockTree
+from modules.objects import Block, QuorumCertificate
 
 
 class Leader:
     pass
 
 
+class ReputationWindow:
+    """Signers and authors of a block and its most recent ancestors.
+
+    A window is never modified, the window of a block is derived from the one
+    of its parent with ``extend``, so it only depends on the certified chain:
+    ``signer_sets`` holds the signers of the QCs of the last ``window_size``
+    blocks and ``last_authors`` the ``exclude_size`` most recent distinct
+    authors, from least to most recent.
+    """
+
+    def __init__(
+        self,
+        window_size: int,
+        exclude_size: int,
+        signer_sets: Tuple[FrozenSet[int], ...] = (),
+        last_authors: Tuple[int, ...] = (),
+    ) -> None:
+        """
+
+        Args:
+            window_size:
+            exclude_size:
+            signer_sets:
+            last_authors:
+        """
+        self.window_size = window_size
+        self.exclude_size = exclude_size
+        self.signer_sets = signer_sets
+        self.last_authors = last_authors
+
+    def extend(self, block: Block) -> "ReputationWindow":
+        """
+
+        Args:
+            block: A child of the last block of this window.
+
+        Returns:
+            The window of block.
+        """
+        signers = frozenset(block.qc.signatures.signers() if block.qc else ())
+        signer_sets = self.signer_sets + (signers,)
+        last_authors = tuple(
+            author for author in self.last_authors if author != block.author
+        ) + (block.author,)
+        return ReputationWindow(
+            self.window_size,
+            self.exclude_size,
+            signer_sets[max(len(signer_sets) - self.window_size, 0) :],
+            last_authors[max(len(last_authors) - self.exclude_size, 0) :],
+        )
+
+    def candidates(self) -> List[int]:
+        """
+
+        Returns:
+            The active validators that were not a recent author, sorted.
+        """
+        active: Set[int] = set().union(*self.signer_sets)
+        return sorted(active - set(self.last_authors))
+
+
 class LeaderElection:
     def __init__(
         self,
@@ -17,84 +77,169 @@ class LeaderElection:
         window_size: Optional[int] = 3,
         exclude_size: Optional[int] = 10,
         reputation_leaders: Optional[Dict[int, Leader]] = None,
+        reputation: Optional[bool] = False,
     ) -> None:
         """
 
         Args:
             validators:
             window_size:
-            exclude_size:
+            exclude_size: Capped at f so that a leader can always be elected.
             reputation_leaders:
+            reputation: Elect reputation leaders, round robin only otherwise.
+                Off by default, see update_leaders.
         """
         self.validators = validators
         self.window_size = window_size
-        self.exclude_size = exclude_size
-        self.reputation_leaders = {} if not reputation_leaders else None
+        self.exclude_size = min(exclude_size, (validators - 1) // 3)
+        self.reputation_leaders = reputation_leaders if reputation_leaders else {}
+        self.reputation = reputation
+        # Window of every pending block it was derived for, by block id
+        self.windows: Dict[str, ReputationWindow] = {}
+        # Leaders of rounds below it are never asked for again
+        self.collected_round = 0
 
-    """Used pseudo code from paper."""
+    def window(self, block_id: str, block_tree: BlockTree) -> ReputationWindow:
+        """Derive the window of a block from the closest ancestor that has one.
 
-    def elect_reputation_leader(self, qc: QuorumCertificate, ledger: Ledger) -> Leader:
-        """
+        The walk also stops once the blocks seen fill a window on their own,
+        so a block whose ancestors were all pruned gets the same window.
 
         Args:
-            qc:
-            ledger:
+            block_id:
+            block_tree:
 
         Returns:
 
         """
-        active_validators, last_authors = set(), set()
-        current_qc = qc
+        chain: List[Block] = []
+        authors: Set[int] = set()
+        window = ReputationWindow(self.window_size, self.exclude_size)
+        while block_id is not None:
+            if block_id in self.windows:
+                window = self.windows[block_id]
+                break
+            block = block_tree.find_block(block_id)
+            if block is None:
+                break
+            chain.append(block)
+            authors.add(block.author)
+            if len(chain) >= self.window_size and len(authors) >= self.exclude_size:
+                break
+            block_id = block.qc.vote_info.id if block.qc else None
 
-        i = 0
-        while i < self.window_size or len(last_authors) < self.exclude_size:
-            current_block = ledger.get_committed_block(current_qc.vote_info.parent_id)
-            block_author = current_block.author
+        for block in reversed(chain):
+            window = window.extend(block)
+            self.windows[block.id] = window
+        return window
 
-            if i < self.window_size:
-                active_validators = active_validators | current_qc.signatures.signers()
-            if len(last_authors) < self.exclude_size:
-                last_authors = last_authors | set(block_author)
+    """
+    Used pseudo code from paper, the window of the certified block replaces
+    the ledger walk.
+    """
 
-            current_qc = current_block.qc
-            i += 1
+    def elect_reputation_leader(
+        self, qc: QuorumCertificate, block_tree: BlockTree
+    ) -> Optional[Leader]:
+        """
 
-        active_validators = active_validators - last_authors
-        # TODO: Verify seed logic
-        random.seed(qc.vote_info.round)
-        return random.choice(tuple(active_validators))
+        Args:
+            qc:
+            block_tree:
+
+        Returns:
+            An active validator that was not a recent author, None if there
+            is none yet.
+        """
+        candidates = self.window(qc.vote_info.id, block_tree).candidates()
+        if not candidates:
+            return None
+        return random.Random(qc.vote_info.round).choice(candidates)
 
     """
     Procedure update leaders(qc)
         extended round ← qc.vote info.parent round
         qc round ← qc.vote info.round
         current round ← PaceMaker.current round
-        if extended round + 1 = qc round ∧ qc round + 1 = current round then
-            reputation leaders[current round + 1] ← elect reputation leader(qc)
+        if extended round + 1 = qc round ∧ current round ≤ qc round + 1 then
+            reputation leaders[qc round + 2] ← elect reputation leader(qc)
+
+    The elected leader only depends on the chain certified by the QC, so
+    every validator elects the same one whenever it sees the QC: there is no
+    current round condition and the election runs once per QC round. A
+    validator that enters round qc round + 2 through a TC without having seen
+    the QC still falls back to round robin, so validators can disagree on the
+    leader and reputation leaders are off unless enabled.
     """
 
-    def update_leaders(
-        self, qc: QuorumCertificate, pacemaker: Pacemaker, ledger: Ledger
-    ):
+    def is_pending_election(self, qc: QuorumCertificate) -> bool:
         """
 
         Args:
             qc:
-            pacemaker:
-            ledger:
 
         Returns:
-
+            True if qc elects the leader of a round that is not elected yet.
         """
-        extended_round = qc.vote_info.parent_round
         qc_round = qc.vote_info.round
-        current_round = pacemaker.current_round
+        return (
+            self.reputation
+            and qc.vote_info.parent_round + 1 == qc_round
+            and qc_round + 2 >= self.collected_round
+            and qc_round + 2 not in self.reputation_leaders
+        )
+
+    def update_leaders(self, qc: QuorumCertificate, block_tree: BlockTree):
+        """
+
+        Args:
+            qc: A valid QC of a block in block_tree.
+            block_tree:
+
+        Returns:
 
-        if extended_round + 1 == qc_round and qc_round + 1 == current_round:
-            self.reputation_leaders[current_round + 1] = self.elect_reputation_leader(
-                qc, ledger
+        """
+        if self.is_pending_election(qc):
+            # None keeps the round robin leader for the round
+            self.reputation_leaders[qc.vote_info.round + 2] = (
+                self.elect_reputation_leader(qc, block_tree)
             )
 
+    def collect_garbage(self, current_round: int, block_tree: BlockTree) -> int:
+        """Drop the reputation leaders of past rounds and the windows of
+        blocks no longer pending.
+
+        Args:
+            current_round:
+            block_tree:
+
+        Returns:
+            Number of evicted entries.
+        """
+        self.collected_round = max(self.collected_round, current_round)
+        stale = [round for round in self.reputation_leaders if round < current_round]
+        for round in stale:
+            del self.reputation_leaders[round]
+        pruned = [
+            block_id
+            for block_id in self.windows
+            if block_id not in block_tree.pending_block_tree
+        ]
+        for block_id in pruned:
+            del self.windows[block_id]
+        return len(stale) + len(pruned)
+
+    def memory_gauges(self) -> Dict[str, int]:
+        """
+
+        Returns:
+            Sizes of the election bookkeeping.
+        """
+        return {
+            "reputation_leaders": len(self.reputation_leaders),
+            "reputation_windows": len(self.windows),
+        }
+
     """
     Function get leader(round)
     if (round, leader) ∈ reputation leaders then
@@ -112,7 +257,7 @@ class LeaderElection:
 
         """
         leader = self.reputation_leaders.get(round)
-        if leader:
+        if leader is not None:
             return leader
 
         return (round // 2) % self.validators
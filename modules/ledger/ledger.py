@@ -1,39 +1,166 @@
 import logging
-from typing import Dict, List, Union
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Optional, Union
 
 from modules.block_tree.block_tree import BlockTree
-from modules.objects import CommittedBlock, Transaction
+from modules.ledger.ledger_store import (
+    LedgerStoreReader,
+    LedgerStoreWriter,
+    write_checkpoint,
+)
+from modules.ledger.ledger_writer import DurabilityPolicy, LedgerWriter
+from modules.objects import (
+    Block,
+    Checkpoint,
+    CommittedBlock,
+    QuorumCertificate,
+    Transaction,
+)
+from modules.state_machine.parallel_executor import ParallelExecutor
+from modules.state_machine.state_machine import StateMachine
 
 logger = logging.getLogger(__name__)
 
 
 class Ledger:
-    def __init__(self, id) -> None:
+    def __init__(
+        self,
+        id,
+        writer: Optional[LedgerWriter] = None,
+        checkpoint_interval: Optional[int] = 1000,
+        executor: Optional[ParallelExecutor] = None,
+        durability: Optional[str] = DurabilityPolicy.FLUSH,
+    ) -> None:
         """
 
         Args:
             id:
+            writer: Writer used to persist commits, defaults to a writer on
+                ``ledger-pid-<id>`` that also appends every block to the
+                binary store in ``ledger-pid-<id>.store``.
+            checkpoint_interval: Number of committed blocks between
+                checkpoints, 0 disables checkpointing.
+            executor: Executes the transactions of large blocks in parallel,
+                blocks are executed serially if None.
+            durability: DurabilityPolicy of the default writer. Under
+                DurabilityPolicy.FSYNC client replies wait until the block
+                committing their transaction is on disk.
         """
+        # Committed blocks from height base_height onwards, older blocks are
+        # only kept in the binary store once a checkpoint covers them
         self.ledger: List[CommittedBlock] = []
+        self.base_height = 0
+        # Map of block-id to ledger height
+        self.block_heights: Dict[str, int] = {}
+        # Map of transaction-id to ledger height of the block that committed it
+        self.transaction_heights: Dict[str, int] = {}
         # Map of state-id to Pending block
         self.speculate_states: Dict[str, str] = {}
+        # Map of round to the ids of the blocks speculated in it, for GC
+        self.speculate_rounds: Dict[int, List[str]] = {}
+        # Map of block-id to the QC that committed it, for in-memory blocks
+        self.commit_qcs: Dict[str, QuorumCertificate] = {}
+        # Committed key-value state and the overlays of pending blocks
+        self.state_machine = StateMachine(executor)
         self.id = id
+        self.writer = (
+            writer
+            if writer
+            else LedgerWriter(
+                "ledger-pid-" + str(id),
+                durability,
+                # The in-memory ledger always starts empty, so the store does too
+                store=LedgerStoreWriter("ledger-pid-" + str(id) + ".store", reset=True),
+            )
+        )
+        self.replies_wait_durable = self.writer.policy == DurabilityPolicy.FSYNC
+        # Number of committed blocks on disk, set from the writer thread
+        self.durable_height = 0
+        # Called with the committed transaction ids once they are durable
+        self.on_durable: Optional[Callable[[List[str]], None]] = None
+        self.checkpoint_interval = checkpoint_interval
+        self.last_commit_qc: Optional[QuorumCertificate] = None
+        self.last_checkpoint: Optional[Checkpoint] = None
+        # Set from the writer thread once a checkpoint is on disk
+        self.durable_checkpoint: Optional[Checkpoint] = None
+        self.store_reader: Optional[LedgerStoreReader] = None
 
-    def speculate(self, block_id: str, txns: List[Transaction]) -> int:
-        """
+    def speculate(
+        self,
+        block_id: str,
+        txns: List[Transaction],
+        payload_digest: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        round: Optional[int] = None,
+    ) -> str:
+        """Execute a pending block on top of the speculative state of its parent.
 
         Args:
             block_id:
             txns:
+            payload_digest: Block.payload_digest() of txns if already known.
+            parent_id: Id of the block certified by the block's QC.
+            round: Round of the block, the state is kept until it is
+                collected by collect_garbage if given.
 
         Returns:
-
+            The speculative state id of the block.
         """
-        txns = ",".join([trx.command for trx in txns])
-        commit_state_id = (
-            self.ledger[-1].commit_state_id if len(self.ledger) > 0 else ""
+        self.speculate_states[block_id] = self.state_machine.execute(
+            block_id, parent_id, txns, payload_digest
         )
-        self.speculate_states[block_id] = hash(str(commit_state_id) + txns)
+        if round is not None:
+            self.speculate_rounds.setdefault(round, []).append(block_id)
+        return self.speculate_states[block_id]
+
+    def abandon(self, blocks: List[Block]) -> None:
+        """Drop the speculative state of blocks pruned from the block tree.
+
+        Args:
+            blocks:
+
+        Returns:
+
+        """
+        for block in blocks:
+            self.state_machine.drop(block.id)
+            self.speculate_states.pop(block.id, None)
+
+    def collect_garbage(self, committed_round: int) -> int:
+        """Drop the speculative state of every block below the committed round.
+
+        Such blocks are either committed or on a branch that can no longer
+        be committed.
+
+        Args:
+            committed_round:
+
+        Returns:
+            Number of evicted entries.
+        """
+        evicted = 0
+        stale = [round for round in self.speculate_rounds if round < committed_round]
+        for round in stale:
+            for block_id in self.speculate_rounds.pop(round):
+                self.state_machine.drop(block_id)
+                if self.speculate_states.pop(block_id, None) is not None:
+                    evicted += 1
+        return evicted
+
+    def memory_gauges(self) -> Dict[str, int]:
+        """
+
+        Returns:
+            Sizes of the speculative state and in-memory ledger.
+        """
+        return {
+            "speculate_states": len(self.speculate_states),
+            "state_overlays": len(self.state_machine.overlays),
+            "overlay_writes": self.state_machine.pending_writes(),
+            "committed_keys": len(self.state_machine),
+            "ledger_blocks": len(self.ledger),
+            "commit_qcs": len(self.commit_qcs),
+        }
 
     def get_pending_state(self, block_id: str) -> Union[int, None]:
         """
@@ -46,41 +173,238 @@ class Ledger:
         """
         return self.speculate_states[block_id]
 
-    def commit(self, block_id: str, block_tree: BlockTree):
+    def commit(
+        self,
+        block_id: str,
+        block_tree: BlockTree,
+        qc: Optional[QuorumCertificate] = None,
+    ):
         """
 
         Args:
             block_id:
             block_tree:
+            qc: The QC certifying the block, recorded in checkpoints and
+                commit proofs.
 
         Returns:
 
         """
+        if qc is not None:
+            self.last_commit_qc = qc
         block_to_commit = block_tree.pending_block_tree.find(block_id)
+        self.state_machine.commit(block_id)
+        record = None
         if block_to_commit.payload:
-            self.ledger.append(
-                CommittedBlock(block_to_commit, self.get_pending_state(block_id))
+            committed_block = CommittedBlock(
+                block_to_commit, self.get_pending_state(block_id)
             )
+            record = (self._append(committed_block), committed_block)
+            if qc is not None:
+                self.commit_qcs[block_id] = qc
         transactions_to_dq = list(trx.id for trx in block_to_commit.payload)
 
         logger.info(
             "Committed transactions {} proposed by Leader {} in round {} in Validator {}".format(
-                list(trx.command for trx in self.ledger[-1].block.payload),
-                self.ledger[-1].block.author,
-                self.ledger[-1].block.round,
+                list(trx.command for trx in block_to_commit.payload),
+                block_to_commit.author,
+                block_to_commit.round,
                 self.id,
             )
         )
 
-        with open("ledger-pid-" + str(self.id), "a") as ledger_file:
-            commands = []
-            for txn in block_to_commit.payload:
-                commands.append(txn.command + "\n")
-            ledger_file.writelines(commands)
-            ledger_file.flush()
+        commands = "".join(txn.command + "\n" for txn in block_to_commit.payload)
+        self.writer.submit(
+            commands.encode("utf-8"),
+            partial(
+                self._mark_durable,
+                record[0] + 1 if record else None,
+                transactions_to_dq,
+            ),
+            record,
+        )
+
+        durable_checkpoint = self.durable_checkpoint
+        if durable_checkpoint and durable_checkpoint.height > self.base_height:
+            self._truncate(durable_checkpoint.height)
+        if (
+            record
+            and self.checkpoint_interval
+            and (record[0] + 1) % self.checkpoint_interval == 0
+        ):
+            self.checkpoint()
         return transactions_to_dq
 
-    def get_committed_block(self, block_id: str) -> CommittedBlock:
+    def _mark_durable(self, height: Optional[int], trx_ids: List[str]) -> None:
+        """
+
+        Args:
+            height: Ledger height once the block is durable, None if the
+                block is empty.
+            trx_ids: Transactions committed by the block.
+
+        Returns:
+
+        """
+        if height is not None and height > self.durable_height:
+            self.durable_height = height
+        if self.on_durable:
+            self.on_durable(trx_ids)
+
+    def is_durable(self, trx_id: str) -> bool:
+        """
+
+        Args:
+            trx_id: A committed transaction.
+
+        Returns:
+            True if the block committing the transaction is durable, or the
+            transaction is no longer held in memory.
+        """
+        height = self.transaction_heights.get(trx_id)
+        return height is None or height < self.durable_height
+
+    def checkpoint(self) -> Optional[Checkpoint]:
+        """Record a checkpoint at the tip of the ledger.
+
+        The checkpoint is written to the binary store once every block up to
+        it is durable. From then on the in-memory ledger drops the blocks
+        below it, and they are served from the store instead.
+
+        Returns:
+
+        """
+        if not self.ledger:
+            return None
+        tip = self.ledger[-1]
+        checkpoint = Checkpoint(
+            self.height() - 1,
+            tip.block.id,
+            tip.block.round,
+            tip.commit_state_id,
+            self.last_commit_qc,
+        )
+        self.last_checkpoint = checkpoint
+        if self.writer.store is not None:
+            # Flushed under every policy, the store must hold the blocks the
+            # checkpoint drops from memory
+            self.writer.submit(
+                b"",
+                partial(self._write_checkpoint, self.writer.store.path, checkpoint),
+                flush=True,
+            )
+        return checkpoint
+
+    def _write_checkpoint(self, path: str, checkpoint: Checkpoint) -> None:
+        """
+
+        Args:
+            path:
+            checkpoint:
+
+        Returns:
+
+        """
+        write_checkpoint(path, checkpoint)
+        self.durable_checkpoint = checkpoint
+
+    def _truncate(self, height: int) -> None:
+        """Drop the in-memory blocks below ``height``.
+
+        Args:
+            height:
+
+        Returns:
+
+        """
+        drop = height - self.base_height
+        for committed_block in self.ledger[:drop]:
+            self.block_heights.pop(committed_block.block.id, None)
+            self.speculate_states.pop(committed_block.block.id, None)
+            self.commit_qcs.pop(committed_block.block.id, None)
+            for trx in committed_block.block.payload:
+                self.transaction_heights.pop(trx.id, None)
+        del self.ledger[:drop]
+        self.base_height = height
+
+    def _ensure_reader(self, height: int) -> Optional[LedgerStoreReader]:
+        """
+
+        Args:
+            height: A height below base_height the reader must cover.
+
+        Returns:
+            The reader over the binary store, None if the writer has none.
+        """
+        if self.writer.store is None:
+            return None
+        if self.store_reader is None:
+            self.store_reader = LedgerStoreReader(self.writer.store.path)
+        if len(self.store_reader) <= height:
+            self.store_reader.refresh()
+        return self.store_reader
+
+    def _stored_block(self, height: int) -> Optional[CommittedBlock]:
+        """
+
+        Args:
+            height: A height below base_height.
+
+        Returns:
+
+        """
+        reader = self._ensure_reader(height)
+        return None if reader is None else reader.read(height)
+
+    def open_store_reader(self) -> Optional[LedgerStoreReader]:
+        """
+
+        Returns:
+            Memory-mapped reader over the binary store, if the writer has one.
+        """
+        if self.writer.store is None:
+            return None
+        self.writer.sync()
+        return LedgerStoreReader(self.writer.store.path)
+
+    def close(self) -> None:
+        """Write out every pending commit and stop the ledger writer.
+
+        Returns:
+
+        """
+        self.writer.close()
+        if self.state_machine.executor is not None:
+            self.state_machine.executor.close()
+        if self.store_reader is not None:
+            self.store_reader.close()
+            self.store_reader = None
+
+    def _append(self, committed_block: CommittedBlock) -> int:
+        """
+
+        Args:
+            committed_block:
+
+        Returns:
+            Height at which the block was committed.
+        """
+        height = self.base_height + len(self.ledger)
+        self.ledger.append(committed_block)
+        self.block_heights[committed_block.block.id] = height
+        for trx in committed_block.block.payload:
+            self.transaction_heights[trx.id] = height
+        return height
+
+    def height(self) -> int:
+        """
+
+        Returns:
+            Number of committed blocks in the ledger.
+        """
+        return self.base_height + len(self.ledger)
+
+    def get_block_height(self, block_id: str) -> Optional[int]:
         """
 
         Args:
@@ -89,9 +413,110 @@ class Ledger:
         Returns:
 
         """
-        for block in self.ledger:
-            if block.block.id == block_id:
-                return block
+        return self.block_heights.get(block_id)
+
+    def get_transaction_height(self, trx_id: str) -> Optional[int]:
+        """
+
+        Args:
+            trx_id:
+
+        Returns:
+
+        """
+        return self.transaction_heights.get(trx_id)
+
+    def get_block_at_height(self, height: int) -> Optional[CommittedBlock]:
+        """
+
+        Args:
+            height:
+
+        Returns:
+
+        """
+        if self.base_height <= height < self.height():
+            return self.ledger[height - self.base_height]
+        if 0 <= height < self.base_height:
+            return self._stored_block(height)
+        return None
+
+    def get_committed_block(self, block_id: str) -> Optional[CommittedBlock]:
+        """
+
+        Args:
+            block_id:
+
+        Returns:
+
+        """
+        height = self.block_heights.get(block_id)
+        if height is not None:
+            return self.ledger[height - self.base_height]
+        if self.base_height == 0:
+            return None
+        reader = self._ensure_reader(self.base_height - 1)
+        if reader is None:
+            return None
+        height = reader.height_of(block_id)
+        return None if height is None else reader.read(height)
+
+    def get_commit_state_id(self, block_id: str) -> Optional[str]:
+        """
+
+        Args:
+            block_id: A committed block.
+
+        Returns:
+            The state id committed by the block. Empty blocks are not kept in
+            the ledger, their committed state is the one speculated for them.
+        """
+        committed_block = self.get_committed_block(block_id)
+        if committed_block is not None:
+            return committed_block.commit_state_id
+        return self.speculate_states.get(block_id)
+
+    def get_transaction_block(self, trx_id: str) -> Optional[CommittedBlock]:
+        """
+
+        Args:
+            trx_id:
+
+        Returns:
+
+        """
+        height = self.transaction_heights.get(trx_id)
+        if height is not None:
+            return self.ledger[height - self.base_height]
+        if self.base_height == 0:
+            return None
+        # Blocks below a durable checkpoint are only kept in the store
+        reader = self._ensure_reader(self.base_height - 1)
+        if reader is None:
+            return None
+        height = reader.height_of_transaction(trx_id)
+        return None if height is None else reader.read(height)
+
+    def get_commit_qc(self, block_id: str) -> Optional[QuorumCertificate]:
+        """
+
+        Args:
+            block_id:
+
+        Returns:
+            The QC that committed the block, while it is held in memory.
+        """
+        return self.commit_qcs.get(block_id)
+
+    def iter_blocks(self) -> Iterator[CommittedBlock]:
+        """
+
+        Returns:
+            Every committed block, reading truncated ones from the store.
+        """
+        for height in range(self.base_height):
+            yield self._stored_block(height)
+        yield from self.ledger
 
     def display(self):
         """
@@ -99,4 +524,6 @@ class Ledger:
         Returns:
 
         """
-        return list(([trx.command for trx in cb.block.payload] for cb in self.ledger))
+        return list(
+            ([trx.command for trx in cb.block.payload] for cb in self.iter_blocks())
+        )
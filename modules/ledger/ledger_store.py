@@ -0,0 +1,733 @@
+"""
+Binary segmented ledger format.
+
+A store is a directory holding rolling segment files and two sidecar indexes:
+
+    segment-000000.log, segment-000001.log, ...   block records
+    index                                         one entry per ledger height
+    trx-index                                     one entry per transaction
+    segment-000000.ids, segment-000000.trx, ...   lookup tables of full segments
+
+A record is a fixed header followed by the encoded CommittedBlock:
+
+    length:u32  height:u64  round:i64  crc32:u32  body[length]
+
+An index entry locates the record of a height and carries a digest of the
+block id, so blocks can be found by id without decoding the segments:
+
+    segment:u32  offset:u64  length:u32  id_digest[32]
+
+A transaction index entry maps a digest of a transaction id to the height of
+the block committing it, in commit order:
+
+    trx_digest[32]  height:u64
+
+Once a segment is full, the block id and transaction digests of its blocks
+are written as two tables of the same entries sorted by digest, which readers
+binary search in place. Only the blocks of the segment being written are
+looked up from memory, so readers stay bounded by the segment size.
+
+Records are written before their transaction and index entries, so an index
+entry never points past the data that was written before it. The latest
+durable checkpoint is kept next to them in ``checkpoint``.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import zlib
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from modules.codec.codec import decode, encode
+from modules.objects import Checkpoint, CommittedBlock
+
+RECORD_HEADER = struct.Struct(">IQqI")
+INDEX_ENTRY = struct.Struct(">IQI32s")
+KEY_ENTRY = struct.Struct(">32sQ")
+SEGMENT_FORMAT = "segment-{:06d}.log"
+ID_TABLE_FORMAT = "segment-{:06d}.ids"
+TRX_TABLE_FORMAT = "segment-{:06d}.trx"
+INDEX_FILE = "index"
+TRX_INDEX_FILE = "trx-index"
+CHECKPOINT_FILE = "checkpoint"
+
+
+def block_id_digest(block_id: Any) -> bytes:
+    """
+
+    Args:
+        block_id:
+
+    Returns:
+        Fixed width digest of the block id used in the index.
+    """
+    return hashlib.sha256(str(block_id).encode("utf-8")).digest()
+
+
+def transaction_id_digest(trx_id: str) -> bytes:
+    """
+
+    Args:
+        trx_id:
+
+    Returns:
+        Fixed width digest of the transaction id used in the indexes.
+    """
+    return hashlib.sha256(str(trx_id).encode("utf-8")).digest()
+
+
+def write_table(path: str, entries: List[Tuple[bytes, int]], fsync: bool) -> None:
+    """Atomically write a lookup table of ``(digest, height)`` entries.
+
+    Args:
+        path:
+        entries:
+        fsync: Fsync the table before it replaces any previous one.
+
+    Returns:
+
+    """
+    with open(path + ".tmp", "wb") as table_file:
+        table_file.write(
+            b"".join(
+                KEY_ENTRY.pack(digest, height) for digest, height in sorted(entries)
+            )
+        )
+        table_file.flush()
+        if fsync:
+            os.fsync(table_file.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def search_table(table: Optional[mmap.mmap], digest: bytes) -> Optional[int]:
+    """
+
+    Args:
+        table: Lookup table written by write_table, None if it is empty.
+        digest:
+
+    Returns:
+        Height stored for ``digest``, or None if it is not in the table.
+    """
+    if table is None:
+        return None
+    low, high = 0, len(table) // KEY_ENTRY.size
+    while low < high:
+        middle = (low + high) // 2
+        key, height = KEY_ENTRY.unpack_from(table, middle * KEY_ENTRY.size)
+        if key < digest:
+            low = middle + 1
+        elif key > digest:
+            high = middle
+        else:
+            return height
+    return None
+
+
+def map_file(path: str) -> Optional[mmap.mmap]:
+    """
+
+    Args:
+        path:
+
+    Returns:
+        Read-only map of the file, None if it is empty.
+    """
+    with open(path, "rb") as mapped_file:
+        if not os.fstat(mapped_file.fileno()).st_size:
+            return None
+        return mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def truncate_entries(index_file, entry_size: int) -> int:
+    """Drop a torn entry at the end of an index file.
+
+    Args:
+        index_file: Index opened for appending.
+        entry_size:
+
+    Returns:
+        Number of whole entries in the index.
+    """
+    index_file.seek(0, os.SEEK_END)
+    size = index_file.tell()
+    count = size // entry_size
+    if size != count * entry_size:
+        index_file.truncate(count * entry_size)
+    return count
+
+
+def find_first(count: int, key: Callable[[int], int], target: int) -> int:
+    """
+
+    Args:
+        count:
+        key: Non-decreasing over ``range(count)``.
+        target:
+
+    Returns:
+        The first position in ``range(count)`` whose key is at least target,
+        count if there is none.
+    """
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        if key(middle) < target:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def encode_block(committed_block: CommittedBlock) -> bytes:
+    """
+
+    Args:
+        committed_block:
+
+    Returns:
+
+    """
+    return encode(committed_block)
+
+
+def decode_block(body: bytes) -> CommittedBlock:
+    """
+
+    Args:
+        body:
+
+    Returns:
+
+    """
+    return decode(body, allow_pickle=True)
+
+
+def write_checkpoint(path: str, checkpoint: Checkpoint) -> None:
+    """Atomically replace the checkpoint of the store in ``path``.
+
+    Args:
+        path:
+        checkpoint:
+
+    Returns:
+
+    """
+    checkpoint_path = os.path.join(path, CHECKPOINT_FILE)
+    with open(checkpoint_path + ".tmp", "wb") as checkpoint_file:
+        checkpoint_file.write(encode(checkpoint))
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+
+def read_checkpoint(path: str) -> Optional[Checkpoint]:
+    """
+
+    Args:
+        path:
+
+    Returns:
+
+    """
+    checkpoint_path = os.path.join(path, CHECKPOINT_FILE)
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, "rb") as checkpoint_file:
+        return decode(checkpoint_file.read(), allow_pickle=True)
+
+
+class LedgerStoreWriter:
+    """Appends committed blocks to a binary segmented ledger store."""
+
+    def __init__(
+        self,
+        path: str,
+        segment_size: Optional[int] = 64 << 20,
+        reset: Optional[bool] = False,
+        fsync_on_roll: Optional[bool] = False,
+    ) -> None:
+        """
+
+        Args:
+            path: Directory holding the segments and the indexes.
+            segment_size: Size after which a new segment file is started.
+            reset: Discard any blocks already in the store.
+            fsync_on_roll: Fsync the full segment, the indexes and the lookup
+                tables before the segment is closed, set when writing under
+                the fsync policy.
+        """
+        self.path = path
+        self.segment_size = segment_size
+        self.fsync_on_roll = fsync_on_roll
+        os.makedirs(path, exist_ok=True)
+        if reset:
+            for name in os.listdir(path):
+                if name in (
+                    INDEX_FILE,
+                    TRX_INDEX_FILE,
+                    CHECKPOINT_FILE,
+                ) or name.startswith("segment-"):
+                    os.remove(os.path.join(path, name))
+
+        self.index_file = open(os.path.join(path, INDEX_FILE), "a+b")
+        self.trx_index_file = open(os.path.join(path, TRX_INDEX_FILE), "a+b")
+        # Digests of the blocks and transactions of the open segment, written
+        # as its lookup tables when it is full
+        self.segment_ids: List[Tuple[bytes, int]] = []
+        self.segment_trx: List[Tuple[bytes, int]] = []
+        self.height = self._recover()
+        self.segment_file = open(self._segment_path(self.segment), "ab")
+        self.offset = self.segment_file.tell()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, SEGMENT_FORMAT.format(segment))
+
+    def _recover(self) -> int:
+        """Drop torn writes left behind by a crash, and write the lookup
+        tables of the full segments that are missing them.
+
+        Returns:
+            Number of blocks in the store.
+        """
+        count = truncate_entries(self.index_file, INDEX_ENTRY.size)
+        trx_count = truncate_entries(self.trx_index_file, KEY_ENTRY.size)
+        index = map_file(os.path.join(self.path, INDEX_FILE))
+        trx_index = map_file(os.path.join(self.path, TRX_INDEX_FILE))
+        try:
+            # Entries of a block whose index entry was not written
+            trx_count = find_first(
+                trx_count,
+                lambda position: KEY_ENTRY.unpack_from(
+                    trx_index, position * KEY_ENTRY.size
+                )[1],
+                count,
+            )
+
+            self.segment = 0
+            if count:
+                segment, offset, length, _ = INDEX_ENTRY.unpack_from(
+                    index, (count - 1) * INDEX_ENTRY.size
+                )
+                self.segment = segment
+                segment_path = self._segment_path(segment)
+                end = offset + RECORD_HEADER.size + length
+                if os.path.getsize(segment_path) > end:
+                    with open(segment_path, "r+b") as segment_file:
+                        segment_file.truncate(end)
+            elif os.path.exists(self._segment_path(0)):
+                with open(self._segment_path(0), "r+b") as segment_file:
+                    segment_file.truncate(0)
+
+            for segment in range(self.segment + 1):
+                full = segment < self.segment
+                if full and os.path.exists(
+                    os.path.join(self.path, ID_TABLE_FORMAT.format(segment))
+                ):
+                    continue
+                ids, trx = self._segment_keys(
+                    segment, count, index, trx_count, trx_index
+                )
+                if full:
+                    self._write_tables(segment, ids, trx)
+                else:
+                    self.segment_ids, self.segment_trx = ids, trx
+        finally:
+            for mapped in (index, trx_index):
+                if mapped is not None:
+                    mapped.close()
+        self.trx_index_file.truncate(trx_count * KEY_ENTRY.size)
+        self.trx_index_file.seek(0, os.SEEK_END)
+        return count
+
+    def _segment_keys(
+        self,
+        segment: int,
+        count: int,
+        index: Optional[mmap.mmap],
+        trx_count: int,
+        trx_index: Optional[mmap.mmap],
+    ) -> Tuple[List[Tuple[bytes, int]], List[Tuple[bytes, int]]]:
+        """
+
+        Args:
+            segment:
+            count: Entries in index.
+            index:
+            trx_count: Entries in trx_index.
+            trx_index:
+
+        Returns:
+            The block id and transaction digests of the blocks in segment,
+            read from the indexes.
+        """
+
+        def entry_segment(height: int) -> int:
+            return INDEX_ENTRY.unpack_from(index, height * INDEX_ENTRY.size)[0]
+
+        def trx_height(position: int) -> int:
+            return KEY_ENTRY.unpack_from(trx_index, position * KEY_ENTRY.size)[1]
+
+        start = find_first(count, entry_segment, segment)
+        stop = find_first(count, entry_segment, segment + 1)
+        ids = [
+            (INDEX_ENTRY.unpack_from(index, height * INDEX_ENTRY.size)[3], height)
+            for height in range(start, stop)
+        ]
+        trx = [
+            KEY_ENTRY.unpack_from(trx_index, position * KEY_ENTRY.size)
+            for position in range(
+                find_first(trx_count, trx_height, start),
+                find_first(trx_count, trx_height, stop),
+            )
+        ]
+        return ids, trx
+
+    def append(self, height: int, committed_block: CommittedBlock) -> None:
+        """
+
+        Args:
+            height: Ledger height of the block, must be the next one in the store.
+            committed_block:
+
+        Returns:
+
+        """
+        if height != self.height:
+            raise ValueError(
+                "Ledger store expected height {} but got {}".format(self.height, height)
+            )
+        if self.offset >= self.segment_size:
+            self._roll()
+
+        body = encode_block(committed_block)
+        block = committed_block.block
+        self.segment_file.write(
+            RECORD_HEADER.pack(len(body), height, block.round, zlib.crc32(body))
+        )
+        self.segment_file.write(body)
+        for trx in block.payload:
+            digest = transaction_id_digest(trx.id)
+            self.trx_index_file.write(KEY_ENTRY.pack(digest, height))
+            self.segment_trx.append((digest, height))
+        id_digest = block_id_digest(block.id)
+        self.index_file.write(
+            INDEX_ENTRY.pack(self.segment, self.offset, len(body), id_digest)
+        )
+        self.segment_ids.append((id_digest, height))
+        self.offset += RECORD_HEADER.size + len(body)
+        self.height += 1
+
+    def _write_tables(
+        self,
+        segment: int,
+        ids: List[Tuple[bytes, int]],
+        trx: List[Tuple[bytes, int]],
+    ) -> None:
+        # The id table goes last, a segment with one has both
+        write_table(
+            os.path.join(self.path, TRX_TABLE_FORMAT.format(segment)),
+            trx,
+            self.fsync_on_roll,
+        )
+        write_table(
+            os.path.join(self.path, ID_TABLE_FORMAT.format(segment)),
+            ids,
+            self.fsync_on_roll,
+        )
+
+    def _roll(self) -> None:
+        # Later fsyncs only reach the open segment
+        if self.fsync_on_roll:
+            self.fsync()
+        self._write_tables(self.segment, self.segment_ids, self.segment_trx)
+        self.segment_ids, self.segment_trx = [], []
+        self.segment_file.close()
+        self.segment += 1
+        self.segment_file = open(self._segment_path(self.segment), "ab")
+        self.offset = 0
+
+    def flush(self) -> None:
+        self.segment_file.flush()
+        self.trx_index_file.flush()
+        self.index_file.flush()
+
+    def fsync(self) -> None:
+        self.flush()
+        os.fsync(self.segment_file.fileno())
+        os.fsync(self.trx_index_file.fileno())
+        os.fsync(self.index_file.fileno())
+
+    def close(self) -> None:
+        self.flush()
+        self.segment_file.close()
+        self.trx_index_file.close()
+        self.index_file.close()
+
+
+class LedgerStoreReader:
+    """Memory-mapped reader over a binary segmented ledger store."""
+
+    def __init__(self, path: str) -> None:
+        """
+
+        Args:
+            path: Directory holding the segments and the indexes.
+        """
+        self.path = path
+        self.index: Optional[mmap.mmap] = None
+        self.trx_index: Optional[mmap.mmap] = None
+        self.count = 0
+        self.segments: Dict[int, mmap.mmap] = {}
+        # Lookup tables of the full segments, by segment
+        self.id_tables: List[Optional[mmap.mmap]] = []
+        self.trx_tables: List[Optional[mmap.mmap]] = []
+        # Digests of the blocks from tail_start on, which no table covers yet,
+        # indexed up to tail_indexed and trx_position on first use
+        self.tail_start = 0
+        self.tail_ids: Dict[bytes, int] = {}
+        self.tail_trx: Dict[bytes, int] = {}
+        self.tail_indexed = 0
+        self.trx_position = 0
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Pick up blocks appended since the reader was opened.
+
+        Returns:
+
+        """
+        index_path = os.path.join(self.path, INDEX_FILE)
+        size = os.path.getsize(index_path) if os.path.exists(index_path) else 0
+        count = size // INDEX_ENTRY.size
+        if count == self.count:
+            return
+        if self.index is not None:
+            self.index.close()
+        with open(index_path, "rb") as index_file:
+            self.index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.trx_index is not None:
+            self.trx_index.close()
+        self.trx_index = map_file(os.path.join(self.path, TRX_INDEX_FILE))
+        for segment in self.segments.values():
+            segment.close()
+        self.segments = {}
+        self.count = count
+
+        while os.path.exists(
+            os.path.join(self.path, ID_TABLE_FORMAT.format(len(self.id_tables)))
+        ):
+            segment = len(self.id_tables)
+            self.trx_tables.append(
+                map_file(os.path.join(self.path, TRX_TABLE_FORMAT.format(segment)))
+            )
+            self.id_tables.append(
+                map_file(os.path.join(self.path, ID_TABLE_FORMAT.format(segment)))
+            )
+        tail_start = find_first(
+            count, lambda height: self._entry(height)[0], len(self.id_tables)
+        )
+        if tail_start > self.tail_start:
+            self.tail_start = tail_start
+            self.tail_ids = {
+                digest: height
+                for digest, height in self.tail_ids.items()
+                if height >= tail_start
+            }
+            self.tail_trx = {
+                digest: height
+                for digest, height in self.tail_trx.items()
+                if height >= tail_start
+            }
+            self.tail_indexed = max(self.tail_indexed, tail_start)
+            self.trx_position = max(
+                self.trx_position,
+                find_first(
+                    len(self.trx_index) // KEY_ENTRY.size if self.trx_index else 0,
+                    lambda position: KEY_ENTRY.unpack_from(
+                        self.trx_index, position * KEY_ENTRY.size
+                    )[1],
+                    tail_start,
+                ),
+            )
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _entry(self, height: int):
+        if not 0 <= height < self.count:
+            raise IndexError("Height {} not in ledger store".format(height))
+        return INDEX_ENTRY.unpack_from(self.index, height * INDEX_ENTRY.size)
+
+    def _segment(self, segment: int) -> mmap.mmap:
+        if segment not in self.segments:
+            segment_path = os.path.join(self.path, SEGMENT_FORMAT.format(segment))
+            with open(segment_path, "rb") as segment_file:
+                self.segments[segment] = mmap.mmap(
+                    segment_file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+        return self.segments[segment]
+
+    def read_raw(self, height: int) -> memoryview:
+        """
+
+        Args:
+            height:
+
+        Returns:
+            Encoded block at ``height``, without copying it out of the segment.
+        """
+        segment, offset, length, _ = self._entry(height)
+        data = self._segment(segment)
+        body_length, record_height, _, crc = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        body = memoryview(data)[start : start + body_length]
+        if body_length != length or record_height != height or zlib.crc32(body) != crc:
+            raise ValueError("Corrupt ledger record at height {}".format(height))
+        return body
+
+    def read(self, height: int) -> CommittedBlock:
+        """
+
+        Args:
+            height:
+
+        Returns:
+
+        """
+        body = self.read_raw(height)
+        try:
+            return decode_block(body)
+        finally:
+            body.release()
+
+    def read_round(self, height: int) -> int:
+        """
+
+        Args:
+            height:
+
+        Returns:
+            Round of the block at ``height``, read from the record header only.
+        """
+        segment, offset, _, _ = self._entry(height)
+        return RECORD_HEADER.unpack_from(self._segment(segment), offset)[2]
+
+    def _index_tail(self) -> None:
+        """Add the digests of the blocks appended since the last lookup.
+
+        Returns:
+
+        """
+        for height in range(self.tail_indexed, self.count):
+            self.tail_ids[self._entry(height)[3]] = height
+        self.tail_indexed = max(self.tail_indexed, self.count)
+        trx_count = len(self.trx_index) // KEY_ENTRY.size if self.trx_index else 0
+        while self.trx_position < trx_count:
+            digest, height = KEY_ENTRY.unpack_from(
+                self.trx_index, self.trx_position * KEY_ENTRY.size
+            )
+            if height >= self.count:
+                break
+            self.tail_trx[digest] = height
+            self.trx_position += 1
+
+    def _lookup(
+        self, digest: bytes, tail: Dict[bytes, int], tables: List[Optional[mmap.mmap]]
+    ) -> Optional[int]:
+        """
+
+        Args:
+            digest:
+            tail: Digests of the blocks no table covers.
+            tables: Lookup tables of the full segments.
+
+        Returns:
+            Height stored for ``digest``, None if it is not below count.
+        """
+        self._index_tail()
+        height = tail.get(digest)
+        if height is None:
+            for table in reversed(tables):
+                height = search_table(table, digest)
+                if height is not None:
+                    break
+        # Tables can be written before the reader picks up their blocks
+        return height if height is not None and height < self.count else None
+
+    def height_of(self, block_id: Any) -> Optional[int]:
+        """
+
+        Args:
+            block_id:
+
+        Returns:
+            Height of the block, or None if it is not in the store.
+        """
+        return self._lookup(block_id_digest(block_id), self.tail_ids, self.id_tables)
+
+    def height_of_transaction(self, trx_id: str) -> Optional[int]:
+        """
+
+        Args:
+            trx_id:
+
+        Returns:
+            Height of the block committing the transaction, or None if it is
+            not in the store.
+        """
+        return self._lookup(
+            transaction_id_digest(trx_id), self.tail_trx, self.trx_tables
+        )
+
+    def find(self, block_id: Any) -> Optional[CommittedBlock]:
+        """
+
+        Args:
+            block_id:
+
+        Returns:
+
+        """
+        height = self.height_of(block_id)
+        return None if height is None else self.read(height)
+
+    def iter_range(
+        self, start: int, stop: Optional[int] = None
+    ) -> Iterator[CommittedBlock]:
+        """Stream blocks in ``[start, stop)`` one at a time.
+
+        Args:
+            start:
+            stop: Defaults to the end of the store.
+
+        Returns:
+
+        """
+        stop = self.count if stop is None else min(stop, self.count)
+        for height in range(max(start, 0), stop):
+            yield self.read(height)
+
+    def segment_files(self) -> List[str]:
+        return sorted(
+            name
+            for name in os.listdir(self.path)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+
+    def close(self) -> None:
+        for segment in self.segments.values():
+            segment.close()
+        self.segments = {}
+        for table in self.id_tables + self.trx_tables:
+            if table is not None:
+                table.close()
+        self.id_tables, self.trx_tables = [], []
+        for mapped in (self.index, self.trx_index):
+            if mapped is not None:
+                mapped.close()
+        self.index, self.trx_index = None, None
+        self.count = 0
+        self.tail_start, self.tail_indexed, self.trx_position = 0, 0, 0
+        self.tail_ids, self.tail_trx = {}, {}
@@ -0,0 +1,248 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+from modules.ledger.ledger_store import LedgerStoreWriter
+
+logger = logging.getLogger(__name__)
+
+
+class DurabilityPolicy:
+    NONE = "none"  # Hand the write to the OS buffer only
+    FLUSH = "flush"  # Flush the python file buffer after every group
+    FSYNC = "fsync"  # Flush and fsync after every group
+
+
+class LedgerWriter:
+    """Background group-commit writer for the ledger file.
+
+    Commits are queued by the consensus handlers and written by a dedicated
+    thread. A group is closed once ``max_blocks`` commits are queued or
+    ``interval_ms`` have passed since its first commit, and is then written
+    with a single write call followed by the flush/fsync required by the
+    durability policy. When a binary ledger store is attached, the committed
+    blocks of the group are appended to it under the same policy. A group
+    holding a flush request is flushed whatever the policy.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        path: str,
+        policy: Optional[str] = DurabilityPolicy.FLUSH,
+        interval_ms: Optional[int] = 5,
+        max_blocks: Optional[int] = 64,
+        store: Optional[LedgerStoreWriter] = None,
+    ) -> None:
+        """
+
+        Args:
+            path: Ledger file the commits are appended to.
+            policy: One of the DurabilityPolicy values.
+            interval_ms: Longest time a commit waits for its group to fill up.
+            max_blocks: Largest number of commits written as one group.
+            store: Binary ledger store the committed blocks are appended to.
+        """
+        if policy not in (
+            DurabilityPolicy.NONE,
+            DurabilityPolicy.FLUSH,
+            DurabilityPolicy.FSYNC,
+        ):
+            raise ValueError("Unknown durability policy {}".format(policy))
+        self.path = path
+        self.policy = policy
+        self.interval_ms = interval_ms
+        self.max_blocks = max_blocks
+        self.store = store
+        if store is not None and policy == DurabilityPolicy.FSYNC:
+            # A group can roll the store over to a new segment
+            store.fsync_on_roll = True
+        self.queue: "queue.Queue" = queue.Queue()
+        self.groups_written = 0
+        self.blocks_written = 0
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """
+
+        Returns:
+
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="ledger-writer-" + self.path, daemon=True
+            )
+            self._thread.start()
+
+    def submit(
+        self,
+        data: bytes,
+        on_durable: Optional[Callable[[], None]] = None,
+        record: Optional[Tuple[int, Any]] = None,
+        flush: Optional[bool] = False,
+    ) -> None:
+        """Queue one commit for writing.
+
+        Args:
+            data: Encoded records of the committed block.
+            on_durable: Called from the writer thread once ``data`` has been
+                written according to the durability policy.
+            record: (height, CommittedBlock) to append to the binary store.
+            flush: Flush the ledger file and the store before ``on_durable``
+                is called, even under DurabilityPolicy.NONE.
+
+        Returns:
+
+        """
+        if self._thread is None:
+            self.start()
+        self.queue.put((data, on_durable, record, flush))
+
+    def sync(self) -> None:
+        """Block until every commit submitted so far has been written.
+
+        Returns:
+
+        """
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self.queue.put((b"", done.set, None, False))
+        done.wait()
+
+    def close(self) -> None:
+        """Write any queued commits and stop the writer thread.
+
+        Returns:
+
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            if self.store is not None:
+                self.store.close()
+            return
+        self.queue.put(self._STOP)
+        thread.join()
+
+    def _next_group(self) -> List:
+        """
+
+        Returns:
+            The commits making up the next group, possibly ending in _STOP.
+        """
+        group = [self.queue.get()]
+        if group[0] is self._STOP:
+            return group
+        deadline = time.monotonic() + self.interval_ms / 1000
+        while len(group) < self.max_blocks:
+            remaining = deadline - time.monotonic()
+            try:
+                item = (
+                    self.queue.get(timeout=remaining)
+                    if remaining > 0
+                    else self.queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+            group.append(item)
+            if item is self._STOP:
+                break
+        return group
+
+    def _run(self) -> None:
+        """
+
+        Returns:
+
+        """
+        with open(self.path, "ab") as ledger_file:
+            stop = False
+            while not stop:
+                group = self._next_group()
+                if group[-1] is self._STOP:
+                    group.pop()
+                    stop = True
+                if not group:
+                    continue
+
+                ledger_file.write(b"".join(data for data, _, _, _ in group))
+                if self.store is not None:
+                    for _, _, record, _ in group:
+                        if record is not None:
+                            self.store.append(*record)
+                if self.policy != DurabilityPolicy.NONE or any(
+                    flush for _, _, _, flush in group
+                ):
+                    ledger_file.flush()
+                    if self.store is not None:
+                        self.store.flush()
+                if self.policy == DurabilityPolicy.FSYNC:
+                    os.fsync(ledger_file.fileno())
+                    if self.store is not None:
+                        self.store.fsync()
+                self.groups_written += 1
+                self.blocks_written += sum(1 for data, _, _, _ in group if data)
+
+                for _, on_durable, _, _ in group:
+                    if on_durable is None:
+                        continue
+                    try:
+                        on_durable()
+                    except Exception:
+                        logger.exception("Ledger durability callback failed")
+            ledger_file.flush()
+        if self.store is not None:
+            self.store.close()
+
+
+class NullLedgerWriter:
+    """Writer that persists nothing, for simulations.
+
+    Commits are durable as soon as they are submitted, so ``on_durable`` is
+    called before submit returns.
+    """
+
+    def __init__(self) -> None:
+        self.path = None
+        self.policy = DurabilityPolicy.NONE
+        self.store = None
+        self.groups_written = 0
+        self.blocks_written = 0
+
+    def submit(
+        self,
+        data: bytes,
+        on_durable: Optional[Callable[[], None]] = None,
+        record: Optional[Tuple[int, Any]] = None,
+        flush: Optional[bool] = False,
+    ) -> None:
+        """
+
+        Args:
+            data:
+            on_durable:
+            record:
+            flush:
+
+        Returns:
+
+        """
+        self.groups_written += 1
+        if data:
+            self.blocks_written += 1
+        if on_durable is not None:
+            on_durable()
+
+    def sync(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
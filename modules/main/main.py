@@ -1,11 +1,14 @@
 import logging
-from typing import Dict, List, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 from modules.block_tree.block_tree import BlockTree
 from modules.leaderelection.leaderelection import LeaderElection
 from modules.ledger.ledger import Ledger
 from modules.mempool.mempool import MemPool
+from modules.merkle.merkle import make_batch_commit_proof
 from modules.objects import (
+    BatchCommitProof,
+    Block,
     Event,
     EventType,
     ProposalMessage,
@@ -53,6 +56,11 @@ class Main:
         self.u = None
         self.id = id
         self.round_done = False
+        self.gc_evicted = 0
+        # Proposals held back by the id of the block their QC certifies
+        self.orphan_proposals: Dict[str, List[ProposalMessage]] = {}
+        # Client id of committed transactions whose block is not durable yet
+        self.held_replies: Dict[str, int] = {}
 
     """
     Procedure process certificate qc(qc)
@@ -70,10 +78,25 @@ class Main:
         Returns:
 
         """
-        trx_to_dq = self.block_tree.process_qc(qc)
+        if not qc or not self.block_tree.is_known_block(qc):
+            return []
+        # Already applied QCs skip verification, commit, prune and round change,
+        # unless they elect a leader not elected yet
+        applied = self.block_tree.is_applied_qc(qc)
+        if applied and not self.leader_election.is_pending_election(qc):
+            return []
+        if not self.safety.verify_qc(qc):
+            logger.warning("Dropping QC with invalid signatures: {}".format(qc))
+            return []
+        # Before the commit prunes the ancestors of the certified block
+        self.leader_election.update_leaders(qc, self.block_tree)
+        if applied:
+            return []
+        trx_to_dq = self.block_tree.apply_qc(qc)
+        self.release_abandoned_trx()
 
-        # TODO Fix this self.leader_election.update_leaders(qc, self.pacemaker, self.ledger)
         self.pacemaker.advance_round_qc(qc)
+        self.collect_garbage()
 
         return trx_to_dq
 
@@ -106,7 +129,7 @@ class Main:
         trx_to_dq = []
         if proposal.block.qc:
             trx_to_dq = self.process_certificate_qc(proposal.block.qc)
-            self.process_certificate_qc(proposal.high_commit_qc)
+            trx_to_dq += self.process_certificate_qc(proposal.high_commit_qc)
         if proposal.last_round_tc:
             if not self.safety.verify_tc(proposal.last_round_tc):
                 return (None, trx_to_dq)
@@ -115,6 +138,19 @@ class Main:
         current_round = self.pacemaker.current_round
         leader = self.leader_election.get_leader(current_round)
 
+        if (
+            proposal.block.round < current_round
+            and proposal.sender_id == proposal.block.author
+            and proposal.block.author
+            == self.leader_election.get_leader(proposal.block.round)
+            and proposal.block.id not in self.block_tree.pending_block_tree
+        ):
+            # Too late to vote for, but the blocks of later rounds may extend
+            # it and their QCs are only applied once it is known
+            self.block_tree.execute_and_insert(proposal.block)
+            self.mempool.mark_in_flight(trx.id for trx in proposal.block.payload)
+            return (None, trx_to_dq)
+
         if (
             proposal.block.round != current_round
             or proposal.sender_id != leader
@@ -131,7 +167,10 @@ class Main:
         ):
             return (None, trx_to_dq)
 
-        self.block_tree.execute_and_insert(proposal.block)
+        # The leader already inserted its own block when it generated it
+        if proposal.block.id not in self.block_tree.pending_block_tree:
+            self.block_tree.execute_and_insert(proposal.block)
+        self.mempool.mark_in_flight(trx.id for trx in proposal.block.payload)
         vote_msg = self.safety.make_vote(
             proposal.block,
             proposal.last_round_tc,
@@ -142,9 +181,8 @@ class Main:
         if not vote_msg:
             return (None, trx_to_dq)
 
-        # TODO: Capture return value and send to leader election
-        # send vote_msg to LeaderElection.get_leader(round+1)
-        self.pacemaker.start_timer(self.pacemaker.current_round + 1)
+        # The caller sends vote_msg to LeaderElection.get_leader(round + 1), the
+        # round only advances once its QC or TC is known
         return (vote_msg, trx_to_dq)
 
     """
@@ -192,26 +230,45 @@ class Main:
             process new round event(tc)
     """
 
-    def process_timeout_msg(self, timeout_message: TimeoutMessage) -> ProposalMessage:
+    def process_timeout_msg(
+        self, timeout_message: TimeoutMessage
+    ) -> Tuple[Optional[ProposalMessage], List[str]]:
         """
 
         Args:
             timeout_message:
 
         Returns:
-
+            The proposal of this validator if the message formed a TC for a
+            round it leads, and the ids of the transactions committed by the
+            QCs of the message.
         """
-        self.process_certificate_qc(timeout_message.tmo_info.high_qc)
-        self.process_certificate_qc(timeout_message.high_commit_qc)
-        self.pacemaker.advance_round_tc(timeout_message.last_round_tc)
+        tmo_info = timeout_message.tmo_info
+        # Its signature goes into the TC, which must not be spoiled by a bad one
+        if (
+            tmo_info.sender != timeout_message.id
+            or not self.safety.certificate_verifier.verify_timeout_info(tmo_info)
+        ):
+            logger.warning(
+                "Dropping timeout with an invalid signature from {}".format(
+                    timeout_message.id
+                )
+            )
+            return (None, [])
+        trx_to_dq = self.process_certificate_qc(tmo_info.high_qc)
+        trx_to_dq += self.process_certificate_qc(timeout_message.high_commit_qc)
+        if self.safety.verify_tc(timeout_message.last_round_tc):
+            self.pacemaker.advance_round_tc(timeout_message.last_round_tc)
         timeout_certificate = self.pacemaker.process_remote_timeout(
             timeout_message, self.safety, self.block_tree
         )
         if not timeout_certificate:
-            return None
+            self.collect_garbage()
+            return (None, trx_to_dq)
 
         self.pacemaker.advance_round_tc(timeout_certificate)
-        return self.process_new_round_event(timeout_certificate)
+        self.collect_garbage()
+        return (self.process_new_round_event(timeout_certificate), trx_to_dq)
 
     """
     Procedure process vote msg(M)
@@ -230,16 +287,82 @@ class Main:
         Returns:
 
         """
+        if not self.safety.certificate_verifier.verify_vote(vote_message):
+            logger.warning(
+                "Dropping vote with invalid signatures from {}".format(
+                    vote_message.sender
+                )
+            )
+            return (None, [])
+        # Applied here rather than in BlockTree.process_vote so that the
+        # leaders and the round follow the QC as for any other certificate
+        trx_to_dq = self.process_certificate_qc(vote_message.high_commit_qc)
         process_vote_res = self.block_tree.process_vote(vote_message)
+        self.release_abandoned_trx()
         qc = process_vote_res[0]
-        trx_to_dq = process_vote_res[1]
+        trx_to_dq = trx_to_dq + process_vote_res[1]
         if not qc:
             return (None, trx_to_dq)
 
-        self.process_certificate_qc(qc)
+        trx_to_dq += self.process_certificate_qc(qc)
         # self.process_new_round_event(None)  # TODO: Important to figure out why
         return (qc, trx_to_dq)
 
+    def defer_orphan(self, proposal: ProposalMessage) -> bool:
+        """Hold back a proposal until the block its QC certifies arrives.
+
+        A proposal can overtake the one of the previous round, and its QC
+        would then commit a block this validator does not have.
+
+        Args:
+            proposal:
+
+        Returns:
+            True if the proposal was held back, see release_orphans.
+        """
+        qc = proposal.block.qc
+        high_qc = self.block_tree.high_qc
+        if (
+            qc is None
+            or qc.vote_info.id in self.block_tree.pending_block_tree
+            or (high_qc is not None and qc.vote_info.round <= high_qc.vote_info.round)
+        ):
+            return False
+        self.orphan_proposals.setdefault(qc.vote_info.id, []).append(proposal)
+        return True
+
+    def release_orphans(self, block: Block) -> List[ProposalMessage]:
+        """
+
+        Args:
+            block: Block of a proposal just processed.
+
+        Returns:
+            The proposals held back for block, to be processed now if it made
+            it into the pending block tree.
+        """
+        if block.id not in self.block_tree.pending_block_tree:
+            return []
+        return self.orphan_proposals.pop(block.id, [])
+
+    def process_pending_votes(
+        self, block: Block
+    ) -> Tuple[Optional[QuorumCertificate], List[str]]:
+        """Form the QC of a block from votes that arrived before its proposal,
+        no later vote may come to form it in process_vote_msg.
+
+        Args:
+            block: Block of a proposal just processed.
+
+        Returns:
+            The new QC, already processed as in process_vote_msg, or None, and
+            the ids of the transactions it committed.
+        """
+        qc = self.block_tree.process_pending_votes(block.id)
+        if not qc:
+            return (None, [])
+        return (qc, self.process_certificate_qc(qc))
+
     """
     Procedure start event processing(M)
         if M is a local timeout then Pacemaker.local timeout round()
@@ -306,22 +429,14 @@ class Main:
         """
 
         Args:
-            old_txids:
+            old_txids: Transactions of a pending block that must not be proposed again.
 
         Returns:
 
         """
-        trx_id_list, transactions = [], []
-        block_requests = []
-
-        for (k, v) in self.mempool.queue.items():
-            if k not in old_txids:
-                block_requests.append((k, v))
-            if len(block_requests) == self.block_tree.block_size:
-                break
-        for id, transaction in block_requests:
-            trx_id_list.append(id)
-            transactions.append(transaction)
+        self.mempool.mark_in_flight(old_txids)
+        transactions = self.mempool.get_transactions(self.block_tree.block_size)
+        trx_id_list = [transaction.id for transaction in transactions]
 
         logger.info(
             "Round {} Proposal contains Transactions {}".format(
@@ -340,11 +455,127 @@ class Main:
         Returns:
 
         """
-        trx_client_map = {}
-        for req_id in trx_ids:
-            transaction = self.mempool.queue.get(req_id)
-            if transaction:
-                self.mempool.queue.pop(req_id)
-                trx_client_map[transaction.id] = transaction.client_id
+        return self.mempool.commit(trx_ids)
+
+    def durable_replies(
+        self, trx_client_map: Optional[Dict[str, int]] = None
+    ) -> Dict[str, int]:
+        """Hold back the replies for blocks that are not on disk yet when the
+        ledger fsyncs, so a client never sees a commit a crash can undo.
+
+        Args:
+            trx_client_map: Client id of each newly committed transaction,
+                None to only release the replies held so far.
+
+        Returns:
+            Client id of each committed transaction that can be replied to now.
+        """
+        if not self.ledger.replies_wait_durable:
+            return trx_client_map if trx_client_map else {}
+        if trx_client_map:
+            self.held_replies.update(trx_client_map)
+        ready = [
+            trx_id for trx_id in self.held_replies if self.ledger.is_durable(trx_id)
+        ]
+        return {trx_id: self.held_replies.pop(trx_id) for trx_id in ready}
+
+    def client_reply_batches(
+        self, trx_client_map: Dict[str, int]
+    ) -> List[Tuple[int, BatchCommitProof]]:
+        """Group committed transactions into one reply per client and block.
+
+        Args:
+            trx_client_map: Client id of each committed transaction.
+
+        Returns:
+            (client id, proof) of every batch this validator replies with.
+        """
+        groups: Dict[Tuple[int, str], Tuple[Block, List[str]]] = {}
+        for trx_id, client_id in trx_client_map.items():
+            committed_block = self.ledger.get_transaction_block(trx_id)
+            if committed_block is None or not self.is_client_replier(
+                committed_block.block
+            ):
+                continue
+            block = committed_block.block
+            groups.setdefault((client_id, block.id), (block, []))[1].append(trx_id)
+
+        batches = []
+        for (client_id, block_id), (block, trx_ids) in groups.items():
+            proof = make_batch_commit_proof(
+                block, trx_ids, self.ledger.get_commit_qc(block_id)
+            )
+            if proof is not None:
+                batches.append((client_id, proof))
+        return batches
 
-        return trx_client_map
+    def is_client_replier(self, block: Block) -> bool:
+        """Only f + 1 validators reply for each block, one of them honest.
+
+        Args:
+            block: A committed block.
+
+        Returns:
+            True if this validator replies to the clients of the block.
+        """
+        n = self.leader_election.validators
+        offset = (self.id - block.author) % n
+        return offset <= self.block_tree.f
+
+    def collect_garbage(self) -> int:
+        """Evict the bookkeeping of rounds that can no longer make progress.
+
+        Votes and speculative states are dropped below the committed round,
+        held back proposals up to it, timeouts and reputation leaders below the
+        current round, reputation windows with their pruned blocks.
+
+        Returns:
+            Number of evicted entries.
+        """
+        high_commit_qc = self.block_tree.high_commit_qc
+        committed_round = high_commit_qc.vote_info.round if high_commit_qc else -1
+        stale = [
+            block_id
+            for block_id, proposals in self.orphan_proposals.items()
+            if proposals[-1].block.round <= committed_round
+        ]
+        for block_id in stale:
+            del self.orphan_proposals[block_id]
+        evicted = (
+            len(stale)
+            + self.block_tree.collect_garbage(committed_round)
+            + self.ledger.collect_garbage(committed_round)
+            + self.pacemaker.collect_garbage(self.pacemaker.current_round)
+            + self.leader_election.collect_garbage(
+                self.pacemaker.current_round, self.block_tree
+            )
+        )
+        self.gc_evicted += evicted
+        return evicted
+
+    def memory_gauges(self) -> Dict[str, int]:
+        """
+
+        Returns:
+            Sizes of the per-round bookkeeping of every module.
+        """
+        gauges = {
+            "gc_evicted": self.gc_evicted,
+            "orphan_proposals": len(self.orphan_proposals),
+            "held_replies": len(self.held_replies),
+        }
+        gauges.update(self.block_tree.memory_gauges())
+        gauges.update(self.pacemaker.memory_gauges())
+        gauges.update(self.leader_election.memory_gauges())
+        gauges.update(self.ledger.memory_gauges())
+        return gauges
+
+    def release_abandoned_trx(self) -> None:
+        """Return the transactions of pruned branches to the mempool.
+
+        Returns:
+
+        """
+        for block in self.block_tree.abandoned_blocks:
+            self.mempool.release(trx.id for trx in block.payload)
+        self.block_tree.abandoned_blocks = []
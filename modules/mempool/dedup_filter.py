@@ -0,0 +1,117 @@
+import hashlib
+import math
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class BloomFilter:
+    def __init__(self, num_bits: int, num_hashes: int) -> None:
+        """
+
+        Args:
+            num_bits:
+            num_hashes:
+        """
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray((num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        """Double hashing over one sha256 digest of the key.
+
+        Args:
+            key:
+
+        Returns:
+
+        """
+        digest = hashlib.sha256(key.encode("utf-8")).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class DedupFilter:
+    """Bounded membership filter for processed transaction ids.
+
+    The most recent ``recent_window`` ids are kept exactly. Older ids are
+    remembered by two rotating Bloom filters sharing ``memory_budget`` bytes:
+    once the current filter holds as many ids as it can at the requested
+    false-positive rate it replaces the previous one, so every id is
+    remembered for at least ``capacity`` further insertions.
+    """
+
+    def __init__(
+        self,
+        memory_budget: Optional[int] = 1 << 20,
+        false_positive_rate: Optional[float] = 1e-6,
+        recent_window: Optional[int] = 10000,
+    ) -> None:
+        """
+
+        Args:
+            memory_budget: Bytes shared by the two Bloom filters.
+            false_positive_rate: Target false-positive rate of each filter.
+            recent_window: Number of most recent ids kept exactly.
+        """
+        if not 0 < false_positive_rate < 1:
+            raise ValueError("false_positive_rate must be between 0 and 1")
+        self.num_bits = max(8, memory_budget * 8 // 2)
+        self.capacity = max(
+            1,
+            int(self.num_bits * math.log(2) ** 2 / -math.log(false_positive_rate)),
+        )
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.current = BloomFilter(self.num_bits, self.num_hashes)
+        self.previous: Optional[BloomFilter] = None
+        self.recent_window = recent_window
+        self.recent: Dict[str, bool] = OrderedDict()
+
+    def add(self, key: str) -> None:
+        """
+
+        Args:
+            key:
+
+        Returns:
+
+        """
+        if key in self.recent:
+            return
+        self.recent[key] = True
+        if len(self.recent) > self.recent_window:
+            self.recent.popitem(last=False)
+
+        if self.current.count >= self.capacity:
+            self.previous = self.current
+            self.current = BloomFilter(self.num_bits, self.num_hashes)
+        self.current.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        if key in self.recent:
+            return True
+        if key in self.current:
+            return True
+        return self.previous is not None and key in self.previous
+
+    def memory_usage(self) -> int:
+        """
+
+        Returns:
+            Approximate bytes held by the Bloom filters.
+        """
+        return len(self.current.bits) + (
+            len(self.previous.bits) if self.previous is not None else 0
+        )
@@ -1,11 +1,119 @@
 from collections import OrderedDict
-from typing import Dict
+from typing import Dict, Iterable, List, Optional
 
+from modules.mempool.dedup_filter import DedupFilter
 from modules.objects import Transaction
 
 
 class MemPool:
-    def __init__(self) -> None:
-        """ """
+    def __init__(self, processed_filter: Optional[DedupFilter] = None) -> None:
+        """
+
+        Transactions waiting to be proposed sit in ``queue`` in arrival order.
+        Once a transaction is part of an uncommitted pending block it moves to
+        ``in_flight``, so it is never proposed again on another branch until
+        that block is committed or abandoned.
+
+        Args:
+            processed_filter: Bounded filter remembering committed transaction
+                ids, defaults to a 1MiB filter.
+        """
         self.queue: Dict[str, Transaction] = OrderedDict()
-        self.processed_queue: Dict[str, bool] = {}
+        self.in_flight: Dict[str, Transaction] = {}
+        self.processed = processed_filter if processed_filter else DedupFilter()
+
+    def __len__(self) -> int:
+        return len(self.queue) + len(self.in_flight)
+
+    def add(self, transaction: Transaction) -> bool:
+        """
+
+        Args:
+            transaction:
+
+        Returns:
+            False if the transaction was already known to the mempool.
+        """
+        if (
+            transaction.id in self.queue
+            or transaction.id in self.in_flight
+            or transaction.id in self.processed
+        ):
+            return False
+        self.queue[transaction.id] = transaction
+        return True
+
+    def get_transactions(self, block_size: int) -> List[Transaction]:
+        """Take the oldest ready transactions for a new block.
+
+        Args:
+            block_size:
+
+        Returns:
+
+        """
+        transactions = []
+        while self.queue and len(transactions) < block_size:
+            trx_id, transaction = self.queue.popitem(last=False)
+            self.in_flight[trx_id] = transaction
+            transactions.append(transaction)
+        return transactions
+
+    def mark_in_flight(self, trx_ids: Iterable[str]) -> None:
+        """Record that transactions were included in a pending block.
+
+        Args:
+            trx_ids:
+
+        Returns:
+
+        """
+        for trx_id in trx_ids:
+            transaction = self.queue.pop(trx_id, None)
+            if transaction is not None:
+                self.in_flight[trx_id] = transaction
+
+    def release(self, trx_ids: Iterable[str]) -> None:
+        """Make transactions of an abandoned block ready to be proposed again.
+
+        Args:
+            trx_ids:
+
+        Returns:
+
+        """
+        for trx_id in reversed(list(trx_ids)):
+            transaction = self.in_flight.pop(trx_id, None)
+            if transaction is not None:
+                self.queue[trx_id] = transaction
+                self.queue.move_to_end(trx_id, last=False)
+
+    def is_processed(self, trx_id: str) -> bool:
+        """
+
+        Args:
+            trx_id:
+
+        Returns:
+            True if the transaction was (probably) committed already.
+        """
+        return trx_id in self.processed
+
+    def commit(self, trx_ids: Iterable[str]) -> Dict[str, int]:
+        """Remove committed transactions from the mempool.
+
+        Args:
+            trx_ids:
+
+        Returns:
+            Map of the removed transaction ids to their client ids.
+        """
+        trx_client_map = {}
+        for trx_id in trx_ids:
+            transaction = self.in_flight.pop(trx_id, None)
+            if transaction is None:
+                transaction = self.queue.pop(trx_id, None)
+            if transaction is not None:
+                trx_client_map[transaction.id] = transaction.client_id
+                self.processed.add(trx_id)
+        return trx_client_map
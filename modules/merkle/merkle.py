@@ -0,0 +1,236 @@
+"""
+Merkle trees over block payloads.
+
+Leaves are the cached transaction digests in payload order. Interior nodes
+hash a 0x01 prefix followed by the raw bytes of their two children; a node
+without a sibling is carried up to the next level unchanged, so no leaf is
+ever duplicated. The root is the block's payload digest and therefore part
+of the block id, which lets a client check that its transaction is in a
+committed block from a single reply.
+"""
+
+from typing import Dict, List, Optional
+
+from modules.objects import BatchCommitProof, Block, CommitProof, Hasher, Transaction
+
+NODE_PREFIX = b"\x01"
+
+
+def _hash_node(left: str, right: str) -> str:
+    return Hasher.hash(NODE_PREFIX + bytes.fromhex(left) + bytes.fromhex(right)).decode(
+        "ascii"
+    )
+
+
+class MerkleTree:
+    def __init__(self, leaves: List[str]) -> None:
+        """
+
+        Args:
+            leaves: Hex digests, in order.
+        """
+        self.levels: List[List[str]] = [list(leaves)]
+        while len(self.levels[-1]) > 1:
+            level = self.levels[-1]
+            parents = [
+                _hash_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)
+            ]
+            if len(level) % 2:
+                parents.append(level[-1])
+            self.levels.append(parents)
+
+    def __len__(self) -> int:
+        return len(self.levels[0])
+
+    @property
+    def root(self) -> str:
+        """
+
+        Returns:
+            The root digest, or the digest of an empty payload.
+        """
+        if not self.levels[0]:
+            return Hasher.digest("Payload")
+        return self.levels[-1][0]
+
+    def proof(self, index: int) -> List[str]:
+        """
+
+        Args:
+            index: Position of the leaf.
+
+        Returns:
+            Sibling digests from the leaf up to the root.
+        """
+        path = []
+        for level in self.levels[:-1]:
+            sibling = index ^ 1
+            if sibling < len(level):
+                path.append(level[sibling])
+            index //= 2
+        return path
+
+
+def verify_path(
+    leaf: str, index: int, leaf_count: int, path: List[str], root: str
+) -> bool:
+    """
+
+    Args:
+        leaf: Digest of the leaf.
+        index: Position of the leaf.
+        leaf_count: Number of leaves of the tree.
+        path: Output of MerkleTree.proof.
+        root:
+
+    Returns:
+        True if path proves that leaf is at index in the tree with this root.
+    """
+    if not 0 <= index < leaf_count:
+        return False
+    node = leaf
+    siblings = iter(path)
+    width = leaf_count
+    while width > 1:
+        if index ^ 1 < width:
+            sibling = next(siblings, None)
+            if sibling is None:
+                return False
+            node = _hash_node(sibling, node) if index & 1 else _hash_node(node, sibling)
+        index //= 2
+        width = (width + 1) // 2
+    return next(siblings, None) is None and node == root
+
+
+def make_commit_proof(block: Block, trx_id: str, qc) -> Optional[CommitProof]:
+    """
+
+    Args:
+        block: Committed block holding the transaction.
+        trx_id:
+        qc: QC that committed the block.
+
+    Returns:
+        Proof that the transaction was committed, or None if it is not in
+        the block.
+    """
+    for index, trx in enumerate(block.payload):
+        if trx.id == trx_id:
+            parent = block.qc
+            return CommitProof(
+                block.author,
+                block.round,
+                index,
+                len(block.payload),
+                block.merkle_tree().proof(index),
+                block.payload_digest(),
+                parent.vote_info.id if parent else None,
+                parent.signatures if parent else None,
+                qc,
+            )
+    return None
+
+
+def verify_commit_proof(
+    proof: CommitProof, transaction: Transaction, certificate_verifier
+) -> bool:
+    """
+
+    Args:
+        proof:
+        transaction: The transaction the client submitted.
+        certificate_verifier: CertificateVerifier over the validator keys.
+
+    Returns:
+        True if the transaction is in a block that a valid QC committed.
+    """
+    if not verify_path(
+        transaction.digest(),
+        proof.index,
+        proof.leaf_count,
+        proof.path,
+        proof.payload_root,
+    ):
+        return False
+    return _verify_block(proof, certificate_verifier)
+
+
+def _verify_block(proof, certificate_verifier) -> bool:
+    block_id = Block.make_id(
+        proof.block_author,
+        proof.block_round,
+        proof.payload_root,
+        proof.parent_id,
+        proof.parent_signatures,
+    )
+    return (
+        proof.qc is not None
+        and proof.qc.vote_info.id == block_id
+        and certificate_verifier.verify_qc(proof.qc)
+    )
+
+
+def make_batch_commit_proof(
+    block: Block, trx_ids: List[str], qc
+) -> Optional[BatchCommitProof]:
+    """
+
+    Args:
+        block: Committed block holding the transactions.
+        trx_ids:
+        qc: QC that committed the block.
+
+    Returns:
+        Proof that the transactions of trx_ids found in the block were
+        committed, or None if there are none.
+    """
+    wanted = set(trx_ids)
+    indices = [index for index, trx in enumerate(block.payload) if trx.id in wanted]
+    if not indices:
+        return None
+    tree = block.merkle_tree()
+    parent = block.qc
+    return BatchCommitProof(
+        block.author,
+        block.round,
+        [block.payload[index].id for index in indices],
+        indices,
+        len(block.payload),
+        [tree.proof(index) for index in indices],
+        block.payload_digest(),
+        parent.vote_info.id if parent else None,
+        parent.signatures if parent else None,
+        qc,
+    )
+
+
+def verify_batch_commit_proof(
+    proof: BatchCommitProof,
+    transactions: Dict[str, Transaction],
+    certificate_verifier,
+) -> List[str]:
+    """The block and its QC are checked once for the whole batch.
+
+    Args:
+        proof:
+        transactions: The transactions the client submitted, by id.
+        certificate_verifier: CertificateVerifier over the validator keys.
+
+    Returns:
+        Ids of the client's transactions the proof shows committed.
+    """
+    proven = [
+        trx_id
+        for trx_id, index, path in zip(proof.trx_ids, proof.indices, proof.paths)
+        if trx_id in transactions
+        and verify_path(
+            transactions[trx_id].digest(),
+            index,
+            proof.leaf_count,
+            path,
+            proof.payload_root,
+        )
+    ]
+    if not proven or not _verify_block(proof, certificate_verifier):
+        return []
+    return proven
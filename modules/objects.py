@@ -1,7 +1,7 @@
 import pickle
 from collections import namedtuple
 from enum import Enum
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 from nacl.encoding import HexEncoder
 from nacl.exceptions import BadSignatureError, CryptoError
@@ -9,15 +9,153 @@ from nacl.hash import sha256
 from nacl.signing import SignedMessage, SigningKey, VerifyKey
 
 
+class SignatureSet:
+    """Signatures of a certificate indexed by validator id.
+
+    ``bitmap`` has bit ``i`` set (little endian, ``i % 8`` within byte
+    ``i // 8``) if validator ``i`` signed, and ``packed`` holds the raw
+    signatures of the signers back to back in validator id order. Iterating
+    yields ``(signature, signer)`` pairs.
+    """
+
+    signature_size = 64
+    # Number of validators, 0 if unknown as for decoded sets
+    n = 0
+
+    def __init__(
+        self,
+        n: Optional[int] = 0,
+        bitmap: Optional[bytes] = None,
+        packed: Optional[bytes] = b"",
+    ) -> None:
+        """
+
+        Args:
+            n: Number of validators, sets the width of the bitmap.
+            bitmap:
+            packed:
+        """
+        self.n = n
+        self.bitmap = bitmap if bitmap is not None else bytes((n + 7) // 8)
+        self.packed = packed
+
+    def signer_bits(self) -> int:
+        """
+
+        Returns:
+            The bitmap as an int, so signer sets can be combined with | and &.
+        """
+        return int.from_bytes(self.bitmap, "little")
+
+    def _offset(self, signer: int) -> int:
+        below = self.signer_bits() & ((1 << signer) - 1)
+        return bin(below).count("1") * self.signature_size
+
+    def __contains__(self, signer: int) -> bool:
+        byte = signer >> 3
+        return byte < len(self.bitmap) and bool(self.bitmap[byte] >> (signer & 7) & 1)
+
+    def __len__(self) -> int:
+        # Only signers in the bitmap count, whatever the length of packed
+        return bin(self.signer_bits()).count("1")
+
+    def is_well_formed(self, n: Optional[int] = None) -> bool:
+        """
+
+        Args:
+            n: Number of validators, signer ids must be below it if given.
+
+        Returns:
+            True if packed holds exactly one signature per signer in the
+            bitmap, and no signer id is n or above.
+        """
+        if len(self.packed) != len(self) * self.signature_size:
+            return False
+        return n is None or self.signer_bits() >> n == 0
+
+    def __iter__(self) -> Iterator[Tuple[bytes, int]]:
+        signers = self.signer_bits()
+        offset = 0
+        signer = 0
+        while signers:
+            if signers & 1:
+                yield self.packed[offset : offset + self.signature_size], signer
+                offset += self.signature_size
+            signers >>= 1
+            signer += 1
+
+    def signers(self) -> Set[int]:
+        """
+
+        Returns:
+            Ids of the validators that signed.
+        """
+        return {signer for _, signer in self}
+
+    def get(self, signer: int) -> Optional[bytes]:
+        """
+
+        Args:
+            signer:
+
+        Returns:
+            The signature of signer, or None if it did not sign.
+        """
+        if signer not in self:
+            return None
+        offset = self._offset(signer)
+        return self.packed[offset : offset + self.signature_size]
+
+    def add(self, signer: int, signature: bytes) -> bool:
+        """
+
+        Args:
+            signer: Validator id, ValueError if it is not below n.
+            signature: Raw Ed25519 signature.
+
+        Returns:
+            False if signer already signed, in which case nothing changes.
+        """
+        if signer < 0 or (self.n and signer >= self.n):
+            raise ValueError(
+                "Signer {} out of range for {} validators".format(signer, self.n)
+            )
+        if signer in self:
+            return False
+        if len(signature) != self.signature_size:
+            raise ValueError(
+                "Expected a raw {} byte signature".format(self.signature_size)
+            )
+        bitmap = bytearray(self.bitmap)
+        if signer >> 3 >= len(bitmap):
+            bitmap.extend(bytes((signer >> 3) + 1 - len(bitmap)))
+        bitmap[signer >> 3] |= 1 << (signer & 7)
+        offset = self._offset(signer)
+        self.bitmap = bytes(bitmap)
+        self.packed = self.packed[:offset] + bytes(signature) + self.packed[offset:]
+        return True
+
+    def __repr__(self):
+        """
+
+        Returns:
+
+        """
+        return "SignatureSet(signers={})".format(sorted(self.signers()))
+
+
 class TimeoutCertificate:
     def __init__(
-        self, round: int, tmo_high_qc_rounds: List[int], tmo_signatures: List[Any]
+        self,
+        round: int,
+        tmo_high_qc_rounds: List[int],
+        tmo_signatures: SignatureSet,
     ) -> None:
         """
 
         Args:
             round:
-            tmo_high_qc_rounds:
+            tmo_high_qc_rounds: High QC round of each signer, in validator id order.
             tmo_signatures:
         """
         self.round = round
@@ -26,7 +164,7 @@ class TimeoutCertificate:
 
 
 class LedgerCommitInfo:
-    def __init__(self, commit_state_id: int, vote_info_hash: str) -> None:
+    def __init__(self, commit_state_id: str, vote_info_hash: str) -> None:
         """
 
         Args:
@@ -46,6 +184,16 @@ class LedgerCommitInfo:
         """
         return (self.commit_state_id, self.vote_info_hash)
 
+    def digest(self) -> str:
+        """
+
+        Returns:
+            Cached digest of the fields, used as the key votes aggregate under.
+        """
+        if getattr(self, "_digest", None) is None:
+            self._digest = Hasher.digest("LedgerCommitInfo", *self.fields())
+        return self._digest
+
     def __repr__(self):
         """
 
@@ -60,11 +208,11 @@ class LedgerCommitInfo:
 class VoteInfo:
     def __init__(
         self,
-        id: int,
+        id: str,
         round: int,
-        parent_id: int,
+        parent_id: str,
         parent_round: int,
-        exec_state_id: int,
+        exec_state_id: str,
     ) -> None:
         """
 
@@ -95,6 +243,16 @@ class VoteInfo:
             self.exec_state_id,
         )
 
+    def digest(self) -> str:
+        """
+
+        Returns:
+            Cached digest of the fields.
+        """
+        if getattr(self, "_digest", None) is None:
+            self._digest = Hasher.digest("VoteInfo", *self.fields())
+        return self._digest
+
     def __repr__(self):
         """
 
@@ -111,7 +269,7 @@ class QuorumCertificate:
         self,
         vote_info: VoteInfo,
         ledger_commit_info: LedgerCommitInfo,
-        signatures: List[Any],  # TODO: A quorum of signature,
+        signatures: SignatureSet,  # Vote signatures of a quorum
         author: int,  # u - The validator that produced the q,
         author_signature: Any,  # ← signu(signatures),
     ) -> None:
@@ -155,17 +313,30 @@ class Transaction:
         self.retry_count = 0
         self.client_id = client_id
 
-    def create_signed_payload(self, signing_key: SigningKey) -> Tuple:
+    def digest(self) -> str:
+        """
+
+        Returns:
+            Cached digest of the command, id and client, retries excluded.
+        """
+        if getattr(self, "_digest", None) is None:
+            self._digest = Hasher.digest(
+                "Transaction", self.command, self.id, self.client_id
+            )
+        return self._digest
+
+    def create_signed_payload(self, signing_key: SigningKey) -> bytes:
         """
 
         Args:
             signing_key:
 
         Returns:
-
+            The signed envelope sent on the wire.
         """
-        signed_payload = Signatures.pickle_and_sign_payload(self, signing_key)
-        return (self, signed_payload)
+        return Signatures.seal_payload(
+            EnvelopeKind.TRANSACTION, self.client_id, self, signing_key
+        )
 
 
 class Block:
@@ -192,6 +363,53 @@ class Block:
         self.qc = qc
         self.id = id
 
+    def merkle_tree(self):
+        """
+
+        Returns:
+            Cached MerkleTree over the transaction digests of the payload.
+        """
+        if getattr(self, "_merkle_tree", None) is None:
+            from modules.merkle.merkle import MerkleTree
+
+            self._merkle_tree = MerkleTree([trx.digest() for trx in self.payload])
+        return self._merkle_tree
+
+    def payload_digest(self) -> str:
+        """Merkle root of the payload, built from the cached transaction digests.
+
+        Computed once per block and shared by the block id, the speculative
+        state id and the inclusion proofs sent to clients.
+
+        Returns:
+
+        """
+        return self.merkle_tree().root
+
+    @staticmethod
+    def make_id(
+        author: int,
+        round: int,
+        payload_digest: str,
+        parent_id: Optional[str],
+        parent_signatures: Optional["SignatureSet"],
+    ) -> str:
+        """
+
+        Args:
+            author:
+            round:
+            payload_digest: Merkle root of the payload.
+            parent_id: Block id certified by the block's QC.
+            parent_signatures: Signatures of the block's QC.
+
+        Returns:
+            The block id.
+        """
+        return Hasher.digest(
+            "Block", author, round, payload_digest, parent_id, parent_signatures
+        )
+
     def __repr__(self):
         """
 
@@ -219,6 +437,124 @@ class CommittedBlock:
         self.commit_state_id = commit_state_id
 
 
+class Checkpoint:
+    def __init__(
+        self,
+        height: int,
+        block_id: str,
+        round: int,
+        state_hash: str,  # commit_state_id of the block at height
+        qc: QuorumCertificate,  # Last QC that committed a block up to height
+    ) -> None:
+        """
+
+        Args:
+            height:
+            block_id:
+            round:
+            state_hash:
+            qc:
+        """
+        self.height = height
+        self.block_id = block_id
+        self.round = round
+        self.state_hash = state_hash
+        self.qc = qc
+
+    def __repr__(self):
+        """
+
+        Returns:
+
+        """
+        from pprint import pformat
+
+        return pformat(vars(self), indent=4, width=1)
+
+
+class CommitProof:
+    def __init__(
+        self,
+        block_author: int,
+        block_round: int,
+        index: int,
+        leaf_count: int,
+        path: List[str],
+        payload_root: str,
+        parent_id: Optional[str],
+        parent_signatures: Optional[SignatureSet],
+        qc: QuorumCertificate,
+    ) -> None:
+        """Proof that a transaction was committed, sent in client replies.
+
+        The Merkle path ties the transaction to the payload root, the block
+        fields rebuild the block id, and the QC certifies that id.
+
+        Args:
+            block_author:
+            block_round:
+            index: Position of the transaction in the payload.
+            leaf_count: Number of transactions in the payload.
+            path: Sibling digests from the transaction up to the root.
+            payload_root:
+            parent_id:
+            parent_signatures:
+            qc: QC that committed the block.
+        """
+        self.block_author = block_author
+        self.block_round = block_round
+        self.index = index
+        self.leaf_count = leaf_count
+        self.path = path
+        self.payload_root = payload_root
+        self.parent_id = parent_id
+        self.parent_signatures = parent_signatures
+        self.qc = qc
+
+
+class BatchCommitProof:
+    def __init__(
+        self,
+        block_author: int,
+        block_round: int,
+        trx_ids: List[str],
+        indices: List[int],
+        leaf_count: int,
+        paths: List[List[str]],
+        payload_root: str,
+        parent_id: Optional[str],
+        parent_signatures: Optional[SignatureSet],
+        qc: QuorumCertificate,
+    ) -> None:
+        """Proof that several transactions of one block were committed.
+
+        Like CommitProof, with one Merkle path per transaction and the block
+        fields and QC shared by all of them.
+
+        Args:
+            block_author:
+            block_round:
+            trx_ids:
+            indices: Position of each transaction in the payload.
+            leaf_count: Number of transactions in the payload.
+            paths: Merkle path of each transaction.
+            payload_root:
+            parent_id:
+            parent_signatures:
+            qc: QC that committed the block.
+        """
+        self.block_author = block_author
+        self.block_round = block_round
+        self.trx_ids = trx_ids
+        self.indices = indices
+        self.leaf_count = leaf_count
+        self.paths = paths
+        self.payload_root = payload_root
+        self.parent_id = parent_id
+        self.parent_signatures = parent_signatures
+        self.qc = qc
+
+
 class TimeoutInfo:
     def __init__(
         self,
@@ -238,7 +574,9 @@ class TimeoutInfo:
         self.round = round
         self.high_qc = high_qc
         self.sender = sender  # Added automatically when constructed
-        self.signature = signature  # ← signu(round, high qc.round); // Signed automatically when constructed
+        self.signature = (
+            signature  # ← signu(round, high qc.round), see Safety.make_timeout
+        )
 
 
 class TimeoutMessage:
@@ -262,36 +600,16 @@ class TimeoutMessage:
         self.high_commit_qc = high_commit_qc
         self.id = id
 
-    def create_signed_payload(self, signing_key: SigningKey) -> Tuple:
+    def create_signed_payload(self, signing_key: SigningKey) -> bytes:
         """
 
         Args:
             signing_key:
 
         Returns:
-
-        """
-        self.tmo_info.signature = Signatures.sign_message(
-            bytes(str(self.id), encoding="utf-8"), signing_key
-        )
-        signed_payload = Signatures.pickle_and_sign_payload(self, signing_key)
-        return (self, signed_payload)
-
-    @staticmethod
-    def verify_sig_from_id(id, signature, verify_key):
-        """
-
-        Args:
-            id:
-            signature:
-            verify_key:
-
-        Returns:
-
+            The signed envelope sent on the wire.
         """
-        return Signatures.verify_message(signature, verify_key) == bytes(
-            str(id), encoding="utf-8"
-        )
+        return Signatures.seal_payload(EnvelopeKind.TIMEOUT, self.id, self, signing_key)
 
 
 class VoteMsg:
@@ -318,17 +636,18 @@ class VoteMsg:
         self.sender = sender
         self.signature = signature
 
-    def create_signed_payload(self, signing_key: SigningKey) -> Tuple:
+    def create_signed_payload(self, signing_key: SigningKey) -> bytes:
         """
 
         Args:
             signing_key:
 
         Returns:
-
+            The signed envelope sent on the wire.
         """
-        signed_payload = Signatures.pickle_and_sign_payload(self, signing_key)
-        return self, signed_payload
+        return Signatures.seal_payload(
+            EnvelopeKind.VOTE, self.sender, self, signing_key
+        )
 
 
 class ProposalMessage:
@@ -368,35 +687,25 @@ class ProposalMessage:
 
         return pformat(vars(self), indent=4, width=1)
 
-    def create_signed_payload(self, signing_key: SigningKey) -> Tuple:
+    def create_signed_payload(self, signing_key: SigningKey) -> bytes:
         """
 
         Args:
             signing_key:
 
         Returns:
-
+            The signed envelope sent on the wire.
         """
-        signed_payload = Signatures.pickle_and_sign_payload(self, signing_key)
-        return self, signed_payload
-
-
-class Certificate:
-    def __init__(self) -> None:
-        pass
-
-    @staticmethod
-    def is_valid_signatures(block: Block, certificate: TimeoutCertificate) -> bool:
-        """
-
-        Args:
-            block:
-            certificate:
+        return Signatures.seal_payload(
+            EnvelopeKind.PROPOSAL, self.sender_id, self, signing_key
+        )
 
-        Returns:
 
-        """
-        return True
+class EnvelopeKind:
+    TRANSACTION = 0
+    PROPOSAL = 1
+    VOTE = 2
+    TIMEOUT = 3
 
 
 class Signatures:
@@ -452,6 +761,56 @@ class Signatures:
         except (CryptoError, BadSignatureError):
             return False
 
+    @staticmethod
+    def sign_detached(msg: bytes, private_key: SigningKey) -> bytes:
+        """
+
+        Args:
+            msg:
+            private_key:
+
+        Returns:
+            The raw 64 byte signature of msg, without msg.
+        """
+        return private_key.sign(msg).signature
+
+    @staticmethod
+    def verify_detached(msg: bytes, signature: bytes, public_key: VerifyKey) -> bool:
+        """
+
+        Args:
+            msg:
+            signature: Output of sign_detached.
+            public_key:
+
+        Returns:
+
+        """
+        try:
+            public_key.verify(msg, bytes(signature))
+        except (CryptoError, BadSignatureError, ValueError, TypeError):
+            return False
+        return True
+
+    @staticmethod
+    def seal_payload(
+        kind: int, signer: int, obj: Any, signing_key: SigningKey
+    ) -> bytes:
+        """Encode obj once and sign it into a raw binary envelope.
+
+        Args:
+            kind: One of the EnvelopeKind values.
+            signer:
+            obj:
+            signing_key:
+
+        Returns:
+
+        """
+        from modules.codec.envelope import seal
+
+        return seal(kind, signer, obj, signing_key)
+
     @staticmethod
     def pickle_and_sign_payload(obj: Any, signing_key: SigningKey) -> bytes:
         """
@@ -467,22 +826,22 @@ class Signatures:
         return Signatures.sign_message(pickled_obj, signing_key)
 
     @staticmethod
-    def verify_signed_payload(
-        signed_payload: SignedMessage, verify_key: VerifyKey
-    ) -> Any:
+    def verify_signed_payload(envelope: bytes, verify_key: VerifyKey) -> Any:
         """
 
         Args:
-            signed_payload:
+            envelope: Output of seal_payload.
             verify_key:
 
         Returns:
-
+            The decoded payload, or False if the signature is bad.
         """
-        verified_obj = Signatures.verify_message(signed_payload, verify_key)
-        if verified_obj:
-            return pickle.loads(verified_obj)
-        return False
+        from modules.codec.envelope import open_envelope
+
+        verified_obj = open_envelope(envelope, verify_key)
+        if verified_obj is None:
+            return False
+        return verified_obj
 
 
 class Hasher:
@@ -506,6 +865,35 @@ class Hasher:
         """
         return engine(msg, encoder=encoder)
 
+    @staticmethod
+    def digest(*fields: Any) -> str:
+        """
+
+        Args:
+            *fields: Values the codec can encode, the first one naming the
+                kind of object hashed.
+
+        Returns:
+            Hex SHA-256 of the canonical encoding of fields.
+        """
+        from modules.codec.codec import encode_canonical
+
+        return Hasher.hash(encode_canonical(fields)).decode("ascii")
+
+    @staticmethod
+    def payload_digest(txns: List[Transaction]) -> str:
+        """
+
+        Args:
+            txns:
+
+        Returns:
+            Merkle root over the cached digests of txns, in order.
+        """
+        from modules.merkle.merkle import MerkleTree
+
+        return MerkleTree([trx.digest() for trx in txns]).root
+
 
 class EventType:
     LOCAL_TIMEOUT = "local_timeout"
@@ -539,6 +927,10 @@ class TestConfig:
         client_pubkey_map: Dict[int, VerifyKey],
         num_clients: int,
         round_gst: float,
+        verification_workers: Optional[int] = 2,
+        round_timer_policy: Optional[str] = "adaptive",
+        load_config: Optional[Any] = None,
+        ledger_durability: Optional[str] = "flush",
     ) -> None:
         """
 
@@ -549,6 +941,15 @@ class TestConfig:
             client_key_pairs:
             client_pubkey_map:
             num_clients:
+            round_gst:
+            verification_workers: Signature verification threads per validator.
+            round_timer_policy: One of the
+                modules.pacemaker.round_timer.TimerPolicy values.
+            load_config: modules.workload.workload.LoadConfig of the clients,
+                None sends a single transaction per client.
+            ledger_durability: One of the
+                modules.ledger.ledger_writer.DurabilityPolicy values, under
+                "fsync" client replies wait until their block is on disk.
         """
         self.nvalidators = nvalidators
         self.validator_key_pairs = validator_key_pairs
@@ -557,6 +958,10 @@ class TestConfig:
         self.client_pubkey_map = client_pubkey_map
         self.num_clients = num_clients
         self.round_gst = round_gst
+        self.verification_workers = verification_workers
+        self.round_timer_policy = round_timer_policy
+        self.load_config = load_config
+        self.ledger_durability = ledger_durability
 
 
 class MsgType(Enum):
@@ -735,6 +1140,9 @@ def generate_test_configs() -> List[TestConfig]:
     n_validators = [4, 10]
     n_clients = [10, 2]
     round_gst = [0.5, 0.5]
+    # None sends one transaction per client, for load use for example
+    # LoadConfig(rate=200, max_outstanding=100, duration=10) from modules.workload
+    load_configs = [None, None]
     tests = []
 
     for i, n in enumerate(n_validators):
@@ -757,6 +1165,7 @@ def generate_test_configs() -> List[TestConfig]:
                 "client_pubkey_map": client_pubkey_map,
                 "num_clients": n_clients[i],
                 "round_gst": round_gst[i],
+                "load_config": load_configs[i],
             }
         )
 
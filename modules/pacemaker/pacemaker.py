@@ -1,13 +1,16 @@
 import logging
-from typing import Dict
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
 
 from modules.block_tree.block_tree import BlockTree
 from modules.objects import (
     QuorumCertificate,
+    SignatureSet,
     TimeoutCertificate,
     TimeoutInfo,
     TimeoutMessage,
 )
+from modules.pacemaker.round_timer import FixedRoundTimer
 from modules.safety.safety import Safety
 from modules.utils import helpers as date_utils
 
@@ -15,7 +18,14 @@ logger = logging.getLogger(__name__)
 
 
 class Pacemaker:
-    def __init__(self, f: int, id: int, leader_election, gst: float) -> None:
+    def __init__(
+        self,
+        f: int,
+        id: int,
+        leader_election,
+        gst: float,
+        round_timer: Optional[FixedRoundTimer] = None,
+    ) -> None:
         """
 
         Args:
@@ -23,6 +33,7 @@ class Pacemaker:
             id:
             leader_election:
             gst:
+            round_timer: Timer policy, the fixed 10 * GST timer by default.
         """
         self.current_round: int = 0
         self.last_round_tc: TimeoutCertificate = None
@@ -35,14 +46,29 @@ class Pacemaker:
         self.id = id
         self.gst = gst
         self.leader_election = leader_election
+        self.round_timer = round_timer if round_timer else FixedRoundTimer(gst)
+        self.round_timeout: float = self.round_timer.timeout()
+        # (round, timeout in seconds) of the most recent rounds
+        self.round_timeouts: Deque[Tuple[int, float]] = deque(maxlen=1024)
+        self.timed_out_round: Optional[int] = None
 
     """
     Function get round timer(r)
-        return round timer formula (We use 10 * GST value that we determined from multiple iterations of DA runs)
+        return round timer formula (chosen by the round timer policy, see round_timer.py)
     """
 
     def get_round_timer(self):
-        return 10 * self.gst
+        return self.round_timeout
+
+    def timer_metrics(self) -> Dict[str, Any]:
+        """
+
+        Returns:
+            State of the timer policy and the timeout chosen per round.
+        """
+        metrics = self.round_timer.metrics()
+        metrics["round_timeouts"] = dict(self.round_timeouts)
+        return metrics
 
     """
     Procedure start timer(new round)
@@ -51,9 +77,17 @@ class Pacemaker:
         start local timer for round current round for duration get round timer(current round)
     """
 
-    def start_timer(self, new_round: int) -> None:
-        self.timer_start = date_utils.getTimeMillis()
+    def start_timer(self, new_round: int, progress: bool = True) -> None:
+        now = date_utils.getTimeMillis()
+        if progress and new_round > self.current_round:
+            self.round_timer.on_progress((now - self.timer_start) / 1000)
+        self.timer_start = now
         self.current_round = new_round
+        self.round_timeout = self.round_timer.timeout()
+        self.round_timeouts.append((new_round, self.round_timeout))
+        logger.info(
+            "Round {} timeout set to {:.3f}s".format(new_round, self.round_timeout)
+        )
         self.round_done = True
 
     """
@@ -66,6 +100,11 @@ class Pacemaker:
     def local_timeout_round(
         self, safety: Safety, block_tree: BlockTree
     ) -> TimeoutMessage:
+        if self.timed_out_round != self.current_round:
+            # Back off once per round, keep waiting longer for this round too
+            self.timed_out_round = self.current_round
+            self.round_timer.on_timeout()
+            self.round_timeout = self.round_timer.timeout()
         timeout_info = safety.make_timeout(
             self.current_round, block_tree.high_qc, self.last_round_tc
         )
@@ -79,8 +118,34 @@ class Pacemaker:
     Used pseudocode from paper
     """
 
-    def extract_high_qc(self, timeout_msg):
-        return timeout_msg.high_qc
+    def collect_garbage(self, current_round: int) -> int:
+        """Drop the timeouts of past rounds, process_remote_timeout ignores them.
+
+        Args:
+            current_round:
+
+        Returns:
+            Number of evicted entries.
+        """
+        stale = [round for round in self.pending_timeouts if round < current_round]
+        for round in stale:
+            del self.pending_timeouts[round]
+        return len(stale)
+
+    def memory_gauges(self) -> Dict[str, int]:
+        """
+
+        Returns:
+            Sizes of the timeout bookkeeping.
+        """
+        return {
+            "pending_timeout_rounds": len(self.pending_timeouts),
+            "pending_timeout_msgs": sum(map(len, self.pending_timeouts.values())),
+        }
+
+    def extract_high_qc_round(self, timeout_msg):
+        high_qc = timeout_msg.tmo_info.high_qc
+        return high_qc.vote_info.round if high_qc else -1
 
     def extract_timeout_signatures(self, timeout_msg):
         return (timeout_msg.tmo_info.signature, timeout_msg.id)
@@ -98,21 +163,27 @@ class Pacemaker:
         )
         if tmo_info.sender not in self.pending_timeouts[tmo_info.round]:
             self.pending_timeouts[tmo_info.round][tmo_info.sender] = timeout_message
-        if len(self.pending_timeouts[tmo_info.round].keys()) == (self.f + 1):
-            self.start_timer(self.current_round)
-            self.local_timeout_round(safety, block_tree)
+        if (
+            len(self.pending_timeouts[tmo_info.round].keys()) == (self.f + 1)
+            and self.timed_out_round != self.current_round
+        ):
+            # Bracha timeout: expire the timer so the caller times out the
+            # round and broadcasts the timeout message right away
+            self.round_timeout = 0
 
         if len(self.pending_timeouts[tmo_info.round].keys()) == (2 * self.f + 1):
-            high_qc_rounds = map(
-                self.extract_high_qc, self.pending_timeouts[tmo_info.round]
-            )
-            timeout_signatures = map(
-                self.extract_timeout_signatures,
-                self.pending_timeouts[tmo_info.round].values(),
+            # Both indexed by validator id, see SignatureSet
+            timeout_messages = sorted(
+                self.pending_timeouts[tmo_info.round].values(), key=lambda m: m.id
             )
-            if self.id != self.leader_election.get_leader(self.current_round):
-                self.start_timer(self.current_round + 1)
-                return None
+            high_qc_rounds = list(map(self.extract_high_qc_round, timeout_messages))
+            timeout_signatures = SignatureSet(self.leader_election.validators)
+            for signature, sender in map(
+                self.extract_timeout_signatures, timeout_messages
+            ):
+                timeout_signatures.add(sender, signature)
+            # Every validator forms the TC and advances with it, so its later
+            # timeout messages carry the TC to the validators left behind
             return TimeoutCertificate(
                 tmo_info.round, high_qc_rounds, timeout_signatures
             )  # TODO add implementation here
@@ -137,7 +208,7 @@ class Pacemaker:
                 tc.round + 1, tc.round
             )
         )
-        self.start_timer(tc.round + 1)
+        self.start_timer(tc.round + 1, progress=False)
         return True
 
     """
@@ -0,0 +1,156 @@
+"""
+Round timer policies of the Pacemaker.
+
+The fixed policy always waits 10 * GST. The adaptive policy estimates the
+latency of a round from the rounds that made progress, either as an EWMA or
+as a percentile of a sliding window, and waits a multiple of it. Every
+consecutive round that times out doubles the wait, and the first round that
+makes progress resets it. The wait never exceeds the fixed timeout, so the
+adaptive policy is never slower than the fixed one to leave a dead round.
+"""
+
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+class TimerPolicy:
+    FIXED = "fixed"
+    ADAPTIVE = "adaptive"
+
+
+class LatencyEstimator:
+    EWMA = "ewma"
+    PERCENTILE = "percentile"
+
+
+class FixedRoundTimer:
+    def __init__(self, gst: float) -> None:
+        """
+
+        Args:
+            gst: Assumed global stabilization time in seconds.
+        """
+        self.gst = gst
+
+    def timeout(self) -> float:
+        """
+
+        Returns:
+            Seconds to wait for progress in the next round.
+        """
+        return 10 * self.gst
+
+    def on_progress(self, latency: float) -> None:
+        """A round ended with a QC or a valid proposal.
+
+        Args:
+            latency: Seconds the round took.
+
+        Returns:
+
+        """
+
+    def on_timeout(self) -> None:
+        """The timer of a round expired.
+
+        Returns:
+
+        """
+
+    def metrics(self) -> Dict[str, float]:
+        return {"timeout": self.timeout()}
+
+
+class AdaptiveRoundTimer(FixedRoundTimer):
+    def __init__(
+        self,
+        gst: float,
+        estimator: Optional[str] = LatencyEstimator.EWMA,
+        alpha: Optional[float] = 0.2,
+        percentile: Optional[float] = 0.99,
+        window: Optional[int] = 64,
+        multiplier: Optional[float] = 4.0,
+        backoff: Optional[float] = 2.0,
+        min_timeout: Optional[float] = 0.05,
+    ) -> None:
+        """
+
+        Args:
+            gst: Assumed global stabilization time in seconds, the timeout
+                is capped at the fixed 10 * GST.
+            estimator: One of LatencyEstimator.
+            alpha: Weight of the newest latency in the EWMA.
+            percentile: Latency percentile used by the percentile estimator.
+            window: Number of latencies the percentile is taken over.
+            multiplier: Timeout as a multiple of the latency estimate.
+            backoff: Factor applied per consecutive timed out round.
+            min_timeout: Lower bound of the timeout in seconds.
+        """
+        super().__init__(gst)
+        self.estimator = estimator
+        self.alpha = alpha
+        self.percentile = percentile
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.ewma: Optional[float] = None
+        self.multiplier = multiplier
+        self.backoff = backoff
+        self.min_timeout = min_timeout
+        self.max_timeout = 10 * gst
+        self.consecutive_timeouts = 0
+
+    def estimate(self) -> Optional[float]:
+        """
+
+        Returns:
+            Estimated round latency in seconds, None before any progress.
+        """
+        if not self.latencies:
+            return None
+        if self.estimator == LatencyEstimator.PERCENTILE:
+            ordered = sorted(self.latencies)
+            return ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+        return self.ewma
+
+    def timeout(self) -> float:
+        estimate = self.estimate()
+        if estimate is None:
+            return self.max_timeout
+        timeout = max(self.min_timeout, self.multiplier * estimate)
+        timeout *= self.backoff**self.consecutive_timeouts
+        return min(timeout, self.max_timeout)
+
+    def on_progress(self, latency: float) -> None:
+        self.latencies.append(latency)
+        self.ewma = (
+            latency
+            if self.ewma is None
+            else self.alpha * latency + (1 - self.alpha) * self.ewma
+        )
+        self.consecutive_timeouts = 0
+
+    def on_timeout(self) -> None:
+        self.consecutive_timeouts += 1
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            "timeout": self.timeout(),
+            "estimate": self.estimate(),
+            "consecutive_timeouts": self.consecutive_timeouts,
+        }
+
+
+def make_round_timer(policy: str, gst: float) -> FixedRoundTimer:
+    """
+
+    Args:
+        policy: One of TimerPolicy.
+        gst:
+
+    Returns:
+
+    """
+    if policy == TimerPolicy.FIXED:
+        return FixedRoundTimer(gst)
+    if policy == TimerPolicy.ADAPTIVE:
+        return AdaptiveRoundTimer(gst)
+    raise ValueError("Unknown round timer policy {}".format(policy))
@@ -6,7 +6,6 @@ from modules.block_tree.block_tree import BlockTree
 from modules.ledger.ledger import Ledger
 from modules.objects import (
     Block,
-    Certificate,
     LedgerCommitInfo,
     QuorumCertificate,
     TimeoutCertificate,
@@ -15,12 +14,17 @@ from modules.objects import (
     VoteInfo,
     VoteMsg,
 )
+from modules.verification.certificate_verifier import (
+    CertificateVerifier,
+    sign_timeout,
+    sign_vote,
+)
 
 
 class Safety:
     def __init__(
         self,
-        private_key: Certificate,
+        private_key: SigningKey,
         public_keys: Dict[int, Tuple[SigningKey, VerifyKey]],
         id,
         highest_vote_round: Optional[int] = -1,
@@ -40,6 +44,9 @@ class Safety:
         self.highest_vote_round = highest_vote_round
         self.highest_qc_round = highest_qc_round
         self.id = id
+        self.certificate_verifier = CertificateVerifier(
+            {validator_id: keys[1] for validator_id, keys in public_keys.items()}
+        )
 
     """
     Procedure increase highest vote round(round)
@@ -139,7 +146,9 @@ class Safety:
         """
         if block_round <= max(self.highest_vote_round, qc_round):
             return False
-        return True
+        return self._is_consecutive(block_round, qc_round) or (
+            tc is not None and self._is_safe_to_extend(block_round, qc_round, tc)
+        )
 
     """
     Function safe to timeout(round, qc round, tc)
@@ -194,8 +203,8 @@ class Safety:
         Returns:
 
         """
-        if self._is_consecutive(block_round, qc.vote_info_round):
-            return ledger.pending_state(qc.id)
+        if self._is_consecutive(block_round, qc.vote_info.round):
+            return ledger.get_commit_state_id(qc.vote_info.id)
 
         return None
 
@@ -242,7 +251,7 @@ class Safety:
         qc_round = block.qc.vote_info.round if block.qc else -1
 
         if not (
-            Certificate.is_valid_signatures(block, last_tc)
+            self.certificate_verifier.is_valid_signatures(block.qc, last_tc)
             and self._is_safe_to_vote(block.round, qc_round, last_tc)
         ):
             return None
@@ -259,23 +268,20 @@ class Safety:
         )
 
         ledger_commit_info: LedgerCommitInfo = LedgerCommitInfo(
-            commit_state_id=ledger.get_committed_block(
-                vote_info.parent_id
-            ).commit_state_id
-            if vote_info.parent_id
-            else "",
-            vote_info_hash=str(
-                hash(vote_info.fields())
-            ),  # TODO: Verify hashing done here
+            commit_state_id=(
+                self._commit_state_id_candidate(block.round, block.qc, ledger)
+                if block.qc
+                else None
+            ),
+            vote_info_hash=vote_info.digest(),
         )
 
-        # TODO: Complete sender and signature for votemsg
         return VoteMsg(
             vote_info,
             ledger_commit_info,
             block_tree.high_commit_qc,
             sender=self.id,
-            signature=None,
+            signature=sign_vote(ledger_commit_info, self.private_key),
         )
 
     """
@@ -303,16 +309,19 @@ class Safety:
         """
         qc_round = high_qc.vote_info.round if high_qc else -1
 
-        # Verify TC takes care of this - hence it always returns True
         if not (
-            Certificate.is_valid_signatures(high_qc, last_tc)
+            self.certificate_verifier.is_valid_signatures(high_qc, last_tc)
             and self._is_safe_to_timeout(round, qc_round, last_tc)
         ):
             return None
 
         # self._increase_highest_vote_round(round)
-        # TODO: Construct timeout info properly
-        return TimeoutInfo(round, high_qc, sender=self.id, signature=None)
+        return TimeoutInfo(
+            round,
+            high_qc,
+            sender=self.id,
+            signature=sign_timeout(round, qc_round, self.private_key),
+        )
 
     def verify_tc(self, timeout_cert: TimeoutCertificate) -> bool:
         """
@@ -323,9 +332,15 @@ class Safety:
         Returns:
 
         """
-        for (signature, id) in timeout_cert.tmo_signatures:
-            if not TimeoutMessage.verify_sig_from_id(
-                id, signature, self.public_keys[id][1]
-            ):
-                return False
-        return True
+        return self.certificate_verifier.verify_tc(timeout_cert)
+
+    def verify_qc(self, qc: QuorumCertificate) -> bool:
+        """
+
+        Args:
+            qc:
+
+        Returns:
+
+        """
+        return self.certificate_verifier.verify_qc(qc)
@@ -0,0 +1,201 @@
+"""
+Virtual clock, event queue and in-memory network of the simulator.
+
+Events fire in (time, insertion order), so a run is fully determined by its
+seed. Message latencies are drawn from a latency model (ConstantLatency and
+its subclasses) using the network's own random generator.
+"""
+
+import heapq
+import math
+import random
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+
+class VirtualClock:
+    def __init__(self) -> None:
+        self.now: float = 0.0
+
+    def millis(self) -> float:
+        """
+
+        Returns:
+            Virtual time in milliseconds, the clock of helpers.getTimeMillis
+            during a simulation.
+        """
+        return self.now
+
+
+class EventQueue:
+    def __init__(self, clock: VirtualClock) -> None:
+        """
+
+        Args:
+            clock: Advanced to the time of every event that fires.
+        """
+        self.clock = clock
+        self.events: List[Tuple[float, int, Callable[..., None], Tuple]] = []
+        self.sequence = 0
+        self.fired = 0
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def schedule(self, delay: float, callback: Callable[..., None], *args) -> None:
+        """
+
+        Args:
+            delay: Milliseconds from now.
+            callback:
+            *args: Passed to callback.
+
+        Returns:
+
+        """
+        self.sequence += 1
+        heapq.heappush(
+            self.events,
+            (self.clock.now + max(0.0, delay), self.sequence, callback, args),
+        )
+
+    def next_time(self) -> Optional[float]:
+        return self.events[0][0] if self.events else None
+
+    def step(self) -> None:
+        """Fire the next event.
+
+        Returns:
+
+        """
+        time, _, callback, args = heapq.heappop(self.events)
+        self.clock.now = time
+        self.fired += 1
+        callback(*args)
+
+
+class ConstantLatency:
+    def __init__(self, latency: float) -> None:
+        """
+
+        Args:
+            latency: Milliseconds.
+        """
+        self.latency = latency
+
+    def sample(self, rng: random.Random) -> float:
+        """
+
+        Args:
+            rng:
+
+        Returns:
+            One message latency in milliseconds.
+        """
+        return self.latency
+
+
+class UniformLatency(ConstantLatency):
+    def __init__(self, low: float, high: float) -> None:
+        """
+
+        Args:
+            low: Milliseconds.
+            high: Milliseconds.
+        """
+        super().__init__(low)
+        self.high = high
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.uniform(self.latency, self.high)
+
+
+class ExponentialLatency(ConstantLatency):
+    def __init__(self, base: float, mean: float) -> None:
+        """Fixed propagation delay plus exponentially distributed queueing.
+
+        Args:
+            base: Milliseconds.
+            mean: Mean of the exponential part in milliseconds.
+        """
+        super().__init__(base)
+        self.mean = mean
+
+    def sample(self, rng: random.Random) -> float:
+        return self.latency + rng.expovariate(1 / self.mean)
+
+
+class LogNormalLatency(ConstantLatency):
+    def __init__(self, median: float, sigma: float) -> None:
+        """Heavy tailed latency, typical of wide area links.
+
+        Args:
+            median: Milliseconds.
+            sigma: Standard deviation of the log of the latency.
+        """
+        super().__init__(median)
+        self.sigma = sigma
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.lognormvariate(math.log(self.latency), self.sigma)
+
+
+class Network:
+    def __init__(
+        self,
+        events: EventQueue,
+        latency: ConstantLatency,
+        rng: random.Random,
+    ) -> None:
+        """
+
+        Args:
+            events:
+            latency: Latency model of every link.
+            rng:
+        """
+        self.events = events
+        self.latency = latency
+        self.rng = rng
+        # Nodes that neither send nor receive, see crash
+        self.crashed: Set[Any] = set()
+        self.sent = 0
+        self.dropped = 0
+
+    def crash(self, node: Any) -> None:
+        """
+
+        Args:
+            node: Address of a node, its messages are dropped from now on.
+
+        Returns:
+
+        """
+        self.crashed.add(node)
+
+    def send(
+        self, source: Any, destination: Any, deliver: Callable[..., None], *message
+    ) -> None:
+        """
+
+        Args:
+            source: Address of the sender.
+            destination: Address of the receiver.
+            deliver: Handler of the receiver.
+            *message: Arguments of the handler.
+
+        Returns:
+
+        """
+        self.sent += 1
+        if source in self.crashed or destination in self.crashed:
+            self.dropped += 1
+            return
+        # Messages to self are handed over locally
+        delay = 0.0 if source is destination else self.latency.sample(self.rng)
+        self.events.schedule(delay, self._deliver, destination, deliver, message)
+
+    def _deliver(
+        self, destination: Any, deliver: Callable[..., None], message: Tuple
+    ) -> None:
+        if destination not in self.crashed:
+            deliver(*message)
@@ -0,0 +1,841 @@
+"""
+Deterministic discrete-event simulation of a DiemBFT deployment.
+
+Every validator runs the real Main, BlockTree, Safety, Pacemaker, LeaderElection,
+MemPool and Ledger, wired as in validator.da, but messages travel over the
+in-memory Network and time is a VirtualClock installed behind
+helpers.getTimeMillis. Clients generate open-loop load with the LoadGenerator
+of the workload module and check the batch commit proofs they receive. A run is
+a pure function of its configuration and seed, and goes as fast as the
+handlers execute, signature checks included: a few hundred rounds per second
+of wall time with four validators, whatever the round timeouts.
+
+    python -m modules.simulator.simulator [--validators N] [--duration S] \
+        [--policy fixed|adaptive] [--crashed ID ...] [--seed N] [--json]
+
+The command exits with an error if the ledgers of the live validators diverged,
+they disagreed on the leader of a round or a client received an invalid commit
+proof.
+
+Messages are handed over as objects by default. With ``envelopes`` every
+consensus message and transaction is sealed by its sender and opened by its
+receiver, as on the wire, at the cost of the signing and encoding work.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import sys
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from nacl.signing import SigningKey
+
+from modules.block_tree.block_tree import BlockTree
+from modules.leaderelection.leaderelection import LeaderElection
+from modules.ledger.ledger import Ledger
+from modules.ledger.ledger_writer import NullLedgerWriter
+from modules.main.main import Main
+from modules.mempool.mempool import MemPool
+from modules.merkle.merkle import verify_batch_commit_proof
+from modules.objects import BatchCommitProof, Signatures, Transaction
+from modules.pacemaker.pacemaker import Pacemaker
+from modules.pacemaker.round_timer import TimerPolicy, make_round_timer
+from modules.safety.safety import Safety
+from modules.simulator.network import (
+    ConstantLatency,
+    EventQueue,
+    ExponentialLatency,
+    LogNormalLatency,
+    Network,
+    UniformLatency,
+    VirtualClock,
+)
+from modules.utils import helpers as date_utils
+from modules.verification.certificate_verifier import CertificateVerifier
+from modules.workload.histogram import LatencyHistogram
+from modules.workload.workload import LoadConfig, LoadGenerator
+
+
+class LatencyModel:
+    CONSTANT = "constant"
+    UNIFORM = "uniform"
+    EXPONENTIAL = "exponential"
+    LOGNORMAL = "lognormal"
+
+
+def make_latency(model: str, latency: float, jitter: float) -> ConstantLatency:
+    """
+
+    Args:
+        model: One of LatencyModel.
+        latency: Milliseconds, the minimum of the uniform and exponential
+            models and the median of the log-normal one.
+        jitter: Milliseconds, the width of the uniform range, the mean of the
+            exponential part, and latency * sigma for the log-normal model.
+
+    Returns:
+
+    """
+    if model == LatencyModel.CONSTANT:
+        return ConstantLatency(latency)
+    if model == LatencyModel.UNIFORM:
+        return UniformLatency(latency, latency + jitter)
+    if model == LatencyModel.EXPONENTIAL:
+        return ExponentialLatency(latency, jitter)
+    if model == LatencyModel.LOGNORMAL:
+        return LogNormalLatency(latency, jitter / latency)
+    raise ValueError("Unknown latency model {}".format(model))
+
+
+def make_signing_key(seed: int, name: str) -> SigningKey:
+    """
+
+    Args:
+        seed:
+        name: Distinguishes the nodes of a run.
+
+    Returns:
+        A signing key derived from the seed, so runs are reproducible.
+    """
+    return SigningKey(hashlib.sha256("{}-{}".format(seed, name).encode()).digest())
+
+
+class SimulationConfig:
+    def __init__(
+        self,
+        validators: Optional[int] = 4,
+        clients: Optional[int] = 1,
+        duration: Optional[float] = 10.0,
+        rate: Optional[float] = 200.0,
+        max_outstanding: Optional[int] = 1000,
+        block_size: Optional[int] = 4,
+        latency_model: Optional[str] = LatencyModel.UNIFORM,
+        latency: Optional[float] = 5.0,
+        jitter: Optional[float] = 5.0,
+        gst: Optional[float] = 0.5,
+        round_timer_policy: Optional[str] = TimerPolicy.ADAPTIVE,
+        crashed: Optional[List[int]] = None,
+        envelopes: Optional[bool] = False,
+        reputation_leaders: Optional[bool] = False,
+        seed: Optional[int] = 0,
+    ) -> None:
+        """
+
+        Args:
+            validators:
+            clients:
+            duration: Virtual seconds of client load, the run then drains
+                for the drain timeout of the load config.
+            rate: Transactions per virtual second of every client.
+            max_outstanding: Unconfirmed transactions per client after which
+                scheduled ones are dropped.
+            block_size: Transactions per block.
+            latency_model: One of LatencyModel.
+            latency: Milliseconds, see make_latency.
+            jitter: Milliseconds, see make_latency.
+            gst: Global stabilization time in seconds, as in TestConfig.
+            round_timer_policy: One of TimerPolicy.
+            crashed: Ids of validators that are down for the whole run.
+            envelopes: Seal and open every message instead of handing over
+                the objects.
+            reputation_leaders: Elect reputation leaders instead of round
+                robin ones, see LeaderElection.update_leaders.
+            seed:
+        """
+        self.validators = validators
+        self.clients = clients
+        self.duration = duration
+        self.rate = rate
+        self.max_outstanding = max_outstanding
+        self.block_size = block_size
+        self.latency_model = latency_model
+        self.latency = latency
+        self.jitter = jitter
+        self.gst = gst
+        self.round_timer_policy = round_timer_policy
+        self.crashed = crashed if crashed else []
+        self.envelopes = envelopes
+        self.reputation_leaders = reputation_leaders
+        self.seed = seed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+
+class SimValidator:
+    def __init__(
+        self, simulator: "Simulator", id: int, key: SigningKey, keypair_map
+    ) -> None:
+        """
+
+        Args:
+            simulator:
+            id:
+            key:
+            keypair_map: Signing and verify keys of every validator by id.
+        """
+        config = simulator.config
+        f = (config.validators - 1) // 3
+        self.simulator = simulator
+        self.id = id
+        self.key = key
+        self.safety = Safety(key, keypair_map, id)
+        self.ledger = Ledger(id, writer=NullLedgerWriter())
+        block_tree = BlockTree(self.ledger, f, id)
+        block_tree.block_size = config.block_size
+        leader_election = LeaderElection(
+            config.validators, reputation=config.reputation_leaders
+        )
+        pacemaker = Pacemaker(
+            f,
+            id,
+            leader_election,
+            config.gst,
+            make_round_timer(config.round_timer_policy, config.gst),
+        )
+        self.mempool = MemPool()
+        self.main = Main(
+            block_tree,
+            leader_election,
+            pacemaker,
+            self.safety,
+            self.ledger,
+            self.mempool,
+            id,
+        )
+        self.init_state = True
+        # Leader of every round reached, as seen while in that round
+        self.leaders: Dict[int, int] = {}
+        # Time the round timer was last restarted by a local timeout
+        self.timer_restart: float = 0.0
+        # Deadline of the live timer event, earlier events are stale
+        self.deadline: Optional[float] = None
+        self.local_timeouts = 0
+
+    def others(self) -> List["SimValidator"]:
+        return [v for v in self.simulator.validators if v is not self]
+
+    def propose(self, proposal) -> None:
+        """Broadcast a proposal to every validator, the leader included so it
+        votes for its own block.
+
+        Args:
+            proposal:
+
+        Returns:
+
+        """
+        self.simulator.broadcast(
+            self, self.simulator.validators, "on_proposal", proposal
+        )
+
+    def on_transaction(self, transaction: Transaction) -> None:
+        """
+
+        Args:
+            transaction:
+
+        Returns:
+
+        """
+        if not self.mempool.is_processed(transaction.id):
+            self.mempool.add(transaction)
+        if (
+            self.init_state
+            and self.main.check_if_current_leader()
+            and self.main.pacemaker.current_round == 0
+            and len(self.mempool.queue) > 0
+        ):
+            proposal = self.main.get_next_proposal(None, [])
+            if proposal:
+                self.init_state = False
+                self.propose(proposal)
+        self.arm_timer()
+
+    def on_proposal(self, proposal) -> None:
+        """
+
+        Args:
+            proposal:
+
+        Returns:
+
+        """
+        if self.main.defer_orphan(proposal):
+            return
+        vote, trx_to_deque = self.main.process_proposal_msg(proposal)
+        self.send_client_replies(self.main.deque_trx(trx_to_deque))
+        next_leader = self.main.leader_election.get_leader(
+            self.main.pacemaker.current_round + 1
+        )
+        if vote:
+            self.simulator.send(
+                self,
+                self.simulator.validators[next_leader],
+                "on_vote",
+                vote,
+                proposal.trx_ids,
+            )
+        # Votes that overtook the proposal form its QC now
+        new_qc, deque_txns = self.main.process_pending_votes(proposal.block)
+        self.send_client_replies(self.main.deque_trx(deque_txns))
+        if new_qc:
+            self.on_new_qc(new_qc, proposal.trx_ids)
+        for orphan in self.main.release_orphans(proposal.block):
+            self.on_proposal(orphan)
+        self.arm_timer()
+
+    def on_vote(self, vote, trx_ids: List[str]) -> None:
+        """
+
+        Args:
+            vote:
+            trx_ids: Transactions of the block voted for.
+
+        Returns:
+
+        """
+        new_qc, deque_txns = self.main.process_vote_msg(vote)
+        self.send_client_replies(self.main.deque_trx(deque_txns))
+        if new_qc:
+            self.on_new_qc(new_qc, trx_ids)
+        self.arm_timer()
+
+    def on_new_qc(self, new_qc, trx_ids: List[str]) -> None:
+        """
+
+        Args:
+            new_qc: A QC formed by this validator.
+            trx_ids: Transactions of the block certified by new_qc.
+
+        Returns:
+
+        """
+        next_proposal = (
+            self.main.get_next_proposal(new_qc, trx_ids)
+            if self.main.check_if_current_leader()
+            else None
+        )
+        if next_proposal:
+            self.propose(next_proposal)
+
+    def on_timeout(self, timeout_msg) -> None:
+        """
+
+        Args:
+            timeout_msg:
+
+        Returns:
+
+        """
+        new_proposal, deque_txns = self.main.process_timeout_msg(timeout_msg)
+        self.send_client_replies(self.main.deque_trx(deque_txns))
+        if new_proposal:
+            self.propose(new_proposal)
+        self.arm_timer()
+
+    def send_client_replies(self, trx_client_map: Dict[str, int]) -> None:
+        """
+
+        Args:
+            trx_client_map: Client id of each committed transaction.
+
+        Returns:
+
+        """
+        trx_client_map = self.main.durable_replies(trx_client_map)
+        for client_id, proof in self.main.client_reply_batches(trx_client_map):
+            self.simulator.send(
+                self,
+                self.simulator.clients[client_id],
+                "on_reply",
+                proof,
+                seal=False,
+            )
+
+    def arm_timer(self) -> None:
+        """Schedule the expiry of the round timer if it moved.
+
+        Returns:
+
+        """
+        pacemaker = self.main.pacemaker
+        self.leaders[pacemaker.current_round] = self.main.leader_election.get_leader(
+            pacemaker.current_round
+        )
+        deadline = (
+            max(pacemaker.timer_start, self.timer_restart)
+            + pacemaker.get_round_timer() * 1000
+        )
+        if deadline == self.deadline:
+            return
+        self.deadline = deadline
+        self.simulator.events.schedule(
+            deadline - self.simulator.clock.now, self.on_timer, deadline
+        )
+
+    def on_timer(self, deadline: float) -> None:
+        """
+
+        Args:
+            deadline: Deadline the event was scheduled for.
+
+        Returns:
+
+        """
+        if deadline != self.deadline or self in self.simulator.network.crashed:
+            return
+        self.local_timeouts += 1
+        self.init_state = False
+        self.timer_restart = self.simulator.clock.now
+        timeout_msg = self.main.pacemaker.local_timeout_round(
+            self.safety, self.main.block_tree
+        )
+        if timeout_msg.tmo_info is not None:
+            self.on_timeout(timeout_msg)
+            self.simulator.broadcast(self, self.others(), "on_timeout", timeout_msg)
+        self.arm_timer()
+
+    def committed_ids(self) -> List[str]:
+        return [
+            committed_block.block.id for committed_block in self.ledger.iter_blocks()
+        ]
+
+
+class SimClient:
+    def __init__(
+        self,
+        simulator: "Simulator",
+        id: int,
+        key: SigningKey,
+        load_config: LoadConfig,
+        certificate_verifier: CertificateVerifier,
+    ) -> None:
+        """
+
+        Args:
+            simulator:
+            id:
+            key:
+            load_config:
+            certificate_verifier: Checks the QC of commit proofs.
+        """
+        self.simulator = simulator
+        self.id = id
+        self.key = key
+        self.load_generator = LoadGenerator(load_config, id)
+        self.certificate_verifier = certificate_verifier
+        self.rng = random.Random("{}-client-{}".format(load_config.seed, id))
+        # Transactions sent and not confirmed yet, by id
+        self.pending_requests: Dict[str, Transaction] = {}
+        self.invalid_proofs = 0
+
+    def start(self) -> None:
+        self.load_generator.start(self.simulator.clock.now)
+        self.tick()
+
+    def tick(self) -> None:
+        """Send the transactions that are due and wait for the next slot.
+
+        Returns:
+
+        """
+        now = self.simulator.clock.now
+        for _ in range(self.load_generator.due(now)):
+            transaction = Transaction(
+                self.load_generator.next_command(),
+                "{:032x}".format(self.rng.getrandbits(128)),
+                self.id,
+            )
+            self.pending_requests[transaction.id] = transaction
+            self.simulator.broadcast(
+                self, self.simulator.validators, "on_transaction", transaction
+            )
+            self.load_generator.on_sent(transaction.id, now)
+        if self.load_generator.finished_sending(now):
+            return
+        # At least a microsecond, the slot arithmetic may round to now
+        self.simulator.events.schedule(
+            max(self.load_generator.next_send_delay(now) * 1000, 0.001), self.tick
+        )
+
+    def on_reply(self, proof: BatchCommitProof) -> None:
+        """
+
+        Args:
+            proof:
+
+        Returns:
+
+        """
+        confirmed = verify_batch_commit_proof(
+            proof, self.pending_requests, self.certificate_verifier
+        )
+        if not confirmed and any(
+            trx_id in self.pending_requests for trx_id in proof.trx_ids
+        ):
+            self.invalid_proofs += 1
+        for trx_id in confirmed:
+            self.pending_requests.pop(trx_id)
+            self.load_generator.on_committed(trx_id, self.simulator.clock.now)
+
+
+class Simulator:
+    def __init__(self, config: SimulationConfig) -> None:
+        """
+
+        Args:
+            config:
+        """
+        self.config = config
+        self.clock = VirtualClock()
+        self.events = EventQueue(self.clock)
+        self.network = Network(
+            self.events,
+            make_latency(config.latency_model, config.latency, config.jitter),
+            random.Random("{}-network".format(config.seed)),
+        )
+        self.load_config = LoadConfig(
+            config.rate,
+            config.max_outstanding,
+            config.duration,
+            seed=config.seed,
+        )
+        self.validators: List[SimValidator] = []
+        self.clients: List[SimClient] = []
+        self.wall_time = 0.0
+
+    def setup(self) -> None:
+        """Create the nodes, under the virtual clock.
+
+        Returns:
+
+        """
+        keys = [
+            make_signing_key(self.config.seed, "validator-{}".format(i))
+            for i in range(self.config.validators)
+        ]
+        keypair_map = {i: (key, key.verify_key) for i, key in enumerate(keys)}
+        self.validators = [
+            SimValidator(self, i, key, keypair_map) for i, key in enumerate(keys)
+        ]
+        self.clients = [
+            SimClient(
+                self,
+                i,
+                make_signing_key(self.config.seed, "client-{}".format(i)),
+                self.load_config,
+                CertificateVerifier({i: key.verify_key for i, key in enumerate(keys)}),
+            )
+            for i in range(self.config.clients)
+        ]
+        for validator_id in self.config.crashed:
+            self.network.crash(self.validators[validator_id])
+
+    def send(
+        self,
+        source: Any,
+        destination: Any,
+        handler: str,
+        message: Any,
+        *extra,
+        seal: Optional[bool] = True
+    ) -> None:
+        """
+
+        Args:
+            source: Sending node.
+            destination: Receiving node.
+            handler: Name of the method of the destination handling message.
+            message:
+            *extra: Further arguments of the handler.
+            seal: Whether message is signed on the wire.
+
+        Returns:
+
+        """
+        if seal and self.config.envelopes:
+            message = message.create_signed_payload(source.key)
+        self.network.send(
+            source,
+            destination,
+            self.receive,
+            source,
+            getattr(destination, handler),
+            message,
+            extra,
+            seal,
+        )
+
+    def broadcast(
+        self, source: Any, destinations: List[Any], handler: str, message: Any
+    ) -> None:
+        """Seal once and send to every destination.
+
+        Args:
+            source:
+            destinations:
+            handler:
+            message:
+
+        Returns:
+
+        """
+        if self.config.envelopes:
+            message = message.create_signed_payload(source.key)
+        for destination in destinations:
+            self.network.send(
+                source,
+                destination,
+                self.receive,
+                source,
+                getattr(destination, handler),
+                message,
+                (),
+                True,
+            )
+
+    def receive(self, source: Any, handler, message: Any, extra, sealed: bool) -> None:
+        if sealed and self.config.envelopes:
+            message = Signatures.verify_signed_payload(message, source.key.verify_key)
+            if message is False:
+                raise Exception("There is an imposter among us !!")
+        handler(message, *extra)
+
+    def run(self) -> Dict[str, Any]:
+        """
+
+        Returns:
+            The report of the run, see report.
+        """
+        end = (self.config.duration + self.load_config.drain_timeout) * 1000
+        date_utils.set_clock(self.clock.millis)
+        started = time.perf_counter()
+        try:
+            self.setup()
+            for client in self.clients:
+                self.events.schedule(0, client.start)
+            for validator in self.validators:
+                if validator not in self.network.crashed:
+                    validator.arm_timer()
+            while self.events and self.events.next_time() <= end:
+                self.events.step()
+        finally:
+            self.wall_time = time.perf_counter() - started
+            date_utils.set_clock(None)
+        self.clock.now = max(self.clock.now, end)
+        return self.report()
+
+    def consistent(self) -> bool:
+        """
+
+        Returns:
+            True if the ledgers of the live validators are prefixes of one
+            another.
+        """
+        ledgers = sorted(
+            (
+                validator.committed_ids()
+                for validator in self.validators
+                if validator not in self.network.crashed
+            ),
+            key=len,
+        )
+        return all(
+            shorter == longer[: len(shorter)]
+            for shorter, longer in zip(ledgers, ledgers[1:])
+        )
+
+    def leader_disagreements(self) -> List[int]:
+        """
+
+        Returns:
+            Rounds whose leader was not the same for every live validator
+            that reached them.
+        """
+        leaders: Dict[int, Set[int]] = {}
+        for validator in self.validators:
+            if validator not in self.network.crashed:
+                for round, leader in validator.leaders.items():
+                    leaders.setdefault(round, set()).add(leader)
+        return sorted(round for round, seen in leaders.items() if len(seen) > 1)
+
+    def report(self) -> Dict[str, Any]:
+        """
+
+        Returns:
+            Progress of every validator, the merged client latencies in
+            milliseconds and the simulation speed.
+        """
+        live = [v for v in self.validators if v not in self.network.crashed]
+        rounds = max(v.main.pacemaker.current_round for v in live)
+        histogram = LatencyHistogram()
+        for client in self.clients:
+            histogram.merge(client.load_generator.histogram)
+        committed = sum(c.load_generator.committed for c in self.clients)
+        virtual_time = self.clock.now / 1000
+        return {
+            "config": self.config.to_dict(),
+            "virtual_s": round(virtual_time, 3),
+            "wall_s": round(self.wall_time, 3),
+            "events": self.events.fired,
+            "rounds": rounds,
+            "rounds_per_wall_s": (
+                round(rounds / self.wall_time, 1) if self.wall_time else 0
+            ),
+            "local_timeouts": sum(v.local_timeouts for v in live),
+            "committed_blocks": max(v.ledger.height() for v in live),
+            "committed_transactions": committed,
+            "sent_transactions": sum(c.load_generator.sent for c in self.clients),
+            "dropped_transactions": sum(c.load_generator.dropped for c in self.clients),
+            "throughput_tps": round(committed / self.config.duration, 3),
+            "latency_ms": histogram.summary(scale=1e-3),
+            "invalid_proofs": sum(c.invalid_proofs for c in self.clients),
+            "messages_sent": self.network.sent,
+            "messages_dropped": self.network.dropped,
+            "consistent": self.consistent(),
+            "leader_disagreements": self.leader_disagreements(),
+            "validators": {
+                v.id: {
+                    "round": v.main.pacemaker.current_round,
+                    "committed_blocks": v.ledger.height(),
+                    "local_timeouts": v.local_timeouts,
+                    "crashed": v in self.network.crashed,
+                }
+                for v in self.validators
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--validators", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--rate", type=float, default=200.0, help="tps per client")
+    parser.add_argument("--max-outstanding", type=int, default=1000)
+    parser.add_argument("--block-size", type=int, default=4)
+    parser.add_argument(
+        "--latency-model",
+        default=LatencyModel.UNIFORM,
+        choices=[
+            LatencyModel.CONSTANT,
+            LatencyModel.UNIFORM,
+            LatencyModel.EXPONENTIAL,
+            LatencyModel.LOGNORMAL,
+        ],
+    )
+    parser.add_argument("--latency", type=float, default=5.0, help="ms")
+    parser.add_argument("--jitter", type=float, default=5.0, help="ms")
+    parser.add_argument("--gst", type=float, default=0.5, help="seconds")
+    parser.add_argument(
+        "--policy",
+        default=TimerPolicy.ADAPTIVE,
+        choices=[TimerPolicy.FIXED, TimerPolicy.ADAPTIVE],
+    )
+    parser.add_argument("--crashed", type=int, nargs="*", default=[])
+    parser.add_argument(
+        "--envelopes", action="store_true", help="seal and open every message"
+    )
+    parser.add_argument(
+        "--reputation-leaders",
+        action="store_true",
+        help="elect reputation leaders instead of round robin ones",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the JSON report")
+    args = parser.parse_args()
+
+    report = Simulator(
+        SimulationConfig(
+            validators=args.validators,
+            clients=args.clients,
+            duration=args.duration,
+            rate=args.rate,
+            max_outstanding=args.max_outstanding,
+            block_size=args.block_size,
+            latency_model=args.latency_model,
+            latency=args.latency,
+            jitter=args.jitter,
+            gst=args.gst,
+            round_timer_policy=args.policy,
+            crashed=args.crashed,
+            envelopes=args.envelopes,
+            reputation_leaders=args.reputation_leaders,
+            seed=args.seed,
+        )
+    ).run()
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print_report(report)
+    failures = report_failures(report)
+    if failures:
+        sys.exit("Simulation failed: {}".format(", ".join(failures)))
+
+
+def report_failures(report: Dict[str, Any]) -> List[str]:
+    """
+
+    Args:
+        report: See Simulator.report.
+
+    Returns:
+        What went wrong in the run, empty if nothing did.
+    """
+    failures = []
+    if not report["consistent"]:
+        failures.append("ledgers diverged")
+    if report["leader_disagreements"]:
+        failures.append(
+            "leaders disagree in rounds {}".format(report["leader_disagreements"])
+        )
+    if report["invalid_proofs"]:
+        failures.append("{} invalid commit proofs".format(report["invalid_proofs"]))
+    return failures
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    """
+
+    Args:
+        report: See Simulator.report.
+
+    Returns:
+
+    """
+    print(
+        "{} rounds in {}s virtual, {}s wall ({} rounds/s), {} local timeouts".format(
+            report["rounds"],
+            report["virtual_s"],
+            report["wall_s"],
+            report["rounds_per_wall_s"],
+            report["local_timeouts"],
+        )
+    )
+    print(
+        "{} of {} transactions committed ({} tps), {} dropped, latency {}".format(
+            report["committed_transactions"],
+            report["sent_transactions"],
+            report["throughput_tps"],
+            report["dropped_transactions"],
+            report["latency_ms"],
+        )
+    )
+    print(
+        "{} blocks committed, ledgers {}, leaders {}".format(
+            report["committed_blocks"],
+            "consistent" if report["consistent"] else "DIVERGED",
+            (
+                "agree"
+                if not report["leader_disagreements"]
+                else "DISAGREE in rounds {}".format(report["leader_disagreements"])
+            ),
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Optimistic parallel execution of the transactions of a block.
+
+Every transaction is first executed on a process pool against a snapshot of
+the state before the block. Results are then validated in block order: a
+transaction whose reads include a key written by an earlier transaction of
+the same block is executed again, serially, against the state left by its
+predecessors. Every accepted write therefore equals the one serial execution
+would make, so the block ends in the same state and state id.
+
+Parallel execution only pays off when the work that can actually run side by
+side outweighs shipping the block to the pool. A block is therefore executed
+serially when the pool cannot use two CPUs, when it is small, or when the
+estimated cost of its transactions that touch no key written earlier in the
+block is below a threshold.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from modules.objects import Transaction
+from modules.state_machine.state_machine import (
+    TOMBSTONE,
+    Command,
+    command_key,
+    run_command,
+)
+
+# (keys read with the values seen, key written, value written)
+Result = Tuple[Dict[str, Any], str, Any]
+
+
+def _execute_chunk(
+    commands: List[Tuple[str, str]], snapshot: Dict[str, Any]
+) -> List[Result]:
+    """Run in a pool worker.
+
+    Args:
+        commands: (command, transaction id) pairs.
+        snapshot: Value before the block of every key the commands touch.
+
+    Returns:
+        The result of every command against the snapshot.
+    """
+    results = []
+    for command, trx_id in commands:
+        reads: Dict[str, Any] = {}
+
+        def read(key: str) -> Optional[Any]:
+            reads[key] = snapshot.get(key)
+            return reads[key]
+
+        key, value = run_command(command, trx_id, read)
+        results.append((reads, key, value))
+    return results
+
+
+def command_cost(command: str) -> int:
+    """
+
+    Args:
+        command:
+
+    Returns:
+        Estimated cost of the command, in SHA-256 rounds.
+    """
+    op, _, rest = command.partition(" ")
+    if op == Command.HASH:
+        rounds = rest.partition(" ")[2]
+        if rounds.isdigit():
+            return max(int(rounds), 1)
+    return 1
+
+
+def independent_cost(txns: List[Transaction]) -> int:
+    """
+
+    Args:
+        txns: Payload of a block, in order.
+
+    Returns:
+        Estimated cost of the transactions whose key no earlier transaction
+        of the block writes, the part of the block that can run in parallel.
+    """
+    written = set()
+    cost = 0
+    for trx in txns:
+        key = command_key(trx.command)
+        if key not in written:
+            cost += command_cost(trx.command)
+            written.add(key)
+    return cost
+
+
+def _read_through(
+    writes: Dict[str, Any], read: Callable[[str], Optional[Any]], key: str
+) -> Optional[Any]:
+    if key not in writes:
+        return read(key)
+    value = writes[key]
+    return None if value is TOMBSTONE else value
+
+
+class ParallelExecutor:
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        min_parallel: Optional[int] = 64,
+        chunk_size: Optional[int] = None,
+        min_cost: Optional[int] = 20000,
+    ) -> None:
+        """
+
+        Args:
+            workers: Pool processes, one per CPU by default.
+            min_parallel: Smaller blocks are executed serially.
+            chunk_size: Transactions per pool task, by default the block is
+                split evenly over the workers.
+            min_cost: Blocks whose independent_cost is lower are executed
+                serially, 0 to only apply min_parallel.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.min_parallel = min_parallel
+        self.chunk_size = chunk_size
+        self.min_cost = min_cost
+        # More processes than CPUs only add overhead
+        self.parallelism = min(self.workers, os.cpu_count() or 1)
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.executed = 0
+        self.reexecuted = 0
+        self.serial = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers)
+        return self.pool
+
+    def is_worth_parallel(self, txns: List[Transaction]) -> bool:
+        """
+
+        Args:
+            txns: Payload of the block, in order.
+
+        Returns:
+            Whether the block is expected to execute faster on the pool.
+        """
+        if len(txns) < self.min_parallel:
+            return False
+        if self.min_cost and (
+            self.parallelism < 2 or independent_cost(txns) < self.min_cost
+        ):
+            return False
+        return True
+
+    def execute(
+        self, txns: List[Transaction], read: Callable[[str], Optional[Any]]
+    ) -> Dict[str, Any]:
+        """
+
+        Args:
+            txns: Payload of the block, in order.
+            read: Returns the value of a key before the block.
+
+        Returns:
+            The writes of the block, as serial execution would leave them.
+        """
+        writes: Dict[str, Any] = {}
+        if not self.is_worth_parallel(txns):
+            for trx in txns:
+                key, value = run_command(
+                    trx.command, trx.id, lambda k: _read_through(writes, read, k)
+                )
+                writes[key] = value
+            self.serial += len(txns)
+            return writes
+
+        pool = self._pool()
+        chunk_size = self.chunk_size or -(-len(txns) // self.workers)
+        futures = []
+        for start in range(0, len(txns), chunk_size):
+            chunk = [(trx.command, trx.id) for trx in txns[start : start + chunk_size]]
+            snapshot = {}
+            for command, _ in chunk:
+                key = command_key(command)
+                if key not in snapshot:
+                    snapshot[key] = read(key)
+            futures.append(pool.submit(_execute_chunk, chunk, snapshot))
+
+        index = 0
+        for future in futures:
+            for reads, key, value in future.result():
+                if any(read_key in writes for read_key in reads):
+                    trx = txns[index]
+                    key, value = run_command(
+                        trx.command, trx.id, lambda k: _read_through(writes, read, k)
+                    )
+                    self.reexecuted += 1
+                writes[key] = value
+                index += 1
+        self.executed += len(txns)
+        return writes
+
+    def close(self) -> None:
+        """Stop the pool workers.
+
+        Returns:
+
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def metrics(self) -> Dict[str, int]:
+        """
+
+        Returns:
+            Transactions executed in parallel, how many of them conflicted and
+            how many fell back to serial execution.
+        """
+        return {
+            "executed": self.executed,
+            "reexecuted": self.reexecuted,
+            "serial": self.serial,
+        }
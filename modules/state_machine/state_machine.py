@@ -0,0 +1,275 @@
+"""
+Deterministic key-value state machine behind the Ledger.
+
+Commands are executed in payload order:
+
+    SET <key> <value>     set key to value
+    DEL <key>             delete key
+    INCR <key> [<n>]      add n (default 1) to the integer at key
+    HASH <key> <n>        replace the value at key by its n-fold SHA-256
+
+Any other command sets the key named by the whole command to the id of its
+transaction, so arbitrary client commands still execute deterministically.
+
+Every pending block executes into an Overlay that records only the keys it
+wrote and reads through its parent's overlay down to the committed store.
+Committing a block folds its overlay into the store and dropping a pruned
+block discards its overlay, both in time proportional to the keys it wrote.
+"""
+
+import hashlib
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from modules.objects import Hasher, Transaction
+
+
+class _Tombstone:
+    def __reduce__(self) -> str:
+        # Unpickles to the module singleton, also in pool workers
+        return "TOMBSTONE"
+
+    def __repr__(self) -> str:
+        return "TOMBSTONE"
+
+
+# Marks a key deleted by an overlay
+TOMBSTONE = _Tombstone()
+
+
+class Command:
+    SET = "SET"
+    DEL = "DEL"
+    INCR = "INCR"
+    HASH = "HASH"
+
+
+def command_key(command: str) -> str:
+    """
+
+    Args:
+        command:
+
+    Returns:
+        The key the command reads or writes.
+    """
+    op, _, rest = command.partition(" ")
+    if op in (Command.SET, Command.DEL, Command.INCR, Command.HASH) and rest:
+        return rest.partition(" ")[0]
+    return command
+
+
+def run_command(
+    command: str, trx_id: str, read: Callable[[str], Optional[Any]]
+) -> Tuple[str, Any]:
+    """Execute a single command.
+
+    Args:
+        command:
+        trx_id: Id of the transaction carrying the command.
+        read: Returns the current value of a key, None if it is not set.
+
+    Returns:
+        The key the command writes and its new value or TOMBSTONE.
+    """
+    op, _, rest = command.partition(" ")
+    if op == Command.SET and rest:
+        key, _, value = rest.partition(" ")
+        return key, value
+    if op == Command.DEL and rest:
+        return rest, TOMBSTONE
+    if op == Command.INCR and rest:
+        key, _, amount = rest.partition(" ")
+        try:
+            return key, int(read(key) or 0) + int(amount or 1)
+        except ValueError:
+            pass
+    if op == Command.HASH and rest:
+        key, _, rounds = rest.partition(" ")
+        if rounds.isdigit():
+            value = str(read(key) or "")
+            for _ in range(int(rounds)):
+                value = hashlib.sha256(value.encode("utf-8")).hexdigest()
+            return key, value
+    return command, trx_id
+
+
+class Overlay:
+    def __init__(
+        self,
+        parent: Optional["Overlay"],
+        state_id: str,
+        parent_id: Optional[str] = None,
+    ) -> None:
+        """
+
+        Args:
+            parent: Overlay of the parent block, None if it is committed.
+            state_id: State id of the parent, replaced once executed.
+            parent_id: Block id of parent.
+        """
+        self.parent = parent
+        self.parent_id = parent_id if parent is not None else None
+        self.state_id = state_id
+        self.writes: Dict[str, Any] = {}
+
+
+class StateMachine:
+    def __init__(self, executor=None) -> None:
+        """
+
+        Args:
+            executor: ParallelExecutor for the transactions of a block, they
+                are executed serially if None.
+        """
+        self.store: Dict[str, Any] = {}
+        self.state_id = ""
+        self.overlays: Dict[str, Overlay] = {}
+        self.executor = executor
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def get(self, key: str, block_id: Optional[str] = None) -> Optional[Any]:
+        """
+
+        Args:
+            key:
+            block_id: Read the speculative state after this pending block,
+                the committed state if None or not pending.
+
+        Returns:
+            The value of key, None if it is not set.
+        """
+        overlay = self.overlays.get(block_id) if block_id is not None else None
+        return self._read(overlay, key)
+
+    def _read(self, overlay: Optional[Overlay], key: str) -> Optional[Any]:
+        while overlay is not None:
+            value = overlay.writes.get(key)
+            if value is not None:
+                return None if value is TOMBSTONE else value
+            overlay = overlay.parent
+        return self.store.get(key)
+
+    def execute(
+        self,
+        block_id: str,
+        parent_id: Optional[str],
+        txns: List[Transaction],
+        payload_digest: Optional[str] = None,
+    ) -> str:
+        """Execute a pending block on top of its parent.
+
+        Args:
+            block_id:
+            parent_id: Parent block, executed against the committed state if
+                it is not pending.
+            txns:
+            payload_digest: Block.payload_digest() of txns if already known.
+
+        Returns:
+            The state id after the block.
+        """
+        parent = self.overlays.get(parent_id) if parent_id is not None else None
+        overlay = Overlay(
+            parent, parent.state_id if parent else self.state_id, parent_id
+        )
+        if self.executor is not None:
+            overlay.writes = self.executor.execute(
+                txns, lambda key: self._read(parent, key)
+            )
+        else:
+            for trx in txns:
+                key, value = self.apply(overlay, trx)
+                overlay.writes[key] = value
+        overlay.state_id = Hasher.digest(
+            "State",
+            overlay.state_id,
+            payload_digest if payload_digest else Hasher.payload_digest(txns),
+            self.write_set(overlay),
+        )
+        self.overlays[block_id] = overlay
+        return overlay.state_id
+
+    def apply(self, overlay: Overlay, trx: Transaction) -> Tuple[str, Any]:
+        """
+
+        Args:
+            overlay: State the transaction reads.
+            trx:
+
+        Returns:
+            The key the transaction writes and its new value or TOMBSTONE.
+        """
+        return run_command(trx.command, trx.id, lambda key: self._read(overlay, key))
+
+    @staticmethod
+    def write_set(overlay: Overlay) -> List[Tuple[str, Any]]:
+        """
+
+        Args:
+            overlay:
+
+        Returns:
+            The writes of overlay sorted by key, deletes as None.
+        """
+        return [
+            (key, None if value is TOMBSTONE else value)
+            for key, value in sorted(overlay.writes.items())
+        ]
+
+    def commit(self, block_id: str) -> Optional[str]:
+        """Fold a block, and any pending ancestor, into the committed store.
+
+        Args:
+            block_id:
+
+        Returns:
+            The committed state id, None if the block is not pending.
+        """
+        overlay = self.overlays.pop(block_id, None)
+        if overlay is None:
+            return None
+        if (
+            overlay.parent is not None
+            and self.overlays.get(overlay.parent_id) is overlay.parent
+        ):
+            self.commit(overlay.parent_id)
+        for key, value in overlay.writes.items():
+            if value is TOMBSTONE:
+                self.store.pop(key, None)
+            else:
+                self.store[key] = value
+        self.state_id = overlay.state_id
+        # Children keep reading through the emptied overlay into the store
+        overlay.writes = {}
+        overlay.parent = None
+        overlay.parent_id = None
+        return self.state_id
+
+    def drop(self, block_id: str) -> None:
+        """Discard the overlay of a block on an abandoned branch.
+
+        Args:
+            block_id:
+
+        Returns:
+
+        """
+        self.overlays.pop(block_id, None)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """
+
+        Returns:
+            The committed key-value pairs.
+        """
+        return iter(self.store.items())
+
+    def pending_writes(self) -> int:
+        """
+
+        Returns:
+            Number of keys held by pending overlays.
+        """
+        return sum(len(overlay.writes) for overlay in self.overlays.values())
@@ -1,7 +1,27 @@
 import time
+from typing import Callable, Optional
+
+# Source of getTimeMillis, the wall clock if None, see set_clock
+_clock: Optional[Callable[[], float]] = None
+
+
+def set_clock(clock: Optional[Callable[[], float]]) -> None:
+    """Replace the clock behind getTimeMillis, for example by a virtual one.
+
+    Args:
+        clock: Returns the current time in milliseconds, None restores the
+            wall clock.
+
+    Returns:
+
+    """
+    global _clock
+    _clock = clock
 
 
 def getTimeMillis():
+    if _clock is not None:
+        return _clock()
     return round(time.time() * 1000)
 
 
@@ -0,0 +1,159 @@
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from nacl.signing import VerifyKey
+
+from modules.codec.envelope import open_envelope
+from modules.utils import helpers as date_utils
+
+
+def verify_batch(items: Sequence[Tuple[bytes, bytes]]) -> List[Optional[Any]]:
+    """Verify and decode a batch of signed payloads.
+
+    PyNaCl has no batch verification, so the batch is checked in one tight
+    loop over the raw envelopes, building verify keys once per signer.
+
+    Args:
+        items: (verify key bytes, signed envelope) pairs.
+
+    Returns:
+        The decoded payload of each item, or None if its signature is bad.
+    """
+    verify_keys: Dict[bytes, VerifyKey] = {}
+    results: List[Optional[Any]] = []
+    for key_bytes, signed_payload in items:
+        verify_key = verify_keys.get(key_bytes)
+        if verify_key is None:
+            verify_key = verify_keys[key_bytes] = VerifyKey(key_bytes)
+        results.append(open_envelope(signed_payload, verify_key))
+    return results
+
+
+class BatchVerifier:
+    """Buffers signed client transactions and verifies them in batches.
+
+    A batch is verified once ``max_batch`` transactions are buffered or the
+    oldest one has waited ``max_delay_ms``. Only the transactions whose
+    signature checks out are handed back to the caller.
+    """
+
+    def __init__(
+        self,
+        max_batch: Optional[int] = 64,
+        max_delay_ms: Optional[int] = 5,
+    ) -> None:
+        """
+
+        Args:
+            max_batch:
+            max_delay_ms:
+        """
+        self.max_batch = max_batch
+        self.max_delay_ms = max_delay_ms
+        self.buffer: List[Tuple[bytes, bytes]] = []
+        self.first_buffered_at: Optional[int] = None
+        self.verified = 0
+        self.rejected = 0
+        self.batches = 0
+        self.verify_seconds = 0.0
+
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+    def add(self, verify_key: VerifyKey, signed_payload: bytes) -> List[Any]:
+        """Buffer a signed transaction.
+
+        Args:
+            verify_key: Key of the client that signed the transaction.
+            signed_payload:
+
+        Returns:
+            The verified transactions of the batch, if this one closed it.
+        """
+        self.push(verify_key, signed_payload)
+        if self.is_due():
+            return self.flush()
+        return []
+
+    def push(self, verify_key: VerifyKey, signed_payload: bytes) -> None:
+        """Buffer a signed transaction without verifying the batch.
+
+        Args:
+            verify_key:
+            signed_payload:
+
+        Returns:
+
+        """
+        if not self.buffer:
+            self.first_buffered_at = date_utils.getTimeMillis()
+        self.buffer.append((bytes(verify_key), bytes(signed_payload)))
+
+    def is_due(self) -> bool:
+        """
+
+        Returns:
+            True if the buffered batch should be verified now.
+        """
+        if not self.buffer:
+            return False
+        return (
+            len(self.buffer) >= self.max_batch
+            or date_utils.getTimeMillis() - self.first_buffered_at >= self.max_delay_ms
+        )
+
+    def take(self) -> List[Tuple[bytes, bytes]]:
+        """Empty the buffer without verifying it.
+
+        Returns:
+            The buffered (verify key bytes, signed payload) pairs.
+        """
+        batch, self.buffer = self.buffer, []
+        self.first_buffered_at = None
+        return batch
+
+    def record(self, results: List[Optional[Any]], seconds: float) -> List[Any]:
+        """Account for a verified batch.
+
+        Args:
+            results: Output of verify_batch for the batch.
+            seconds: Time spent verifying it.
+
+        Returns:
+            The transactions whose signature is valid.
+        """
+        verified = [result for result in results if result is not None]
+        self.batches += 1
+        self.verified += len(verified)
+        self.rejected += len(results) - len(verified)
+        self.verify_seconds += seconds
+        return verified
+
+    def flush(self) -> List[Any]:
+        """Verify everything buffered so far.
+
+        Returns:
+            The transactions whose signature is valid.
+        """
+        if not self.buffer:
+            return []
+        batch = self.take()
+        start = time.perf_counter()
+        results = verify_batch(batch)
+        return self.record(results, time.perf_counter() - start)
+
+    def metrics(self) -> Dict[str, float]:
+        """
+
+        Returns:
+            Verification counters and throughput in transactions per second.
+        """
+        checked = self.verified + self.rejected
+        return {
+            "verified": self.verified,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "mean_batch_size": checked / self.batches if self.batches else 0.0,
+            "verify_seconds": self.verify_seconds,
+            "throughput": checked / self.verify_seconds if self.verify_seconds else 0.0,
+        }
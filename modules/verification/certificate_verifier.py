@@ -0,0 +1,378 @@
+import hashlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from nacl.signing import SigningKey, VerifyKey
+
+from modules.codec.codec import CodecError, encode_canonical
+from modules.objects import (
+    LedgerCommitInfo,
+    QuorumCertificate,
+    Signatures,
+    SignatureSet,
+    TimeoutCertificate,
+    TimeoutInfo,
+    VoteMsg,
+)
+
+
+class LRUCache:
+    """Size-bounded mapping that evicts the least recently used entry."""
+
+    def __init__(self, capacity: int) -> None:
+        """
+
+        Args:
+            capacity: Maximum number of entries.
+        """
+        self.capacity = capacity
+        self.entries: Dict[Hashable, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+
+        Args:
+            key:
+
+        Returns:
+            The cached value, or None on a miss.
+        """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+
+        Args:
+            key:
+            value: Must not be None.
+
+        Returns:
+
+        """
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def vote_signing_bytes(ledger_commit_info: LedgerCommitInfo) -> bytes:
+    """
+
+    Args:
+        ledger_commit_info:
+
+    Returns:
+        The bytes a validator signs when voting for ledger_commit_info.
+    """
+    return encode_canonical(ledger_commit_info)
+
+
+def sign_vote(ledger_commit_info: LedgerCommitInfo, signing_key: SigningKey) -> bytes:
+    """
+
+    Args:
+        ledger_commit_info:
+        signing_key:
+
+    Returns:
+        Raw Ed25519 signature of the vote, as aggregated into QCs.
+    """
+    return Signatures.sign_detached(vote_signing_bytes(ledger_commit_info), signing_key)
+
+
+def timeout_signing_bytes(round: int, high_qc_round: int) -> bytes:
+    """
+
+    Args:
+        round: Round that timed out.
+        high_qc_round: Round of the signer's high QC, -1 for the genesis QC.
+
+    Returns:
+        The bytes a validator signs when timing out of round, as in
+        sign_u(round, high_qc.round) of the pseudo-code.
+    """
+    return encode_canonical((round, high_qc_round))
+
+
+def sign_timeout(round: int, high_qc_round: int, signing_key: SigningKey) -> bytes:
+    """
+
+    Args:
+        round:
+        high_qc_round:
+        signing_key:
+
+    Returns:
+        Raw Ed25519 signature of the timeout, as aggregated into TCs.
+    """
+    return Signatures.sign_detached(
+        timeout_signing_bytes(round, high_qc_round), signing_key
+    )
+
+
+def certificate_digest(certificate: Any) -> bytes:
+    """
+
+    Args:
+        certificate: A QC or TC.
+
+    Returns:
+        SHA-256 of the canonical encoding of the certificate.
+    """
+    return hashlib.sha256(encode_canonical(certificate)).digest()
+
+
+class CertificateVerifier:
+    """Verifies the signatures of votes, QCs and TCs, each at most once.
+
+    The same certificates arrive over and over: every vote carries the
+    sender's high commit QC, every proposal its block QC and high commit QC,
+    and every timeout a high QC and the last round TC. Certificates that
+    verified are remembered by digest, and individual signatures by
+    (signer, message digest), so a QC assembled from votes already seen, or
+    a TC reusing timeout signatures, costs no signature checks at all. Both
+    caches are LRU bounded.
+    """
+
+    def __init__(
+        self,
+        public_keys: Dict[int, VerifyKey],
+        quorum: Optional[int] = None,
+        certificate_cache_size: Optional[int] = 1024,
+        signature_cache_size: Optional[int] = 16384,
+    ) -> None:
+        """
+
+        Args:
+            public_keys: Verify key of every validator by id.
+            quorum: Distinct signers a certificate needs, 2f + 1 of the
+                validators by default.
+            certificate_cache_size:
+            signature_cache_size:
+        """
+        self.public_keys = public_keys
+        self.quorum = (
+            quorum if quorum is not None else 2 * ((len(public_keys) - 1) // 3) + 1
+        )
+        self.certificates = LRUCache(certificate_cache_size)
+        self.signatures = LRUCache(signature_cache_size)
+        self.rejected = 0
+
+    def _verify_signature(
+        self,
+        signer: int,
+        message: bytes,
+        signature: bytes,
+        check: Callable[[VerifyKey], bool],
+    ) -> bool:
+        verify_key = self.public_keys.get(signer)
+        if verify_key is None or signature is None:
+            return False
+        key = (signer, hashlib.sha256(message).digest())
+        # Ed25519 is deterministic, a signer has one signature per message
+        if self.signatures.get(key) == bytes(signature):
+            return True
+        if not check(verify_key):
+            return False
+        self.signatures.put(key, bytes(signature))
+        return True
+
+    def verify_vote_signature(
+        self, signer: int, ledger_commit_info: LedgerCommitInfo, signature: bytes
+    ) -> bool:
+        """
+
+        Args:
+            signer:
+            ledger_commit_info:
+            signature: Raw signature from sign_vote.
+
+        Returns:
+
+        """
+        message = vote_signing_bytes(ledger_commit_info)
+        return self._verify_signature(
+            signer,
+            message,
+            signature,
+            lambda verify_key: Signatures.verify_detached(
+                message, signature, verify_key
+            ),
+        )
+
+    def verify_timeout_signature(
+        self, signer: int, round: int, high_qc_round: int, signature: bytes
+    ) -> bool:
+        """
+
+        Args:
+            signer:
+            round:
+            high_qc_round:
+            signature: Raw signature from sign_timeout.
+
+        Returns:
+
+        """
+        message = timeout_signing_bytes(round, high_qc_round)
+        return self._verify_signature(
+            signer,
+            message,
+            signature,
+            lambda verify_key: Signatures.verify_detached(
+                message, signature, verify_key
+            ),
+        )
+
+    def verify_timeout_info(self, tmo_info: TimeoutInfo) -> bool:
+        """
+
+        Args:
+            tmo_info:
+
+        Returns:
+            True if the sender signed the round and high QC round of tmo_info.
+        """
+        high_qc = tmo_info.high_qc
+        if self.verify_timeout_signature(
+            tmo_info.sender,
+            tmo_info.round,
+            high_qc.vote_info.round if high_qc else -1,
+            tmo_info.signature,
+        ):
+            return True
+        self.rejected += 1
+        return False
+
+    def _verify_certificate(
+        self, certificate: Any, verify_signatures: Callable[[], bool]
+    ) -> bool:
+        if certificate is None:
+            return True
+        try:
+            digest = certificate_digest(certificate)
+        except CodecError:
+            self.rejected += 1
+            return False
+        if self.certificates.get(digest):
+            return True
+        if not verify_signatures():
+            self.rejected += 1
+            return False
+        self.certificates.put(digest, True)
+        return True
+
+    def _has_quorum(self, signatures: SignatureSet) -> bool:
+        return (
+            isinstance(signatures, SignatureSet)
+            and signatures.is_well_formed(len(self.public_keys))
+            and len(signatures) >= self.quorum
+        )
+
+    def verify_qc(self, qc: Optional[QuorumCertificate]) -> bool:
+        """
+
+        Args:
+            qc: None stands for the genesis QC.
+
+        Returns:
+            True if 2f + 1 validators signed the QC's ledger commit info.
+        """
+
+        def verify_signatures() -> bool:
+            if qc.ledger_commit_info.vote_info_hash != qc.vote_info.digest():
+                return False
+            return self._has_quorum(qc.signatures) and all(
+                self.verify_vote_signature(signer, qc.ledger_commit_info, signature)
+                for signature, signer in qc.signatures
+            )
+
+        return self._verify_certificate(qc, verify_signatures)
+
+    def verify_tc(self, tc: Optional[TimeoutCertificate]) -> bool:
+        """
+
+        Args:
+            tc:
+
+        Returns:
+            True if 2f + 1 validators signed the TC round, each with the high
+            QC round the TC lists for it.
+        """
+
+        def verify_signatures() -> bool:
+            return (
+                self._has_quorum(tc.tmo_signatures)
+                and len(tc.tmo_high_qc_rounds) == len(tc.tmo_signatures)
+            ) and all(
+                self.verify_timeout_signature(signer, tc.round, qc_round, signature)
+                # Both in validator id order
+                for (signature, signer), qc_round in zip(
+                    tc.tmo_signatures, tc.tmo_high_qc_rounds
+                )
+            )
+
+        return self._verify_certificate(tc, verify_signatures)
+
+    def verify_vote(self, vote: VoteMsg) -> bool:
+        """
+
+        Args:
+            vote:
+
+        Returns:
+            True if the vote signature and the QC it carries are valid.
+        """
+        if not self.verify_vote_signature(
+            vote.sender, vote.ledger_commit_info, vote.signature
+        ):
+            self.rejected += 1
+            return False
+        return self.verify_qc(vote.high_commit_qc)
+
+    def is_valid_signatures(
+        self, qc: Optional[QuorumCertificate], tc: Optional[TimeoutCertificate]
+    ) -> bool:
+        """
+
+        Args:
+            qc:
+            tc:
+
+        Returns:
+
+        """
+        return self.verify_qc(qc) and self.verify_tc(tc)
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+
+        Returns:
+            Cache counters and the number of rejected certificates and votes.
+        """
+        return {
+            "certificates": self.certificates.metrics(),
+            "signatures": self.signatures.metrics(),
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,261 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from nacl.signing import VerifyKey
+
+from modules.verification.batch_verifier import BatchVerifier, verify_batch
+
+logger = logging.getLogger(__name__)
+
+
+class VerificationLane:
+    CONSENSUS = 0  # Proposals, votes and timeouts, always dispatched first
+    CLIENT = 1  # Client transactions, verified in batches
+
+
+class VerificationJob:
+    def __init__(
+        self, lane: int, items: List[Tuple[bytes, bytes]], context: Any
+    ) -> None:
+        """
+
+        Args:
+            lane:
+            items: (verify key bytes, signed payload) pairs verified together.
+            context: Returned alongside the results.
+        """
+        self.lane = lane
+        self.items = items
+        self.context = context
+        self.results: Optional[List[Optional[Any]]] = None
+        self.seconds = 0.0
+        self.done = threading.Event()
+
+
+class VerificationService:
+    """Verifies signed payloads on a pool of worker threads or processes.
+
+    Handlers submit signed payloads and return immediately; the event loop
+    later collects the verified objects, per lane in submission order. A
+    dispatcher thread hands jobs to the pool, consensus jobs ahead of client
+    batches, and never keeps more jobs in the pool than it has workers so a
+    burst of client traffic cannot queue up in front of a vote.
+
+    With ``workers=0`` every job is verified inline when it is submitted.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = 2,
+        use_processes: Optional[bool] = False,
+        batch_verifier: Optional[BatchVerifier] = None,
+    ) -> None:
+        """
+
+        Args:
+            workers: Number of pool workers, 0 verifies inline.
+            use_processes: Use a process pool instead of a thread pool.
+            batch_verifier: Buffer that groups client transactions into batches.
+        """
+        self.workers = workers
+        self.batch_verifier = batch_verifier if batch_verifier else BatchVerifier()
+        self.jobs: Dict[int, Deque[VerificationJob]] = {
+            VerificationLane.CONSENSUS: deque(),
+            VerificationLane.CLIENT: deque(),
+        }
+        self.consensus_verified = 0
+        self.consensus_rejected = 0
+        self.consensus_seconds = 0.0
+        self.executor: Optional[Executor] = None
+        self.dispatcher: Optional[threading.Thread] = None
+        if workers:
+            self.executor = (
+                ProcessPoolExecutor(workers)
+                if use_processes
+                else ThreadPoolExecutor(workers)
+            )
+            self.pending: "queue.PriorityQueue" = queue.PriorityQueue()
+            self.sequence = itertools.count()
+            self.slots = threading.Semaphore(workers)
+            self.dispatcher = threading.Thread(
+                target=self._dispatch, name="verification-dispatcher", daemon=True
+            )
+            self.dispatcher.start()
+
+    def __len__(self) -> int:
+        """
+
+        Returns:
+            Number of submitted payloads not collected yet.
+        """
+        return (
+            len(self.batch_verifier)
+            + len(self.jobs[VerificationLane.CONSENSUS])
+            + sum(len(job.items) for job in self.jobs[VerificationLane.CLIENT])
+        )
+
+    def submit(
+        self, lane: int, verify_key: VerifyKey, signed_payload: bytes, context=None
+    ) -> None:
+        """
+
+        Args:
+            lane: One of the VerificationLane values.
+            verify_key: Key of the signer.
+            signed_payload:
+            context: Returned with the verified consensus message, unused for
+                client transactions.
+
+        Returns:
+
+        """
+        if lane == VerificationLane.CLIENT:
+            self.batch_verifier.push(verify_key, signed_payload)
+            self.poll()
+            return
+        self._enqueue(
+            VerificationJob(lane, [(bytes(verify_key), bytes(signed_payload))], context)
+        )
+
+    def poll(self) -> None:
+        """Dispatch the buffered client transactions once their batch is due.
+
+        Returns:
+
+        """
+        if self.batch_verifier.is_due():
+            self._enqueue(
+                VerificationJob(
+                    VerificationLane.CLIENT, self.batch_verifier.take(), None
+                )
+            )
+
+    def next_poll_delay(self) -> float:
+        """
+
+        Returns:
+            Seconds until there may be something to poll or collect.
+        """
+        if self.jobs[VerificationLane.CONSENSUS] or self.jobs[VerificationLane.CLIENT]:
+            return 0.001
+        if len(self.batch_verifier):
+            return self.batch_verifier.max_delay_ms / 1000
+        return float("inf")
+
+    def ready(self) -> bool:
+        """
+
+        Returns:
+            True if collecting now would return something.
+        """
+        return any(jobs and jobs[0].done.is_set() for jobs in self.jobs.values())
+
+    def collect_consensus(self) -> List[Tuple[Any, Any]]:
+        """
+
+        Returns:
+            (context, verified object or None) for every consensus message
+            verified so far, stopping at the first one still in progress.
+        """
+        collected = []
+        for job in self._collect(VerificationLane.CONSENSUS):
+            result = job.results[0]
+            self.consensus_seconds += job.seconds
+            if result is None:
+                self.consensus_rejected += 1
+            else:
+                self.consensus_verified += 1
+            collected.append((job.context, result))
+        return collected
+
+    def collect_client(self) -> List[Any]:
+        """
+
+        Returns:
+            Client transactions whose signature was verified so far.
+        """
+        verified = []
+        for job in self._collect(VerificationLane.CLIENT):
+            verified.extend(self.batch_verifier.record(job.results, job.seconds))
+        return verified
+
+    def _collect(self, lane: int) -> List[VerificationJob]:
+        jobs = self.jobs[lane]
+        collected = []
+        while jobs and jobs[0].done.is_set():
+            collected.append(jobs.popleft())
+        return collected
+
+    def _enqueue(self, job: VerificationJob) -> None:
+        self.jobs[job.lane].append(job)
+        if self.executor is None:
+            start = time.perf_counter()
+            job.results = verify_batch(job.items)
+            job.seconds = time.perf_counter() - start
+            job.done.set()
+            return
+        self.pending.put((job.lane, next(self.sequence), job))
+
+    def _dispatch(self) -> None:
+        while True:
+            _, _, job = self.pending.get()
+            if job is None:
+                return
+            self.slots.acquire()
+            start = time.perf_counter()
+            try:
+                future = self.executor.submit(verify_batch, job.items)
+            except RuntimeError:
+                self.slots.release()
+                return
+            future.add_done_callback(
+                lambda future, job=job, start=start: self._finish(job, future, start)
+            )
+
+    def _finish(self, job: VerificationJob, future, start: float) -> None:
+        try:
+            job.results = future.result()
+        except Exception:
+            logger.exception("Signature verification job failed")
+            job.results = [None] * len(job.items)
+        job.seconds = time.perf_counter() - start
+        job.done.set()
+        self.slots.release()
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """
+
+        Returns:
+            Verification counters and throughput per lane.
+        """
+        checked = self.consensus_verified + self.consensus_rejected
+        return {
+            "consensus": {
+                "verified": self.consensus_verified,
+                "rejected": self.consensus_rejected,
+                "verify_seconds": self.consensus_seconds,
+                "throughput": (
+                    checked / self.consensus_seconds if self.consensus_seconds else 0.0
+                ),
+            },
+            "client": self.batch_verifier.metrics(),
+        }
+
+    def close(self) -> None:
+        """
+
+        Returns:
+
+        """
+        if self.executor is None:
+            return
+        self.pending.put((-1, -1, None))
+        self.dispatcher.join()
+        self.executor.shutdown()
+        self.executor = None
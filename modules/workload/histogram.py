@@ -0,0 +1,144 @@
+"""
+HDR-style latency histogram.
+
+Values are recorded into log-linear buckets: every power of two range is
+split into ``2 ** sub_bucket_bits`` equal sub-buckets, so the value reported
+for any recorded sample is within ``2 ** -sub_bucket_bits`` of it, whatever
+its magnitude. With the default of 11 bits (three significant digits), a
+microsecond histogram covering an hour needs a few thousand counters.
+"""
+
+from typing import Dict, Iterator, Optional, Tuple
+
+
+class LatencyHistogram:
+    def __init__(self, sub_bucket_bits: Optional[int] = 11) -> None:
+        """
+
+        Args:
+            sub_bucket_bits: Precision in bits, 11 keeps three significant
+                decimal digits.
+        """
+        self.sub_bucket_bits = sub_bucket_bits
+        # (bucket, sub-bucket) -> number of samples
+        self.counts: Dict[Tuple[int, int], int] = {}
+        self.total = 0
+        self.sum = 0
+        self.min: Optional[int] = None
+        self.max: Optional[int] = None
+
+    def __len__(self) -> int:
+        return self.total
+
+    def _index(self, value: int) -> Tuple[int, int]:
+        bucket = max(0, value.bit_length() - self.sub_bucket_bits)
+        return bucket, value >> bucket
+
+    @staticmethod
+    def _highest_equivalent(bucket: int, sub_bucket: int) -> int:
+        return ((sub_bucket + 1) << bucket) - 1
+
+    def record(self, value: int, count: Optional[int] = 1) -> None:
+        """
+
+        Args:
+            value: Non-negative sample, for example a latency in microseconds.
+            count: Number of times the value was observed.
+
+        Returns:
+
+        """
+        if value < 0:
+            raise ValueError("Cannot record negative value {}".format(value))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.total += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        """
+
+        Args:
+            other: Histogram of the same precision.
+
+        Returns:
+
+        """
+        if other.sub_bucket_bits != self.sub_bucket_bits:
+            raise ValueError("Cannot merge histograms of different precision")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total += other.total
+        self.sum += other.sum
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def buckets(self) -> Iterator[Tuple[int, int]]:
+        """
+
+        Returns:
+            (highest value of the bucket, count) pairs in increasing order.
+        """
+        for bucket, sub_bucket in sorted(self.counts):
+            yield (
+                self._highest_equivalent(bucket, sub_bucket),
+                self.counts[(bucket, sub_bucket)],
+            )
+
+    def percentile(self, percentile: float) -> Optional[int]:
+        """
+
+        Args:
+            percentile: In [0, 100].
+
+        Returns:
+            The smallest recorded value at or above the percentile, None if
+            the histogram is empty.
+        """
+        if not self.total:
+            return None
+        # Rank of the sample, rounding up so p100 is the maximum
+        rank = max(1, -(-self.total * percentile // 100))
+        seen = 0
+        for value, count in self.buckets():
+            seen += count
+            if seen >= rank:
+                return min(value, self.max)
+        return self.max
+
+    def mean(self) -> Optional[float]:
+        """
+
+        Returns:
+
+        """
+        return self.sum / self.total if self.total else None
+
+    def summary(self, scale: Optional[float] = 1.0) -> Dict[str, Optional[float]]:
+        """
+
+        Args:
+            scale: Factor applied to every value, 1e-3 turns microseconds
+                into milliseconds.
+
+        Returns:
+            Count, min, mean, max and the p50, p90, p99 and p999 values.
+        """
+
+        def scaled(value):
+            return None if value is None else round(value * scale, 3)
+
+        return {
+            "count": self.total,
+            "min": scaled(self.min),
+            "mean": scaled(self.mean()),
+            "p50": scaled(self.percentile(50)),
+            "p90": scaled(self.percentile(90)),
+            "p99": scaled(self.percentile(99)),
+            "p999": scaled(self.percentile(99.9)),
+            "max": scaled(self.max),
+        }
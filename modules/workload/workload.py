@@ -0,0 +1,293 @@
+"""
+Open-loop load generation for clients.
+
+Transactions are scheduled at a fixed rate from the start of the run,
+independently of when earlier ones commit, so a slow system faces a growing
+backlog instead of a slower client (no coordinated omission). A transaction
+whose slot comes up while ``max_outstanding`` are still unconfirmed is not
+sent and counted as dropped. Commands are ``SET <key> <value>`` with keys
+drawn uniformly or from a Zipfian distribution.
+"""
+
+import bisect
+import json
+import random
+from typing import Any, Dict, List, Optional
+
+from modules.workload.histogram import LatencyHistogram
+
+
+class KeyDistribution:
+    UNIFORM = "uniform"
+    ZIPFIAN = "zipfian"
+
+
+class LoadConfig:
+    def __init__(
+        self,
+        rate: float,
+        max_outstanding: int,
+        duration: float,
+        key_distribution: Optional[str] = KeyDistribution.UNIFORM,
+        keys: Optional[int] = 1000,
+        zipf_exponent: Optional[float] = 0.99,
+        payload_size: Optional[int] = 16,
+        drain_timeout: Optional[float] = 2.0,
+        report_path: Optional[str] = None,
+        seed: Optional[int] = 0,
+    ) -> None:
+        """
+
+        Args:
+            rate: Target transactions per second.
+            max_outstanding: Unconfirmed transactions after which scheduled
+                ones are dropped.
+            duration: Seconds to generate load for.
+            key_distribution: One of KeyDistribution.
+            keys: Size of the key space.
+            zipf_exponent: Skew of the Zipfian distribution.
+            payload_size: Length of the value of every SET.
+            drain_timeout: Seconds to wait for outstanding transactions once
+                the load stops.
+            report_path: Where the JSON report is written, ``{}`` is replaced
+                by the client id. Defaults to ``load-report-client-{}.json``.
+            seed: Seed of the key and value choices, combined with the
+                client id.
+        """
+        self.rate = rate
+        self.max_outstanding = max_outstanding
+        self.duration = duration
+        self.key_distribution = key_distribution
+        self.keys = keys
+        self.zipf_exponent = zipf_exponent
+        self.payload_size = payload_size
+        self.drain_timeout = drain_timeout
+        self.report_path = report_path
+        self.seed = seed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+
+class KeyChooser:
+    def __init__(
+        self,
+        distribution: str,
+        keys: int,
+        zipf_exponent: float,
+        rng: random.Random,
+    ) -> None:
+        """
+
+        Args:
+            distribution: One of KeyDistribution.
+            keys:
+            zipf_exponent:
+            rng:
+        """
+        if distribution not in (KeyDistribution.UNIFORM, KeyDistribution.ZIPFIAN):
+            raise ValueError("Unknown key distribution {}".format(distribution))
+        self.distribution = distribution
+        self.keys = keys
+        self.rng = rng
+        self.cdf: List[float] = []
+        if distribution == KeyDistribution.ZIPFIAN:
+            total = 0.0
+            for rank in range(1, keys + 1):
+                total += 1.0 / rank**zipf_exponent
+                self.cdf.append(total)
+            self.cdf = [weight / total for weight in self.cdf]
+
+    def next(self) -> int:
+        """
+
+        Returns:
+            Index of the next key, 0 is the most popular Zipfian key.
+        """
+        if self.distribution == KeyDistribution.UNIFORM:
+            return self.rng.randrange(self.keys)
+        return min(bisect.bisect_left(self.cdf, self.rng.random()), self.keys - 1)
+
+
+class LoadGenerator:
+    def __init__(self, config: LoadConfig, client_id: int) -> None:
+        """
+
+        Args:
+            config:
+            client_id:
+        """
+        self.config = config
+        self.client_id = client_id
+        self.rng = random.Random("{}-{}".format(config.seed, client_id))
+        self.key_chooser = KeyChooser(
+            config.key_distribution, config.keys, config.zipf_exponent, self.rng
+        )
+        self.histogram = LatencyHistogram()
+        # Transaction id -> submit time in milliseconds
+        self.outstanding: Dict[str, float] = {}
+        self.start_time: Optional[float] = None
+        self.scheduled = 0
+        self.sent = 0
+        self.dropped = 0
+        self.committed = 0
+
+    def start(self, now: float) -> None:
+        """
+
+        Args:
+            now: Time in milliseconds.
+
+        Returns:
+
+        """
+        self.start_time = now
+
+    def next_command(self) -> str:
+        """
+
+        Returns:
+            The command of the next transaction.
+        """
+        value = "".join(
+            self.rng.choice("abcdefghijklmnopqrstuvwxyz")
+            for _ in range(self.config.payload_size)
+        )
+        return "SET key{} {}".format(self.key_chooser.next(), value)
+
+    def due(self, now: float) -> int:
+        """Advance the schedule to now.
+
+        Args:
+            now: Time in milliseconds.
+
+        Returns:
+            Number of transactions to send now, dropped slots excluded.
+        """
+        elapsed = min(now - self.start_time, self.config.duration * 1000)
+        target = int(elapsed * self.config.rate / 1000)
+        send = 0
+        while self.scheduled < target:
+            self.scheduled += 1
+            if len(self.outstanding) + send >= self.config.max_outstanding:
+                self.dropped += 1
+            else:
+                send += 1
+        return send
+
+    def next_send_delay(self, now: float) -> float:
+        """
+
+        Args:
+            now: Time in milliseconds.
+
+        Returns:
+            Seconds until the next scheduled transaction, or until the drain
+            timeout once the load has stopped.
+        """
+        if self.finished_sending(now):
+            drain_end = (
+                self.start_time
+                + (self.config.duration + self.config.drain_timeout) * 1000
+            )
+            return max(0, (drain_end - now) / 1000)
+        next_slot = self.start_time + (self.scheduled + 1) * 1000 / self.config.rate
+        return max(0, (next_slot - now) / 1000)
+
+    def finished_sending(self, now: float) -> bool:
+        """
+
+        Args:
+            now: Time in milliseconds.
+
+        Returns:
+
+        """
+        return now - self.start_time >= self.config.duration * 1000
+
+    def done(self, now: float) -> bool:
+        """
+
+        Args:
+            now: Time in milliseconds.
+
+        Returns:
+            True once the load has stopped and every transaction is confirmed
+            or the drain timeout has passed.
+        """
+        if not self.finished_sending(now):
+            return False
+        if not self.outstanding:
+            return True
+        elapsed = now - self.start_time
+        return elapsed >= (self.config.duration + self.config.drain_timeout) * 1000
+
+    def on_sent(self, trx_id: str, now: float) -> None:
+        """
+
+        Args:
+            trx_id:
+            now: Time in milliseconds.
+
+        Returns:
+
+        """
+        self.outstanding[trx_id] = now
+        self.sent += 1
+
+    def on_committed(self, trx_id: str, now: float) -> None:
+        """
+
+        Args:
+            trx_id:
+            now: Time in milliseconds.
+
+        Returns:
+
+        """
+        submitted = self.outstanding.pop(trx_id, None)
+        if submitted is None:
+            return
+        self.committed += 1
+        self.histogram.record(max(0, int((now - submitted) * 1000)))
+
+    def report(self, now: float) -> Dict[str, Any]:
+        """
+
+        Args:
+            now: Time in milliseconds.
+
+        Returns:
+            Submit to commit latencies in milliseconds and the achieved
+            throughput in transactions per second.
+        """
+        elapsed = (now - self.start_time) / 1000 if self.start_time else 0
+        return {
+            "client_id": self.client_id,
+            "config": self.config.to_dict(),
+            "elapsed_s": round(elapsed, 3),
+            "scheduled": self.scheduled,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "committed": self.committed,
+            "unconfirmed": len(self.outstanding),
+            "offered_tps": round(self.sent / elapsed, 3) if elapsed else 0,
+            "throughput_tps": round(self.committed / elapsed, 3) if elapsed else 0,
+            "latency_ms": self.histogram.summary(scale=1e-3),
+        }
+
+    def write_report(self, now: float) -> str:
+        """
+
+        Args:
+            now: Time in milliseconds.
+
+        Returns:
+            Path of the JSON report.
+        """
+        path = (self.config.report_path or "load-report-client-{}.json").format(
+            self.client_id
+        )
+        with open(path, "w") as report_file:
+            json.dump(self.report(now), report_file, indent=4)
+        return path
@@ -1,5 +1,5 @@
 #!/bin/bash
-rm ledger-pid-*
+rm -rf ledger-pid-*
 python -m da --message-buffer-size 1000000 modules/fault_injection/fault_injection.da
 python -m da --message-buffer-size 1000000 client.da
 python -m da --message-buffer-size 1000000 validator.da